@@ -0,0 +1,48 @@
+"""
+Compares the threaded APIFetch with AsyncAPIFetch against the local mock API.
+
+Usage: `python -m benchmarks.bench_fetch --rounds 500 --latency 0.1`
+"""
+import argparse
+import time
+from para_stats.api_fetch import APIFetch
+from para_stats.async_api_fetch import AsyncAPIFetch
+from .mock_api import MockAPIServer
+
+
+def bench(name: str, fetcher, round_id_list: list[int]) -> None:
+    start = time.perf_counter()
+    playercount_list, raw_blackbox_list = fetcher.fetch_round_data_bulk(round_id_list)
+    elapsed = time.perf_counter() - start
+
+    requests_made = len(playercount_list) + len(raw_blackbox_list)
+
+    print(
+        f"{name:<10}{len(round_id_list):>8} rounds{elapsed:>10.2f} sec"
+        f"{len(round_id_list) / elapsed:>12.1f} rounds/sec{requests_made / elapsed:>12.1f} req/sec"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rounds", type=int, default=500)
+    parser.add_argument("--latency", type=float, default=0.1, help="seconds the mock server waits before each response")
+    parser.add_argument("--threads", type=int, default=10, help="max_connections for APIFetch")
+    parser.add_argument("--in-flight", type=int, default=200, help="max_connections for AsyncAPIFetch")
+    parser.add_argument("--num-keys", type=int, default=150, help="blackbox keys per round")
+    args = parser.parse_args()
+
+    round_id_list = list(range(1, args.rounds + 1))
+
+    with MockAPIServer(latency=args.latency, head_round_id=args.rounds, num_keys=args.num_keys) as server:
+        print(f"mock API at {server.url}, {args.latency * 1000:.0f} ms latency")
+
+        bench("threaded", APIFetch(server.url, max_connections=args.threads), round_id_list)
+
+        async_fetcher = AsyncAPIFetch(server.url, max_connections=args.in_flight)
+        bench("async", async_fetcher, round_id_list)
+        async_fetcher.close()
+
+
+if __name__ == "__main__":
+    main()
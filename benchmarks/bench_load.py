@@ -0,0 +1,74 @@
+"""
+Compares the DatabaseLoader upload paths (chunked INSERT vs COPY + merge vs pooled parallel upserts) in rows/sec.
+
+Loads synthetic rounds into a scratch schema, never the configured ODS schema, so it is safe to point at any database
+SQLALCHEMY_DB_URI can reach. Each method is run three times: into an empty table, again with identical rows, which the
+content hash check skips, and as a pure update of every row.
+
+Usage: `python -m benchmarks.bench_load --rounds 5000 --num-keys 150`
+"""
+import argparse
+import os
+import time
+
+BENCH_SCHEMA = "para_stats_bench"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rounds", type=int, default=5000)
+    parser.add_argument("--num-keys", type=int, default=150, help="blackbox keys per round, drives the size of stats")
+    parser.add_argument("--methods", nargs="+", default=["insert", "copy", "pool"])
+    parser.add_argument("--pool-size", type=int, default=4, help="connections of the pool method")
+    args = parser.parse_args()
+
+    # Config is read at import time, so redirect every table into the scratch schema first
+    os.environ["SQLALCHEMY_ODS_SCHEMA"] = BENCH_SCHEMA
+    # the scratch schema is dropped after every run, so a cached schema check would point at tables that are gone
+    os.environ["PARA_STATS_SCHEMA_CACHE"] = ""
+
+    from sqlalchemy import create_engine, text
+    from config import Config
+    from para_stats.transform import TransformData
+    from .mock_api import synthetic_blackbox, synthetic_metadata, synthetic_playercounts
+
+    with create_engine(Config.db_uri).begin() as connection:
+        connection.execute(text(f"CREATE SCHEMA IF NOT EXISTS {BENCH_SCHEMA}"))
+
+    from para_stats.db import DatabaseLoader
+    from para_stats.models import round_table
+
+    loader = DatabaseLoader(Config, pool_size=args.pool_size)
+
+    print(f"building {args.rounds} synthetic rounds...")
+    round_id_list = list(range(1, args.rounds + 1))
+    rounds = TransformData().collect_round_batch(
+        [synthetic_metadata(round_id) for round_id in round_id_list],
+        [synthetic_playercounts(round_id) for round_id in round_id_list],
+        [synthetic_blackbox(round_id, args.num_keys) for round_id in round_id_list],
+    )
+
+    for method in args.methods:
+        with loader.engine.begin() as connection:
+            connection.execute(text(f"TRUNCATE {round_table.fullname}"))
+
+        for phase in ("insert", "unchanged", "update"):
+            if phase == "update":
+                for entry in rounds:
+                    entry["end_state"] = f"{method} update"
+                    entry["content_hash"] = TransformData.content_hash(entry)
+
+            start = time.perf_counter()
+            loader.db_upload_rounds(rounds, method=method)
+            elapsed = time.perf_counter() - start
+
+            print(f"{method:<8}{phase:<10}{len(rounds):>8} rows{elapsed:>10.2f} sec{len(rounds) / elapsed:>12.0f} rows/sec")
+
+    loader.db_close_pool()
+
+    with loader.engine.begin() as connection:
+        connection.execute(text(f"DROP SCHEMA {BENCH_SCHEMA} CASCADE"))
+
+
+if __name__ == "__main__":
+    main()
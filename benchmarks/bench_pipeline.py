@@ -0,0 +1,218 @@
+"""
+End-to-end benchmark of the `init_script` stages against the local mock API and a local Postgres.
+
+Runs the roundlist sync, fetch, transform and load stages one after another so each is measured on its own, then the
+streaming pipeline that overlaps them. Reports rounds/sec, p50/p99 latency and peak RSS per stage. Latency is per
+HTTP request for the stages that talk to the API and per batch for the others. Peak RSS is sampled from
+/proc/self/statm while the stage runs, so it includes whatever earlier stages still hold.
+
+Writes into a scratch schema, never the configured ODS schema, so it is safe to point at any database SQLALCHEMY_DB_URI can reach.
+
+Usage: `python -m benchmarks.bench_pipeline --rounds 1000 --latency 0.05 --rate-limit 3000`
+"""
+import argparse
+import math
+import os
+import resource
+import threading
+import time
+from collections import Counter
+
+BENCH_SCHEMA = "para_stats_bench"
+
+
+class PeakRSS:
+    def __init__(self, interval: float = 0.01) -> None:
+        """Samples the resident set size of this process in a background thread and keeps the peak.
+
+        ru_maxrss only ever reports the peak of the whole process, so it can't tell stages apart.
+
+        Args:
+            interval (float, optional): Seconds between samples. Defaults to 0.01.
+        """
+        self.INTERVAL = interval
+        self.peak = 0
+        self._page_size = os.sysconf("SC_PAGE_SIZE")
+        self._stop = threading.Event()
+        self._thread = None
+
+    def sample(self) -> int:
+        try:
+            with open("/proc/self/statm") as f:
+                return int(f.read().split()[1]) * self._page_size
+        except OSError:
+            # no procfs, fall back to the process-wide peak (KiB on Linux)
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.INTERVAL):
+            self.peak = max(self.peak, self.sample())
+
+    def __enter__(self) -> "PeakRSS":
+        self.peak = self.sample()
+        self._thread = threading.Thread(target=self._run, name="peak-rss", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self.sample())
+
+
+def percentile(values: list[float], q: float) -> float:
+    """Nearest-rank percentile, NaN for an empty list"""
+    if not values:
+        return float("nan")
+
+    ordered = sorted(values)
+    return ordered[max(math.ceil(q / 100 * len(ordered)), 1) - 1]
+
+
+def report(stage: str, rounds: int, elapsed: float, latencies: list[float], peak_rss: int, statuses: Counter) -> None:
+    print(
+        f"{stage:<12}{rounds:>8}{elapsed:>10.2f}{rounds / elapsed:>12.1f}"
+        f"{percentile(latencies, 50) * 1000:>10.1f}{percentile(latencies, 99) * 1000:>10.1f}"
+        f"{peak_rss / 2**20:>12.1f}{statuses[429]:>8}"
+    )
+
+
+def batched(items: list, batch_size: int):
+    for i in range(0, len(items), batch_size):
+        yield items[i : i + batch_size]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rounds", type=int, default=1000)
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds the mock server waits before each response")
+    parser.add_argument("--num-keys", type=int, default=150, help="blackbox keys per synthetic round, the knob for payload size")
+    parser.add_argument("--rate-limit", type=int, default=0, help="mock server requests per window before it answers 429, 0 for no limit")
+    parser.add_argument("--rate-window", type=float, default=60.0)
+    parser.add_argument("--fixtures-dir", help="response cache to serve recorded responses from")
+    args = parser.parse_args()
+
+    # Config is read at import time, so redirect every table into the scratch schema first
+    os.environ["SQLALCHEMY_ODS_SCHEMA"] = BENCH_SCHEMA
+    # the scratch schema is dropped after every run, so a cached schema check would point at tables that are gone
+    os.environ["PARA_STATS_SCHEMA_CACHE"] = ""
+
+    from sqlalchemy import create_engine, text
+    from config import Config
+
+    with create_engine(Config.db_uri).begin() as connection:
+        connection.execute(text(f"DROP SCHEMA IF EXISTS {BENCH_SCHEMA} CASCADE"))
+        connection.execute(text(f"CREATE SCHEMA {BENCH_SCHEMA}"))
+
+    from para_stats import ETLInterface
+    from para_stats.models import round_table, sync_state_table
+    from .mock_api import MockAPIServer
+
+    server = MockAPIServer(
+        latency=args.latency,
+        head_round_id=args.rounds,
+        num_keys=args.num_keys,
+        rate_limit=args.rate_limit,
+        rate_window=args.rate_window,
+        fixtures_dir=args.fixtures_dir,
+    )
+
+    with server:
+        print(f"mock API at {server.url}, {args.latency * 1000:.0f} ms latency, rate limit {args.rate_limit or 'off'}")
+
+        interface = ETLInterface(server.url, cache_dir=None, offline=False)
+        fetcher, transformer, db = interface._fetcher, interface._transformer, interface._db
+
+        request_latencies = []
+        statuses = Counter()
+
+        def record_response(response, *hook_args, **hook_kwargs):
+            request_latencies.append(response.elapsed.total_seconds())
+            statuses[response.status_code] += 1
+
+        fetcher._session.hooks["response"].append(record_response)
+
+        def stage(name: str, func, latencies: list[float] | None = None):
+            request_latencies.clear()
+            statuses.clear()
+
+            with PeakRSS() as rss:
+                start = time.perf_counter()
+                rounds, result = func()
+                elapsed = time.perf_counter() - start
+
+            report(name, rounds, elapsed, request_latencies if latencies is None else latencies, rss.peak, statuses)
+            return result
+
+        print(f"{'stage':<12}{'rounds':>8}{'sec':>10}{'rounds/sec':>12}{'p50 ms':>10}{'p99 ms':>10}{'peak MiB':>12}{'429s':>8}")
+
+        def sync_roundlist():
+            metadata_list = interface.update_metadata()
+            interface.load_metadata(metadata_list)
+            return len(metadata_list), None
+
+        stage("roundlist", sync_roundlist)
+
+        metadata_list = db.db_fetch_metadata_difference()
+        metadata_batches = list(batched(metadata_list, args.batch_size))
+
+        def fetch():
+            fetched_batches = []
+
+            for metadata_batch in metadata_batches:
+                failures = {}
+                playercount_list, raw_blackbox_list = fetcher.fetch_round_data_bulk(
+                    [entry["round_id"] for entry in metadata_batch], failures=failures
+                )
+                fetched_batches.append((metadata_batch, playercount_list, raw_blackbox_list, failures))
+
+            return len(metadata_list), fetched_batches
+
+        fetched_batches = stage("fetch", fetch)
+
+        transform_latencies = []
+
+        def transform():
+            collected_batches = []
+
+            for metadata_batch, playercount_list, raw_blackbox_list, failures in fetched_batches:
+                batch_start = time.perf_counter()
+                collected_batches.append(
+                    transformer.collect_round_batch(metadata_batch, playercount_list, raw_blackbox_list, failures=failures)
+                )
+                transform_latencies.append(time.perf_counter() - batch_start)
+
+            return sum(map(len, collected_batches)), collected_batches
+
+        collected_batches = stage("transform", transform, transform_latencies)
+        del fetched_batches
+
+        load_latencies = []
+
+        def load():
+            for collected_round_list in collected_batches:
+                batch_start = time.perf_counter()
+                db.db_upload_rounds(collected_round_list)
+                load_latencies.append(time.perf_counter() - batch_start)
+
+            return sum(map(len, collected_batches)), None
+
+        stage("load", load, load_latencies)
+        del collected_batches
+
+        # start the overlapped run from an empty rounds table and no watermarks
+        with db.engine.begin() as connection:
+            connection.execute(text(f"TRUNCATE {round_table.fullname}"))
+            connection.execute(text(f"TRUNCATE {sync_state_table.fullname}"))
+
+        stage("pipeline", lambda: (interface.stream_missing_round_data(batch_size=args.batch_size), None))
+
+        transformer.close()
+
+    with db.engine.begin() as connection:
+        connection.execute(text(f"DROP SCHEMA {BENCH_SCHEMA} CASCADE"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""
+Compares playercount storage as raw JSONB against the compact form (start, interval, int16 deltas as bytea).
+
+Reports on-disk size including TOAST, the time to encode, a server-side scan that detoasts every series and the
+time to read every series back into NumPy arrays. Series come from synthetic rounds, or with --source-table from
+an already loaded rounds table, ex: the ODS of a real backfill. The source is only read, both layouts are written
+to narrow tables in a scratch schema, so it is safe to point at any database SQLALCHEMY_DB_URI can reach.
+
+Usage: `python -m benchmarks.bench_playercounts --rounds 5000` or `--source-table ods.rounds`
+"""
+import argparse
+import time
+from datetime import datetime
+
+BENCH_SCHEMA = "para_stats_bench"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rounds", type=int, default=5000, help="rounds to build, or at most to read from --source-table")
+    parser.add_argument("--source-table", help="schema-qualified rounds table to read JSONB playercounts from")
+    args = parser.parse_args()
+
+    import numpy as np
+    from sqlalchemy import Column, Integer, LargeBinary, MetaData, Table, create_engine, insert, select, text
+    from sqlalchemy.dialects.postgresql import JSONB
+    from sqlalchemy.types import DateTime
+    from config import Config
+    from para_stats.transform import TransformData
+    from .mock_api import synthetic_playercounts
+
+    engine = create_engine(Config.db_uri)
+
+    if args.source_table:
+        with engine.connect() as connection:
+            series = dict(
+                connection.execute(
+                    text(
+                        f"SELECT round_id, playercounts FROM {args.source_table} "
+                        f"WHERE jsonb_typeof(playercounts) = 'object' ORDER BY round_id DESC LIMIT :limit"
+                    ),
+                    {"limit": args.rounds},
+                ).fetchall()
+            )
+    else:
+        series = {round_id: synthetic_playercounts(round_id) for round_id in range(1, args.rounds + 1)}
+
+    bench_metadata = MetaData(schema=BENCH_SCHEMA)
+    json_table = Table(
+        "playercounts_json", bench_metadata, Column("round_id", Integer, primary_key=True), Column("playercounts", JSONB)
+    )
+    compact_table = Table(
+        "playercounts_compact",
+        bench_metadata,
+        Column("round_id", Integer, primary_key=True),
+        Column("playercount_start", DateTime(timezone=True)),
+        Column("playercount_interval", Integer),
+        Column("playercount_deltas", LargeBinary),
+    )
+
+    with engine.begin() as connection:
+        connection.execute(text(f"DROP SCHEMA IF EXISTS {BENCH_SCHEMA} CASCADE"))
+        connection.execute(text(f"CREATE SCHEMA {BENCH_SCHEMA}"))
+
+    bench_metadata.create_all(engine)
+
+    start = time.perf_counter()
+    compact = {round_id: TransformData.compact_playercounts(playercounts) for round_id, playercounts in series.items()}
+    encode_elapsed = time.perf_counter() - start
+
+    # uneven series stay JSONB in the real table too, so they're left out of both sides
+    compact = {round_id: packed for round_id, packed in compact.items() if packed is not None}
+    samples = sum(len(series[round_id]) for round_id in compact)
+
+    print(f"{len(compact)} of {len(series)} rounds compactable, {samples} samples, encoded in {encode_elapsed:.2f} sec")
+
+    with engine.begin() as connection:
+        connection.execute(
+            insert(json_table), [{"round_id": round_id, "playercounts": series[round_id]} for round_id in compact]
+        )
+        connection.execute(
+            insert(compact_table),
+            [
+                {"round_id": round_id, "playercount_start": start, "playercount_interval": interval, "playercount_deltas": deltas}
+                for round_id, (start, interval, deltas) in compact.items()
+            ],
+        )
+
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        connection.execute(text(f"VACUUM ANALYZE {json_table.fullname}, {compact_table.fullname}"))
+
+    def read_json() -> int:
+        with engine.connect() as connection:
+            for (playercounts,) in connection.execute(select(json_table.c["playercounts"])):
+                # what a reader of the JSONB has to do to get the same arrays
+                timestamps = np.array(
+                    [datetime.fromisoformat(timestamp).replace(tzinfo=None) for timestamp in playercounts], dtype="datetime64[s]"
+                )
+                counts = np.fromiter(playercounts.values(), dtype=np.int32, count=len(playercounts))
+        return len(compact)
+
+    def read_compact() -> int:
+        with engine.connect() as connection:
+            for row in connection.execute(select(*list(compact_table.c)[1:])):
+                timestamps, counts = TransformData.expand_playercounts(*row)
+        return len(compact)
+
+    layouts = {
+        # both expressions have to detoast the whole value
+        "json": (json_table, "length(jsonb_typeof(playercounts))", read_json),
+        "compact": (compact_table, "get_byte(playercount_deltas, 0)", read_compact),
+    }
+
+    print(f"{'layout':<10}{'size KiB':>12}{'B/round':>10}{'B/sample':>10}{'scan ms':>10}{'read sec':>10}{'rounds/sec':>12}")
+
+    for name, (table, detoast, read) in layouts.items():
+        with engine.connect() as connection:
+            size = connection.execute(text(f"SELECT pg_total_relation_size('{table.fullname}')")).scalar()
+
+            start = time.perf_counter()
+            connection.execute(text(f"SELECT sum({detoast}) FROM {table.fullname}")).scalar()
+            scan_elapsed = time.perf_counter() - start
+
+        start = time.perf_counter()
+        rounds = read()
+        read_elapsed = time.perf_counter() - start
+
+        print(
+            f"{name:<10}{size / 1024:>12.0f}{size / rounds:>10.0f}{size / samples:>10.1f}"
+            f"{scan_elapsed * 1000:>10.1f}{read_elapsed:>10.2f}{rounds / read_elapsed:>12.0f}"
+        )
+
+    with engine.begin() as connection:
+        connection.execute(text(f"DROP SCHEMA {BENCH_SCHEMA} CASCADE"))
+
+
+if __name__ == "__main__":
+    main()
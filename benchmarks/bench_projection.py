@@ -0,0 +1,101 @@
+"""
+Compares a full blackbox transform against one projected to a subset of its keys.
+
+Reports the time to clean the blackbox responses (the raw_data decode is most of it), to collect whole round rows
+(cleaning plus playercounts and the content hash), the size of the stats JSON sent per round, the time to upload
+the rows and the size of the loaded rounds table including TOAST and the GIN index on stats. The kept keys are
+spread evenly over the synthetic ones, so every key_type is represented. Loads into a scratch schema, never the
+configured ODS schema, so it is safe to point at any database SQLALCHEMY_DB_URI can reach.
+
+Usage: `python -m benchmarks.bench_projection --rounds 2000 --num-keys 300 --keep 30`
+"""
+import argparse
+import json
+import os
+import time
+
+BENCH_SCHEMA = "para_stats_bench"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rounds", type=int, default=2000)
+    parser.add_argument("--num-keys", type=int, default=300, help="blackbox keys per round")
+    parser.add_argument("--keep", type=int, default=30, help="keys kept by the projection")
+    parser.add_argument("--method", default="copy", help="load method of the upload")
+    args = parser.parse_args()
+
+    # Config is read at import time, so redirect every table into the scratch schema first
+    os.environ["SQLALCHEMY_ODS_SCHEMA"] = BENCH_SCHEMA
+    # the scratch schema is dropped after every run, so a cached schema check would point at tables that are gone
+    os.environ["PARA_STATS_SCHEMA_CACHE"] = ""
+
+    from sqlalchemy import create_engine, text
+    from config import Config
+    from para_stats.transform import TransformData
+    from .mock_api import synthetic_blackbox, synthetic_metadata, synthetic_playercounts
+
+    with create_engine(Config.db_uri).begin() as connection:
+        connection.execute(text(f"DROP SCHEMA IF EXISTS {BENCH_SCHEMA} CASCADE"))
+        connection.execute(text(f"CREATE SCHEMA {BENCH_SCHEMA}"))
+
+    from para_stats.db import DatabaseLoader
+    from para_stats.models import round_table
+
+    loader = DatabaseLoader(Config)
+
+    print(f"building {args.rounds} synthetic rounds with {args.num_keys} keys...")
+    round_id_list = list(range(1, args.rounds + 1))
+    playercount_list = [synthetic_playercounts(round_id) for round_id in round_id_list]
+    raw_blackbox_list = [synthetic_blackbox(round_id, args.num_keys) for round_id in round_id_list]
+
+    key_names = [entry["key_name"] for entry in raw_blackbox_list[0]]
+    step = max(len(key_names) // max(args.keep, 1), 1)
+    kept_keys = key_names[::step][: args.keep]
+
+    variants = {
+        "all": TransformData(),
+        "projected": TransformData(keys=kept_keys),
+    }
+
+    print(
+        f"{'variant':<11}{'keys':>6}{'clean ms/rnd':>14}{'collect ms/rnd':>16}{'stats B/rnd':>13}"
+        f"{'load sec':>10}{'table KiB':>11}"
+    )
+
+    for name, transformer in variants.items():
+        start = time.perf_counter()
+        cleaned_list = [transformer.clean_blackbox_response(raw_blackbox) for raw_blackbox in raw_blackbox_list]
+        clean_elapsed = time.perf_counter() - start
+
+        metadata_list = [synthetic_metadata(round_id) for round_id in round_id_list]
+
+        start = time.perf_counter()
+        rounds = transformer.collect_round_batch(metadata_list, playercount_list, raw_blackbox_list)
+        collect_elapsed = time.perf_counter() - start
+
+        stats_bytes = sum(len(json.dumps(entry["stats"])) for entry in rounds)
+
+        with loader.engine.begin() as connection:
+            connection.execute(text(f"TRUNCATE {round_table.fullname}"))
+
+        start = time.perf_counter()
+        loader.db_upload_rounds(rounds, method=args.method)
+        load_elapsed = time.perf_counter() - start
+
+        with loader.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+            connection.execute(text(f"VACUUM ANALYZE {round_table.fullname}"))
+            size = connection.execute(text(f"SELECT pg_total_relation_size('{round_table.fullname}')")).scalar()
+
+        print(
+            f"{name:<11}{len(cleaned_list[0]):>6}{clean_elapsed / args.rounds * 1000:>14.3f}"
+            f"{collect_elapsed / args.rounds * 1000:>16.3f}{stats_bytes / args.rounds:>13.0f}"
+            f"{load_elapsed:>10.2f}{size / 1024:>11.0f}"
+        )
+
+    with loader.engine.begin() as connection:
+        connection.execute(text(f"DROP SCHEMA {BENCH_SCHEMA} CASCADE"))
+
+
+if __name__ == "__main__":
+    main()
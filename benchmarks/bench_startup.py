@@ -0,0 +1,167 @@
+"""
+Measures how fast the CLI gets going, each sample in a fresh interpreter:
+
+    import          `import para_stats`
+    help            `run --help` to exit
+    first request   `run` to the moment its first API request arrives
+    noop cold       a whole `run` with nothing new to load, without a cached schema check
+    noop warm       the same with the schema fingerprint cached by an earlier run
+
+`run` is the installed console script (`poetry install` or `pip install -e .`), so the samples include the wrapper
+users actually start. The first request is timed against a listener in this process, everything else against the local
+mock API. Writes into a scratch schema, never the configured ODS schema, so it is safe to point at any database
+SQLALCHEMY_DB_URI can reach.
+
+Usage: `python -m benchmarks.bench_startup --runs 10`
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import sysconfig
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BENCH_SCHEMA = "para_stats_bench"
+HEAD_ROUND_ID = 20
+
+
+class FirstRequestServer(ThreadingHTTPServer):
+    def __init__(self) -> None:
+        """Local API stand-in that records when its first request arrives, on this process' perf_counter clock"""
+        from .mock_api import synthetic_metadata
+
+        server = self
+        self.first_request_at = None
+        self._arrived = threading.Event()
+        body = json.dumps([synthetic_metadata(HEAD_ROUND_ID)]).encode()
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args) -> None:
+                pass
+
+            def do_GET(self) -> None:
+                if server.first_request_at is None:
+                    server.first_request_at = time.perf_counter()
+                    server._arrived.set()
+
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        super().__init__(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server_address[1]}/stats"
+
+    def handle_error(self, request, client_address) -> None:
+        # the client is killed as soon as its first request is in, so broken pipes are expected
+        pass
+
+    def wait(self, timeout: float) -> float | None:
+        """Waits for the next first request and returns its perf_counter time, then re-arms"""
+        self._arrived.wait(timeout)
+        arrived_at = self.first_request_at
+        self.first_request_at = None
+        self._arrived.clear()
+        return arrived_at
+
+
+def find_console_script(name: str = "run") -> str:
+    """Path of the installed console script, next to the running interpreter so no shell shim is timed along"""
+    path = os.path.join(sysconfig.get_path("scripts"), name)
+
+    if not os.path.exists(path):
+        raise SystemExit(f"console script `{name}` is not installed, run `poetry install` or `pip install -e .` first")
+
+    return path
+
+
+def run_to_exit(command: list[str], env: dict) -> float:
+    start = time.perf_counter()
+    subprocess.run(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+def run_to_first_request(command: list[str], env: dict, server: FirstRequestServer) -> float:
+    start = time.perf_counter()
+    process = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    try:
+        arrived_at = server.wait(timeout=30)
+    finally:
+        process.kill()
+        process.wait()
+
+    return arrived_at - start if arrived_at is not None else float("nan")
+
+
+def report(stage: str, samples: list[float]) -> None:
+    print(f"{stage:<16}{statistics.median(samples) * 1000:>10.0f}{min(samples) * 1000:>10.0f}{max(samples) * 1000:>10.0f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=10, help="samples per stage")
+    args = parser.parse_args()
+
+    os.environ["SQLALCHEMY_ODS_SCHEMA"] = BENCH_SCHEMA
+
+    from sqlalchemy import create_engine, text
+    from config import Config
+    from .mock_api import MockAPIServer
+
+    engine = create_engine(Config.db_uri)
+
+    with engine.begin() as connection:
+        connection.execute(text(f"DROP SCHEMA IF EXISTS {BENCH_SCHEMA} CASCADE"))
+        connection.execute(text(f"CREATE SCHEMA {BENCH_SCHEMA}"))
+
+    python = sys.executable
+    run = find_console_script()
+    env = dict(os.environ)
+
+    with tempfile.TemporaryDirectory() as tmp_dir, MockAPIServer(latency=0, head_round_id=HEAD_ROUND_ID, num_keys=10) as mock:
+        warm_cache = os.path.join(tmp_dir, "schema.json")
+        env["PARA_STATS_SCHEMA_CACHE"] = warm_cache
+        env["PARA_STATS_API_URL"] = mock.url
+
+        # the first sync loads every round, so the measured runs find nothing to do
+        run_to_exit([run], env)
+
+        print(f"{'stage':<16}{'median ms':>10}{'min ms':>10}{'max ms':>10}")
+
+        report("import", [run_to_exit([python, "-c", "import para_stats"], env) for _ in range(args.runs)])
+        report("help", [run_to_exit([run, "--help"], env) for _ in range(args.runs)])
+
+        server = FirstRequestServer()
+        threading.Thread(target=server.serve_forever, name="first-request", daemon=True).start()
+
+        report(
+            "first request",
+            [
+                run_to_first_request([run], {**env, "PARA_STATS_API_URL": server.url}, server)
+                for _ in range(args.runs)
+            ],
+        )
+
+        server.shutdown()
+
+        cold_samples = []
+
+        for i in range(args.runs):
+            cold_samples.append(run_to_exit([run], {**env, "PARA_STATS_SCHEMA_CACHE": os.path.join(tmp_dir, f"cold-{i}.json")}))
+
+        report("noop cold", cold_samples)
+        report("noop warm", [run_to_exit([run], env) for _ in range(args.runs)])
+
+    with engine.begin() as connection:
+        connection.execute(text(f"DROP SCHEMA {BENCH_SCHEMA} CASCADE"))
+
+
+if __name__ == "__main__":
+    main()
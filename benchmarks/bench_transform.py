@@ -0,0 +1,71 @@
+"""
+Micro-benchmark of blackbox cleaning: JSON decoders and process pool sizes, reported in rounds/sec and rounds/sec per core.
+
+Uses blackbox responses recorded in a response cache when `--cache-dir` is given, synthetic ones otherwise.
+
+Usage: `python -m benchmarks.bench_transform --cache-dir ~/.cache/para-stats --processes 1 2 4 8`
+"""
+import argparse
+import json
+import time
+import para_stats.transform as transform
+from para_stats.cache import ResponseCache
+from para_stats.transform import TransformData
+from .mock_api import synthetic_blackbox
+
+
+def load_fixtures(cache_dir: str | None, rounds: int, num_keys: int) -> list:
+    if cache_dir is None:
+        return [synthetic_blackbox(round_id, num_keys) for round_id in range(1, rounds + 1)]
+
+    cache = ResponseCache(cache_dir)
+    endpoints = cache.endpoints("/blackbox/")[:rounds]
+
+    return [json.loads(cache.get(endpoint, ignore_ttl=True)) for endpoint in endpoints]
+
+
+def bench(name: str, transformer: TransformData, raw_blackbox_list: list, cores: int) -> None:
+    # warm up, so pool start-up isn't counted
+    transformer._clean_blackbox_list(raw_blackbox_list[: transformer.CHUNKSIZE * transformer.PROCESSES + 1])
+
+    start = time.perf_counter()
+    transformer._clean_blackbox_list(raw_blackbox_list)
+    elapsed = time.perf_counter() - start
+
+    rounds_per_sec = len(raw_blackbox_list) / elapsed
+
+    print(f"{name:<24}{elapsed:>10.2f} sec{rounds_per_sec:>12.1f} rounds/sec{rounds_per_sec / cores:>12.1f} rounds/sec/core")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--cache-dir", help="response cache to read recorded blackbox fixtures from")
+    parser.add_argument("--rounds", type=int, default=2000)
+    parser.add_argument("--num-keys", type=int, default=150, help="blackbox keys per synthetic round")
+    parser.add_argument("--processes", type=int, nargs="+", default=[2, 4])
+    parser.add_argument("--chunksize", type=int, default=8)
+    args = parser.parse_args()
+
+    raw_blackbox_list = load_fixtures(args.cache_dir, args.rounds, args.num_keys)
+    print(f"{len(raw_blackbox_list)} blackbox fixtures, {sum(map(len, raw_blackbox_list)) / len(raw_blackbox_list):.0f} keys/round")
+
+    decoders = {"json": json.loads}
+
+    if transform.orjson is not None:
+        decoders["orjson"] = transform.orjson.loads
+
+    for name, decoder in decoders.items():
+        transform.json_loads = decoder
+        bench(f"serial {name}", TransformData(), raw_blackbox_list, 1)
+
+    # pool workers import the module fresh, so they always use the fastest installed decoder
+    transform.json_loads = list(decoders.values())[-1]
+
+    for processes in args.processes:
+        transformer = TransformData(processes=processes, chunksize=args.chunksize)
+        bench(f"{processes} processes {list(decoders)[-1]}", transformer, raw_blackbox_list, processes)
+        transformer.close()
+
+
+if __name__ == "__main__":
+    main()
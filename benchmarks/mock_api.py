@@ -0,0 +1,370 @@
+"""
+Local stand-in for the stats API, serving synthetic rounds so fetchers can be benchmarked without touching api.paradisestation.org.
+
+Responses recorded in a response cache (`--cache-dir` of a real run) can be served instead of synthetic ones with `--fixtures-dir`.
+With `--rate-limit` the server enforces a fixed-window request limit and answers 429 like the real API.
+With `--round-interval` a new round finishes every few seconds, and roundlist pages carry an ETag for conditional requests.
+
+Run standalone with `python -m benchmarks.mock_api --port 8000 --latency 0.05 --rate-limit 600`.
+"""
+import argparse
+import json
+import multiprocessing
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+GAME_MODES = ["extended", "traitor", "changeling", "vampire", "nuclear", "wizard", "cult"]
+MAP_NAMES = ["Cyberiad", "Delta", "MetaStation", "Kerberos", "Emerald"]
+EPOCH = datetime(2024, 1, 1)
+
+
+def synthetic_metadata(round_id: int) -> dict:
+    """Builds one roundlist entry. Seeded by round_id so every request for a round returns the same row."""
+    rng = random.Random(round_id)
+    init = EPOCH + timedelta(minutes=90 * round_id)
+    start = init + timedelta(minutes=5)
+    shutdown = start + timedelta(minutes=rng.randint(30, 150))
+
+    return {
+        "round_id": round_id,
+        "init_datetime": init.isoformat(),
+        "start_datetime": start.isoformat(),
+        "shutdown_datetime": shutdown.isoformat(),
+        "end_datetime": (shutdown + timedelta(seconds=30)).isoformat(),
+        "commit_hash": f"{rng.getrandbits(160):040x}",
+        "game_mode": rng.choice(GAME_MODES),
+        "game_mode_result": rng.choice(["win", "loss", "halfwin"]),
+        "end_state": "proper completion",
+        "map_name": rng.choice(MAP_NAMES),
+        "server_id": rng.choice(["sybil", "terry"]),
+    }
+
+
+def synthetic_playercounts(round_id: int) -> dict:
+    """Builds a playercount series sampled once a minute over the round."""
+    metadata = synthetic_metadata(round_id)
+    rng = random.Random(round_id)
+    start = datetime.fromisoformat(metadata["start_datetime"])
+    end = datetime.fromisoformat(metadata["shutdown_datetime"])
+
+    playercounts = {}
+    count = rng.randint(40, 120)
+    sample = start
+
+    while sample <= end:
+        count = max(0, count + rng.randint(-3, 3))
+        playercounts[sample.isoformat()] = count
+        sample += timedelta(minutes=1)
+
+    return playercounts
+
+
+def synthetic_blackbox(round_id: int, num_keys: int = 150) -> list:
+    """Builds a blackbox response with a mix of every key_type the transformer handles."""
+    rng = random.Random(round_id)
+    blackbox = []
+
+    for i in range(num_keys):
+        key_type = ("tally", "nested tally", "associative", "text", "amount")[i % 5]
+
+        if key_type == "tally":
+            data = {f"item_{j}": rng.randint(0, 50) for j in range(rng.randint(1, 20))}
+        elif key_type == "nested tally":
+            data = {
+                f"group_{j}": {f"item_{k}": rng.randint(0, 50) for k in range(rng.randint(1, 8))}
+                for j in range(rng.randint(1, 5))
+            }
+        elif key_type == "associative":
+            data = {
+                str(j + 1): {"name": f"entry_{j}", "x": str(rng.randint(0, 255)), "y": str(rng.randint(0, 255))}
+                for j in range(rng.randint(1, 6))
+            }
+        elif key_type == "text":
+            data = [f"line {j}" for j in range(rng.randint(1, 4))]
+        else:
+            data = rng.randint(0, 1000)
+
+        blackbox.append(
+            {
+                "key_name": f"{key_type.replace(' ', '_')}_{i}",
+                "key_type": key_type,
+                "version": 1,
+                "raw_data": json.dumps({"data": data}),
+            }
+        )
+
+    blackbox.append(
+        {
+            "key_name": "RND Production list",
+            "key_type": "associative",
+            "version": 1,
+            "raw_data": json.dumps({"data": {"1": {"/list": {"Stock Parts": rng.randint(0, 30)}}}}),
+        }
+    )
+
+    return blackbox
+
+
+class MockAPIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+    def _send_rate_limit_headers(self) -> None:
+        remaining, reset_in = self._rate_limit_state
+        self.send_header("X-Rate-Limit-Remaining", str(remaining))
+
+        if reset_in is not None:
+            self.send_header("X-Rate-Limit-Reset", f"{reset_in:.0f}")
+
+        for name, value in self._extra_headers.items():
+            self.send_header(name, value)
+
+    def _send_body(self, data: bytes) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self._send_rate_limit_headers()
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_json(self, body) -> None:
+        self._send_body(json.dumps(body).encode())
+
+    def _send_status(self, status: int, retry_after: float | None = None) -> None:
+        self.send_response(status)
+        self.send_header("Content-Length", "0")
+        self._send_rate_limit_headers()
+
+        if retry_after is not None:
+            self.send_header("Retry-After", f"{retry_after:.0f}")
+
+        self.end_headers()
+
+    def _send_fixture_or_json(self, endpoint: str, build) -> None:
+        """Serves the recorded response of an endpoint if there is one, otherwise the synthetic one `build` returns"""
+        if self.server.fixtures is not None:
+            content = self.server.fixtures.get(endpoint, ignore_ttl=True)
+
+            if content is not None:
+                self._send_body(content)
+                return
+
+        self._send_json(build())
+
+    def do_GET(self) -> None:
+        server = self.server
+        time.sleep(server.latency)
+
+        allowed, remaining, reset_in = server.take_request()
+        self._rate_limit_state = (remaining, reset_in)
+        self._extra_headers = {}
+        head_round_id = server.head()
+
+        if not allowed:
+            self._send_status(429, retry_after=reset_in)
+            return
+
+        url = urlparse(self.path)
+        parts = url.path.rstrip("/").split("/")
+
+        if parts[-1] == "roundlist":
+            offset = int(parse_qs(url.query).get("offset", ["0"])[0]) or head_round_id
+            # a page only changes when a new round finishes
+            etag = f'"{head_round_id}-{offset}"'
+            self._extra_headers["ETag"] = etag
+
+            if self.headers.get("If-None-Match") == etag:
+                self._send_status(304)
+                return
+
+            # like the real API, a page starts at the offset round itself
+            page = range(min(offset, head_round_id), max(offset - server.page_size, 0), -1)
+            self._send_fixture_or_json(
+                f"/roundlist?{url.query}", lambda: [synthetic_metadata(round_id) for round_id in page]
+            )
+            return
+
+        try:
+            round_id = int(parts[-1])
+        except ValueError:
+            self._send_status(404)
+            return
+
+        if not 0 < round_id <= head_round_id:
+            self._send_status(404)
+        elif parts[-2] == "playercounts":
+            self._send_fixture_or_json(f"/playercounts/{round_id}", lambda: synthetic_playercounts(round_id))
+        elif parts[-2] == "blackbox":
+            self._send_fixture_or_json(f"/blackbox/{round_id}", lambda: synthetic_blackbox(round_id, server.num_keys))
+        else:
+            self._send_status(404)
+
+
+class MockAPIHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # hundreds of clients connect at once, the default backlog of 5 would make them retry
+    request_queue_size = 1024
+
+    def __init__(
+        self,
+        address,
+        latency: float,
+        head_round_id: int,
+        page_size: int,
+        num_keys: int,
+        rate_limit: int = 0,
+        rate_window: float = 60.0,
+        fixtures_dir: str | None = None,
+        round_interval: float = 0.0,
+    ) -> None:
+        super().__init__(address, MockAPIHandler)
+        self.latency = latency
+        self.head_round_id = head_round_id
+        self.page_size = page_size
+        self.num_keys = num_keys
+        self.rate_limit = rate_limit
+        self.rate_window = rate_window
+        self.round_interval = round_interval
+        self._started = time.monotonic()
+        self.fixtures = None
+
+        if fixtures_dir:
+            # imported here so the server runs standalone, para_stats needs the DB config at import time
+            from para_stats.cache import ResponseCache
+
+            self.fixtures = ResponseCache(fixtures_dir)
+
+        self._rate_lock = threading.Lock()
+        self._window_start = time.monotonic()
+        self._window_count = 0
+
+    def head(self) -> int:
+        """Most recent finished round, grows by one every `round_interval` seconds when set"""
+        if not self.round_interval:
+            return self.head_round_id
+
+        return self.head_round_id + int((time.monotonic() - self._started) / self.round_interval)
+
+    def take_request(self) -> tuple[bool, int, float | None]:
+        """Counts a request against the current fixed window. Returns whether it's allowed, the requests left and the seconds until the window resets."""
+        if not self.rate_limit:
+            return True, 1000000, None
+
+        with self._rate_lock:
+            now = time.monotonic()
+
+            if now - self._window_start >= self.rate_window:
+                self._window_start = now
+                self._window_count = 0
+
+            reset_in = self.rate_window - (now - self._window_start)
+            allowed = self._window_count < self.rate_limit
+
+            if allowed:
+                self._window_count += 1
+
+            return allowed, self.rate_limit - self._window_count, reset_in
+
+
+def _serve(port_pipe, port: int, **kwargs) -> None:
+    server = MockAPIHTTPServer(("127.0.0.1", port), **kwargs)
+    port_pipe.send(server.server_address[1])
+    server.serve_forever()
+
+
+class MockAPIServer:
+    def __init__(
+        self,
+        latency: float = 0.0,
+        head_round_id: int = 1000,
+        page_size: int = 100,
+        num_keys: int = 150,
+        port: int = 0,
+        rate_limit: int = 0,
+        rate_window: float = 60.0,
+        fixtures_dir: str | None = None,
+        round_interval: float = 0.0,
+    ) -> None:
+        """Runs the mock API in a child process so the server doesn't compete with the client for the GIL.
+
+        Args:
+            latency (float, optional): Seconds to sleep before answering each request. Defaults to 0.0.
+            head_round_id (int, optional): Most recent round served. Rounds 1..head_round_id exist. Defaults to 1000.
+            page_size (int, optional): Rows per /roundlist page. Defaults to 100.
+            num_keys (int, optional): Blackbox keys per round, the knob for payload size. Defaults to 150.
+            port (int, optional): Port to bind on 127.0.0.1, 0 picks a free one. Defaults to 0.
+            rate_limit (int, optional): Requests allowed per `rate_window`, further ones get a 429. 0 disables the limit. Defaults to 0.
+            rate_window (float, optional): Length of the fixed rate limit window in seconds. Defaults to 60.0.
+            fixtures_dir (str | None, optional): Response cache directory to serve recorded responses from, endpoints missing from it fall back to synthetic data. Defaults to None.
+            round_interval (float, optional): Seconds between newly finished rounds after `head_round_id`, 0 keeps the head fixed. Defaults to 0.0.
+        """
+        self._kwargs = dict(
+            latency=latency,
+            head_round_id=head_round_id,
+            page_size=page_size,
+            num_keys=num_keys,
+            rate_limit=rate_limit,
+            rate_window=rate_window,
+            fixtures_dir=fixtures_dir,
+            round_interval=round_interval,
+        )
+        self._port = port
+        self._process = None
+        self.url = None
+
+    def start(self) -> str:
+        parent_pipe, child_pipe = multiprocessing.Pipe()
+        self._process = multiprocessing.Process(
+            target=_serve, args=(child_pipe, self._port), kwargs=self._kwargs, daemon=True
+        )
+        self._process.start()
+        self.url = f"http://127.0.0.1:{parent_pipe.recv()}/stats"
+
+        return self.url
+
+    def stop(self) -> None:
+        if self._process is not None:
+            self._process.terminate()
+            self._process.join()
+            self._process = None
+
+    def __enter__(self) -> "MockAPIServer":
+        self.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--head-round-id", type=int, default=1000)
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--num-keys", type=int, default=150, help="blackbox keys per synthetic round")
+    parser.add_argument("--rate-limit", type=int, default=0, help="requests per window before answering 429, 0 for no limit")
+    parser.add_argument("--rate-window", type=float, default=60.0)
+    parser.add_argument("--fixtures-dir", help="response cache to serve recorded responses from")
+    parser.add_argument("--round-interval", type=float, default=0.0, help="seconds between newly finished rounds, 0 for a fixed head")
+    args = parser.parse_args()
+
+    print(f"Serving mock stats API on http://127.0.0.1:{args.port}/stats")
+
+    MockAPIHTTPServer(
+        ("127.0.0.1", args.port),
+        latency=args.latency,
+        head_round_id=args.head_round_id,
+        page_size=args.page_size,
+        num_keys=args.num_keys,
+        rate_limit=args.rate_limit,
+        rate_window=args.rate_window,
+        fixtures_dir=args.fixtures_dir,
+        round_interval=args.round_interval,
+    ).serve_forever()
@@ -1,3 +1,4 @@
+import json
 from os import path, environ
 from dotenv import load_dotenv
 
@@ -6,7 +7,52 @@ load_dotenv(path.join(basedir, ".env"))
 
 
 class Config:
+    api_url = environ.get("PARA_STATS_API_URL", "https://api.paradisestation.org/stats")
+    # fetch with AsyncAPIFetch over one aiohttp connection pool, needs the `async` extra
+    use_async = environ.get("PARA_STATS_USE_ASYNC", "0") == "1"
+
     db_uri = environ.get("SQLALCHEMY_DB_URI")
     db_ods_schema = environ.get("SQLALCHEMY_ODS_SCHEMA")
     db_ods_rounds_table = environ.get("SQLALCHEMY_ODS_ROUNDS_TABLE")
-    db_ods_metadata_table = environ.get("SQLALCHEMY_ODS_METADATA_TABLE")
\ No newline at end of file
+    db_ods_metadata_table = environ.get("SQLALCHEMY_ODS_METADATA_TABLE")
+    db_ods_dead_letter_table = environ.get("SQLALCHEMY_ODS_DEAD_LETTER_TABLE", "round_dead_letter")
+    db_ods_sync_state_table = environ.get("SQLALCHEMY_ODS_SYNC_STATE_TABLE", "sync_state")
+    db_ods_sync_gap_table = environ.get("SQLALCHEMY_ODS_SYNC_GAP_TABLE", "sync_gap")
+    db_ods_raw_payload_table = environ.get("SQLALCHEMY_ODS_RAW_PAYLOAD_TABLE", "round_raw_payload")
+    db_load_method = environ.get("PARA_STATS_LOAD_METHOD", "insert")
+    # round_ids per partition of the rounds table, 0 keeps it one unpartitioned table
+    db_rounds_partition_size = int(environ.get("PARA_STATS_ROUNDS_PARTITION_SIZE", "0"))
+    db_pool_size = int(environ.get("PARA_STATS_DB_POOL_SIZE", "4"))
+    # fingerprints of schemas already created, so runs skip the catalog queries of create_all. Empty to always check.
+    db_schema_cache_file = environ.get(
+        "PARA_STATS_SCHEMA_CACHE", path.join(path.expanduser("~"), ".cache", "para_stats", "schema.json")
+    )
+
+    db_ods_tally_table = environ.get("SQLALCHEMY_ODS_TALLY_TABLE", "blackbox_tally")
+    db_ods_nested_tally_table = environ.get("SQLALCHEMY_ODS_NESTED_TALLY_TABLE", "blackbox_nested_tally")
+    db_ods_associative_table = environ.get("SQLALCHEMY_ODS_ASSOCIATIVE_TABLE", "blackbox_associative")
+    db_ods_text_table = environ.get("SQLALCHEMY_ODS_TEXT_TABLE", "blackbox_text")
+    load_facts = environ.get("PARA_STATS_LOAD_FACTS", "0") == "1"
+    # keep the untouched API responses of every fetched round, so `reprocess` can rebuild rounds without the API
+    land_raw = environ.get("PARA_STATS_LAND_RAW", "0") == "1"
+
+    transform_processes = int(environ.get("PARA_STATS_TRANSFORM_PROCESSES", "1"))
+    # blackbox key projection, comma-separated fnmatch patterns. Empty keeps every key.
+    blackbox_keys = [key for key in environ.get("PARA_STATS_BLACKBOX_KEYS", "").split(",") if key] or None
+    blackbox_exclude_keys = [key for key in environ.get("PARA_STATS_BLACKBOX_EXCLUDE_KEYS", "").split(",") if key]
+    # JSON object of key_name to the fields of its data to keep, ex: {"round_end_stats": ["survivors", "escapees"]}
+    blackbox_key_rules = json.loads(environ.get("PARA_STATS_BLACKBOX_KEY_RULES", "{}"))
+    playercount_format = environ.get("PARA_STATS_PLAYERCOUNT_FORMAT", "json")
+
+    cache_dir = environ.get("PARA_STATS_CACHE_DIR")
+    cache_roundlist_ttl = float(environ.get("PARA_STATS_CACHE_ROUNDLIST_TTL", "60"))
+    offline = environ.get("PARA_STATS_OFFLINE", "0") == "1"
+
+    metrics_file = environ.get("PARA_STATS_METRICS_FILE")
+    metrics_port = int(environ.get("PARA_STATS_METRICS_PORT", "0"))
+
+    watch_interval = float(environ.get("PARA_STATS_WATCH_INTERVAL", "30"))
+    watch_jitter = float(environ.get("PARA_STATS_WATCH_JITTER", "0.2"))
+
+    export_dir = environ.get("PARA_STATS_EXPORT_DIR", "export")
+    export_stats_keys = [key for key in environ.get("PARA_STATS_EXPORT_STATS_KEYS", "").split(",") if key]
\ No newline at end of file
@@ -1,8 +1,97 @@
 import sys
 import logging
-from para_stats import init_script
+import argparse
+from config import Config
 
-if __name__ == "__main__":
+
+def main() -> None:
+    """Entry point of the `run` console script and of `python main.py`"""
     logging.basicConfig(stream=sys.stdout, level=logging.INFO)
 
-    init_script()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Mirror the Paradise SS13 stats API into PostgreSQL.")
+    parser.add_argument("command", nargs="?", default="run", choices=["run", "watch", "migrate", "maintain", "reprocess", "export"], help="`run` syncs new rounds once (default), `watch` keeps syncing them as they finish, `migrate` upgrades an existing schema in place, `maintain` vacuums and analyzes the rounds table, `reprocess` rebuilds rounds from their raw payloads after the cleaning rules changed, `export` appends new and reloaded rounds to a Parquet dataset")
+    parser.add_argument("--batch-size", type=int, help="round_ids per migration batch, rows per export batch (default 5000), rounds per reprocess batch (default 200)")
+    parser.add_argument("--cache-dir", default=Config.cache_dir, help="keep raw API responses in this directory")
+    parser.add_argument("--offline", action="store_true", default=Config.offline, help="replay the run from the response cache without touching the network")
+    parser.add_argument("--reload", action="store_true", help="re-transform and re-upload every round, not just missing ones")
+    parser.add_argument("--facts", action="store_true", default=Config.load_facts, help="also load blackbox metrics into the typed fact tables")
+    parser.add_argument("--land-raw", action="store_true", default=Config.land_raw, help="keep the untouched API responses of fetched rounds for `reprocess`")
+    parser.add_argument("--async", dest="use_async", action="store_true", default=Config.use_async, help="fetch over one asyncio connection pool instead of a thread pool, needs the `async` extra")
+    parser.add_argument("--start-round-id", type=int, help="first round_id `reprocess` rebuilds")
+    parser.add_argument("--end-round-id", type=int, help="last round_id `reprocess` rebuilds")
+    parser.add_argument("--force", action="store_true", help="make `reprocess` rebuild every landed round in the range, not just the ones of older transform versions")
+    parser.add_argument("--backfill-facts", action="store_true", help="rebuild the fact tables from rounds already loaded before syncing")
+    parser.add_argument("--compact-playercounts", action="store_true", help="convert the playercounts of loaded rounds to the compact format set by PARA_STATS_PLAYERCOUNT_FORMAT before syncing")
+    parser.add_argument("--metrics-file", default=Config.metrics_file, help="write OpenMetrics of the run to this file when it ends")
+    parser.add_argument("--interval", type=float, default=Config.watch_interval, help="seconds between roundlist polls in watch mode")
+    parser.add_argument("--jitter", type=float, default=Config.watch_jitter, help="fraction of the interval each poll is randomly moved by")
+    parser.add_argument("--metrics-port", type=int, default=Config.metrics_port, help="serve OpenMetrics at http://127.0.0.1:PORT/metrics while the run lasts")
+    parser.add_argument("--export-dir", default=Config.export_dir, help="root directory of the Parquet dataset")
+    parser.add_argument("--recent-partitions", type=int, default=2, help="newest rounds partitions `maintain` vacuums, 0 for all")
+    parser.add_argument("--stats-keys", type=lambda keys: [key for key in keys.split(",") if key], default=Config.export_stats_keys, help="comma-separated blackbox keys exported as typed columns")
+    args = parser.parse_args()
+
+    # each command imports only what it runs, so `--help` and short runs start fast
+    if args.command == "migrate":
+        from para_stats import migrate_script
+
+        migrate_script(batch_size=args.batch_size or 5000)
+        return
+
+    if args.command == "maintain":
+        from para_stats import maintain_script
+
+        maintain_script(recent_partitions=args.recent_partitions)
+        return
+
+    if args.command == "reprocess":
+        from para_stats import reprocess_script
+
+        reprocess_script(
+            start_round_id=args.start_round_id,
+            end_round_id=args.end_round_id,
+            batch_size=args.batch_size or 200,
+            load_facts=args.facts,
+            force=args.force,
+        )
+        return
+
+    if args.command == "export":
+        from para_stats import export_script
+
+        export_script(output_dir=args.export_dir, stats_keys=args.stats_keys, batch_size=args.batch_size or 5000)
+        return
+
+    if args.command == "watch":
+        from para_stats import watch_script
+
+        watch_script(
+            interval=args.interval,
+            jitter=args.jitter,
+            cache_dir=args.cache_dir,
+            load_facts=args.facts,
+            metrics_file=args.metrics_file,
+            metrics_port=args.metrics_port,
+            land_raw=args.land_raw,
+            use_async=args.use_async,
+        )
+        return
+
+    from para_stats import init_script
+
+    init_script(
+        cache_dir=args.cache_dir,
+        offline=args.offline,
+        reload=args.reload,
+        load_facts=args.facts,
+        backfill_facts=args.backfill_facts,
+        compact_playercounts=args.compact_playercounts,
+        metrics_file=args.metrics_file,
+        metrics_port=args.metrics_port,
+        land_raw=args.land_raw,
+        use_async=args.use_async,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,380 @@
+import logging
+import threading
+from collections import OrderedDict
+from datetime import timezone
+import numpy as np
+import pandas as pd
+from sqlalchemy import cast, func, literal_column, select, text, true
+from sqlalchemy.types import DateTime, Double, Integer, Interval
+from .models import round_table
+from .transform import TransformData
+
+
+class RoundAnalytics:
+    TIME_UNITS = ("minute", "hour", "day", "week", "month")
+
+    def __init__(self, engine, cache_size: int = 128) -> None:
+        """Answers the common questions about the rounds table without loading whole JSONB rows into Python.
+
+        Filtering and the heavy aggregation run in Postgres, only small partial aggregates come back, and the
+        final rates, means and quantiles are computed on them with pandas/NumPy.
+
+        Partial aggregates are cached per query and filters, tagged with the max round_id and row count they cover.
+        A repeated query costs one index-only version check while no rounds were loaded. Once new rounds are in,
+        only the rounds above the cached max round_id are aggregated and merged into the cached partials. If rounds
+        appeared below it too, ex: a filled round_id gap, the query is recomputed from scratch. Rounds reloaded in
+        place don't change the version, call `clear_cache()` after a `--reload` run.
+
+        Every query takes the same filters:
+            since (datetime | None): only rounds that ended at or after it. Naive datetimes are taken as UTC.
+            until (datetime | None): only rounds that started before it. Naive datetimes are taken as UTC.
+            server_id, game_mode, map_name (str | list[str] | None): only rounds with one of these values.
+
+        Args:
+            engine (Engine): engine of the database holding the rounds table.
+            cache_size (int, optional): Number of cached queries kept, least recently used are dropped first. Defaults to 128.
+        """
+        self._log = logging.getLogger(__name__)
+        self.engine = engine
+        self.CACHE_SIZE = cache_size
+
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def clear_cache(self) -> None:
+        with self._lock:
+            self._cache.clear()
+
+    @staticmethod
+    def _utc_filters(filters: dict) -> dict:
+        """Filters with since/until as UTC datetimes, naive ones are taken as UTC like the datetimes of the API"""
+        utc_filters = dict(filters)
+
+        for name in ("since", "until"):
+            value = utc_filters.get(name)
+
+            if value is not None:
+                utc_filters[name] = value.astimezone(timezone.utc) if value.tzinfo is not None else value.replace(tzinfo=timezone.utc)
+
+        return utc_filters
+
+    @staticmethod
+    def _filter_clauses(
+        since=None,
+        until=None,
+        server_id: str | list[str] | None = None,
+        game_mode: str | list[str] | None = None,
+        map_name: str | list[str] | None = None,
+    ) -> list:
+        clauses = []
+
+        if since is not None:
+            clauses.append(round_table.c["end_datetime"] >= since)
+
+        if until is not None:
+            clauses.append(round_table.c["start_datetime"] < until)
+
+        for name, value in (("server_id", server_id), ("game_mode", game_mode), ("map_name", map_name)):
+            if value is None:
+                continue
+
+            column = round_table.c[name]
+            clauses.append(column == value if isinstance(value, str) else column.in_(list(value)))
+
+        return clauses
+
+    @staticmethod
+    def _cache_key(kind: str, params: tuple, filters: dict) -> tuple:
+        normalized = tuple(
+            sorted((name, tuple(sorted(value)) if isinstance(value, (list, tuple, set)) else value) for name, value in filters.items())
+        )
+
+        return kind, params, normalized
+
+    def _cached(self, key: tuple, filters: dict, fetch, merge):
+        """Returns the partial aggregate for `key`, computing it in full, incrementally or not at all.
+
+        Args:
+            key (tuple): cache key of the query.
+            filters (dict): filter keyword arguments of the query.
+            fetch (Callable): `fetch(connection, clauses)` runs the aggregation for the rounds matching the clauses.
+            merge (Callable): `merge(cached, new)` combines two partial aggregates.
+        """
+        clauses = self._filter_clauses(**filters)
+        round_id = round_table.c["round_id"]
+
+        with self._lock:
+            entry = self._cache.get(key)
+
+        # one snapshot for the version check and the aggregation, so rounds loaded in between are never counted twice
+        with self.engine.connect().execution_options(isolation_level="REPEATABLE READ") as connection:
+            # playercount samples are naive ISO strings, read and bucketed as UTC
+            connection.execute(text("SET LOCAL timezone = 'UTC'"))
+
+            max_round_id, rowcount = connection.execute(select(func.max(round_id), func.count()).select_from(round_table)).one()
+            max_round_id = max_round_id or 0
+
+            if entry is not None and entry[:2] == (max_round_id, rowcount):
+                self._log.debug(f"{key[0]} served from cache up to round_id {max_round_id}")
+                partial = entry[2]
+
+            elif (
+                entry is not None
+                and max_round_id > entry[0]
+                and rowcount - entry[1]
+                == connection.execute(select(func.count()).select_from(round_table).where(round_id > entry[0])).scalar()
+            ):
+                self._log.debug(f"{key[0]} updated with round_ids {entry[0] + 1} to {max_round_id}")
+                partial = merge(entry[2], fetch(connection, [*clauses, round_id > entry[0]]))
+
+            else:
+                self._log.debug(f"{key[0]} computed up to round_id {max_round_id}")
+                partial = fetch(connection, clauses)
+
+        with self._lock:
+            self._cache[key] = (max_round_id, rowcount, partial)
+            self._cache.move_to_end(key)
+
+            while len(self._cache) > self.CACHE_SIZE:
+                self._cache.popitem(last=False)
+
+        return partial
+
+    @staticmethod
+    def _frame(result, columns: list[str]) -> pd.DataFrame:
+        return pd.DataFrame(result.fetchall(), columns=columns)
+
+    @staticmethod
+    def _truncate(timestamps: pd.Series, unit: str) -> pd.Series:
+        """Vectorized date_trunc of UTC timestamps"""
+        if unit == "week":
+            # ISO weeks start on Monday, like Postgres
+            return timestamps.dt.floor("D") - pd.to_timedelta(timestamps.dt.weekday, unit="D")
+        if unit == "month":
+            return timestamps.dt.tz_localize(None).dt.to_period("M").dt.start_time.dt.tz_localize("UTC")
+        return timestamps.dt.floor({"minute": "min", "hour": "h", "day": "D"}[unit])
+
+    @staticmethod
+    def _merge_counts(keys: list[str], aggregations: dict):
+        def merge(cached: pd.DataFrame, new: pd.DataFrame) -> pd.DataFrame:
+            if new.empty:
+                return cached
+            return pd.concat([cached, new], ignore_index=True).groupby(keys, as_index=False, dropna=False).agg(aggregations)
+
+        return merge
+
+    def playercount_series(self, unit: str = "hour", **filters) -> pd.DataFrame:
+        """Mean and peak playercount per server and time bucket, from every round's per-minute samples.
+
+        Args:
+            unit (str, optional): bucket size, one of TIME_UNITS. Defaults to "hour".
+
+        Raises:
+            ValueError: unknown `unit`.
+
+        Returns:
+            DataFrame: columns bucket, server_id, mean_players, peak_players, samples, ordered by bucket.
+        """
+        if unit not in self.TIME_UNITS:
+            raise ValueError(f"Unknown time unit {unit}, expected one of {self.TIME_UNITS}")
+
+        filters = self._utc_filters(filters)
+        merge = self._merge_counts(["bucket", "server_id"], {"total": "sum", "samples": "sum", "peak_players": "max"})
+
+        def fetch(connection, clauses) -> pd.DataFrame:
+            return merge(fetch_json(connection, clauses), fetch_compact(connection, clauses))
+
+        def fetch_json(connection, clauses) -> pd.DataFrame:
+            samples = func.jsonb_each_text(round_table.c["playercounts"]).table_valued("key", "value").render_derived(name="sample")
+            sampled_at = cast(samples.c["key"], DateTime(timezone=True))
+            players = cast(samples.c["value"], Integer)
+            # inlined rather than bound, with two bind parameters Postgres can't match the GROUP BY to the select list
+            bucket = func.date_trunc(literal_column(f"'{unit}'"), sampled_at)
+
+            sample_clauses = []
+
+            if filters.get("since") is not None:
+                sample_clauses.append(sampled_at >= filters["since"])
+
+            if filters.get("until") is not None:
+                sample_clauses.append(sampled_at < filters["until"])
+
+            stmt = (
+                select(bucket, round_table.c["server_id"], func.sum(players), func.count(), func.max(players))
+                .select_from(round_table)
+                .join(samples, true())
+                .where(
+                    round_table.c["playercount_deltas"].is_(None),
+                    func.jsonb_typeof(round_table.c["playercounts"]) == "object",
+                    *clauses,
+                    *sample_clauses,
+                )
+                .group_by(bucket, round_table.c["server_id"])
+            )
+
+            return self._frame(connection.execute(stmt), ["bucket", "server_id", "total", "samples", "peak_players"])
+
+        def fetch_compact(connection, clauses) -> pd.DataFrame:
+            # Postgres can't unpack the deltas, so compact rounds come back whole (~2 bytes a sample) and are bucketed here
+            first_sample = round_table.c["playercount_start"]
+            # two bytes a delta, one delta a sample
+            last_sample = first_sample + func.make_interval(
+                0, 0, 0, 0, 0, 0, round_table.c["playercount_interval"] * (func.length(round_table.c["playercount_deltas"]) / 2 - 1),
+                type_=Interval,
+            )
+
+            # only rounds with samples in the range come back, the samples outside it are dropped below
+            sample_clauses = []
+
+            if filters.get("since") is not None:
+                sample_clauses.append(last_sample >= filters["since"])
+
+            if filters.get("until") is not None:
+                sample_clauses.append(first_sample < filters["until"])
+
+            stmt = select(
+                round_table.c["server_id"],
+                round_table.c["playercount_start"],
+                round_table.c["playercount_interval"],
+                round_table.c["playercount_deltas"],
+            ).where(round_table.c["playercount_deltas"].is_not(None), *clauses, *sample_clauses)
+
+            rows = connection.execute(stmt).fetchall()
+            expanded = [TransformData.expand_playercounts(start, interval, deltas) for _, start, interval, deltas in rows]
+
+            samples = pd.DataFrame(
+                {
+                    "sampled_at": pd.Series(
+                        np.concatenate([timestamps for timestamps, _ in expanded]) if expanded else np.array([], dtype="datetime64[s]")
+                    ).dt.tz_localize("UTC"),
+                    "server_id": np.repeat(
+                        np.array([row[0] for row in rows], dtype=object), [counts.size for _, counts in expanded]
+                    ),
+                    "players": np.concatenate([counts for _, counts in expanded]) if expanded else np.array([], dtype=np.int32),
+                }
+            )
+
+            if filters.get("since") is not None:
+                samples = samples[samples["sampled_at"] >= filters["since"]]
+
+            if filters.get("until") is not None:
+                samples = samples[samples["sampled_at"] < filters["until"]]
+
+            return (
+                samples.assign(bucket=self._truncate(samples["sampled_at"], unit))
+                .groupby(["bucket", "server_id"], as_index=False, dropna=False)
+                .agg(total=("players", "sum"), samples=("players", "size"), peak_players=("players", "max"))
+            )
+
+        partial = self._cached(self._cache_key("playercount_series", (unit,), filters), filters, fetch, merge)
+
+        series = partial.sort_values(["bucket", "server_id"], ignore_index=True)
+        series.insert(2, "mean_players", series["total"].to_numpy(dtype=np.float64) / series["samples"].to_numpy())
+
+        return series[["bucket", "server_id", "mean_players", "peak_players", "samples"]]
+
+    def outcome_rates(self, **filters) -> pd.DataFrame:
+        """Share of each game_mode_result within every game_mode, ex: how often traitor rounds end in `win`.
+
+        Returns:
+            DataFrame: columns game_mode, game_mode_result, rounds, rate, ordered by game_mode and descending rounds.
+        """
+
+        def fetch(connection, clauses) -> pd.DataFrame:
+            game_mode, result = round_table.c["game_mode"], round_table.c["game_mode_result"]
+            stmt = select(game_mode, result, func.count()).where(*clauses).group_by(game_mode, result)
+
+            return self._frame(connection.execute(stmt), ["game_mode", "game_mode_result", "rounds"])
+
+        filters = self._utc_filters(filters)
+        merge = self._merge_counts(["game_mode", "game_mode_result"], {"rounds": "sum"})
+        partial = self._cached(self._cache_key("outcome_rates", (), filters), filters, fetch, merge)
+
+        rates = partial.sort_values(["game_mode", "rounds"], ascending=[True, False], ignore_index=True)
+        rates["rate"] = rates["rounds"] / rates.groupby("game_mode", dropna=False)["rounds"].transform("sum")
+
+        return rates
+
+    def map_popularity(self, **filters) -> pd.DataFrame:
+        """Rounds played on each map and their share of all matching rounds.
+
+        Returns:
+            DataFrame: columns map_name, rounds, share, most played first.
+        """
+
+        def fetch(connection, clauses) -> pd.DataFrame:
+            map_name = round_table.c["map_name"]
+            stmt = select(map_name, func.count()).where(*clauses).group_by(map_name)
+
+            return self._frame(connection.execute(stmt), ["map_name", "rounds"])
+
+        filters = self._utc_filters(filters)
+        merge = self._merge_counts(["map_name"], {"rounds": "sum"})
+        partial = self._cached(self._cache_key("map_popularity", (), filters), filters, fetch, merge)
+
+        popularity = partial.sort_values("rounds", ascending=False, ignore_index=True)
+        popularity["share"] = popularity["rounds"] / popularity["rounds"].sum()
+
+        return popularity
+
+    def _durations(self, filters: dict) -> pd.DataFrame:
+        """Minutes from start to shutdown of every matching round, with its game_mode. Computed per round in SQL."""
+
+        def fetch(connection, clauses) -> pd.DataFrame:
+            start, shutdown = round_table.c["start_datetime"], round_table.c["shutdown_datetime"]
+            minutes = cast(func.extract("epoch", shutdown - start), Double) / 60
+            stmt = select(round_table.c["game_mode"], minutes).where(shutdown > start, *clauses)
+
+            return self._frame(connection.execute(stmt), ["game_mode", "minutes"])
+
+        def merge(cached: pd.DataFrame, new: pd.DataFrame) -> pd.DataFrame:
+            return pd.concat([cached, new], ignore_index=True) if not new.empty else cached
+
+        filters = self._utc_filters(filters)
+
+        return self._cached(self._cache_key("durations", (), filters), filters, fetch, merge)
+
+    def duration_summary(self, quantiles: tuple = (0.1, 0.25, 0.5, 0.75, 0.9), **filters) -> pd.DataFrame:
+        """Round duration statistics in minutes per game_mode, plus an `all` row over every game_mode.
+
+        Args:
+            quantiles (tuple, optional): quantiles to report. Defaults to (0.1, 0.25, 0.5, 0.75, 0.9).
+
+        Returns:
+            DataFrame: indexed by game_mode, columns rounds, mean and one `p<quantile>` per quantile, ex: p50.
+        """
+        durations = self._durations(filters)
+        columns = [f"p{q * 100:g}" for q in quantiles]
+
+        grouped = durations.groupby("game_mode", dropna=False)["minutes"]
+        summary = grouped.quantile(list(quantiles)).unstack()
+        summary.columns = columns
+        summary.insert(0, "mean", grouped.mean())
+        summary.insert(0, "rounds", grouped.size())
+
+        minutes = durations["minutes"].to_numpy()
+
+        if minutes.size:
+            summary.loc["all"] = [minutes.size, minutes.mean(), *np.quantile(minutes, quantiles)]
+            summary["rounds"] = summary["rounds"].astype(np.int64)
+
+        return summary
+
+    def duration_histogram(self, bin_minutes: float = 10, **filters) -> pd.DataFrame:
+        """Distribution of round durations in fixed-width bins.
+
+        Args:
+            bin_minutes (float, optional): width of each bin in minutes. Defaults to 10.
+
+        Returns:
+            DataFrame: columns bin_start, bin_end in minutes and rounds, empty bins included.
+        """
+        minutes = self._durations(filters)["minutes"].to_numpy()
+
+        if not minutes.size:
+            return pd.DataFrame({"bin_start": [], "bin_end": [], "rounds": []})
+
+        edges = np.arange(0, minutes.max() + bin_minutes, bin_minutes)
+        counts, edges = np.histogram(minutes, bins=edges)
+
+        return pd.DataFrame({"bin_start": edges[:-1], "bin_end": edges[1:], "rounds": counts})
@@ -1,8 +1,13 @@
 import logging
 import requests
-from json import JSONDecodeError
+from json import JSONDecodeError, loads
 from concurrent.futures import ThreadPoolExecutor
-from .exceptions import RateLimitError, RoundNotFoundError
+from functools import partial
+from requests.adapters import HTTPAdapter
+from .cache import ResponseCache
+from .exceptions import CacheMissError, RateLimitError, RoundNotFoundError
+from .metrics import API_CACHE_HITS, API_RATE_LIMITED, API_REQUEST_SECONDS, API_RESPONSE_BYTES, endpoint_label
+from .rate_limit import RateLimiter
 
 
 class APIFetch:
@@ -10,57 +15,126 @@ class APIFetch:
         self,
         base_url: str = "https://api.paradisestation.org/stats",
         max_connections: int = 10,
+        rate_limiter: RateLimiter | None = None,
+        max_retries: int = 5,
+        cache: ResponseCache | None = None,
+        offline: bool = False,
     ) -> None:
         """REST adapter for connection pooling. Uses ThreadPoolExecutor for concurrent requests.
 
         Args:
             base_url (str, optional): Endpoint to query, should not need to change from default. Defaults to "https://api.paradisestation.org/stats".
-            max_connections(int, optional): Number of threads to use with concurrent requests. Defaults to 10, which is the default number of simultaneous threads provided by the urllib3 connection pool.
+            max_connections(int, optional): Upper bound on threads used for concurrent requests. The number actually used is picked by the rate limiter from the allowed request rate and observed latency. Defaults to 10, which is the default number of simultaneous threads provided by the urllib3 connection pool.
+            rate_limiter (RateLimiter, optional): Token bucket shared by every worker. Defaults to a new RateLimiter bounded by `max_connections`.
+            max_retries (int, optional): Number of times a request is retried after a 429 before RateLimitError is raised. Defaults to 5.
+            cache (ResponseCache, optional): On-disk cache consulted before every request and filled with every successful response. Defaults to None.
+            offline (bool, optional): Replay mode, serve everything from `cache` (ignoring TTLs) and never touch the network. Defaults to False.
         """
+        if offline and cache is None:
+            raise ValueError("Offline mode requires a response cache")
 
         self._log = logging.getLogger(__name__)
         self.base_url = base_url
 
         self.CONNECTIONS = max_connections
+        self.MAX_RETRIES = max_retries
+        self.OFFLINE = offline
+        self._cache = cache
+        self._limiter = rate_limiter or RateLimiter(max_concurrency=max_connections)
+        # ETag / Last-Modified of the last response per endpoint, sent back by conditional requests
+        self._validators = {}
+
         self._session = requests.Session()
+        # size the urllib3 pool to the worker count so keep-alive connections aren't discarded
+        adapter = HTTPAdapter(pool_connections=max_connections, pool_maxsize=max_connections)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
 
         self.blackbox_endpoint = "/blackbox/"
         self.playercounts_endpoint = "/playercounts/"
         self.roundlist_endpoint = ("/roundlist?offset=")
         self.metadata_endpoint = "/metadata/"
 
-    def __fetch_roundlist_paged(self, offset_start: int, offset_end: int) -> list:
-        """Generator for paginated retrieval of roundlist endpoint. Will return overlapping data."""
+    def close(self) -> None:
+        """Closes the pooled keep-alive connections."""
+        self._session.close()
 
-        def fetch_single_page(offset: int) -> list:
-            return self._get(self.roundlist_endpoint + str(offset))
+    def fetch_roundlist_to_offset(self, offset_end: int) -> list:
+        """Fetches list of rounds newer than a specified offset, newest first and without duplicates."""
+        head_page = self._get(self.roundlist_endpoint + "0")
 
-        result = fetch_single_page(offset_start)
-        yield result
+        return self.fetch_roundlist_window(head_page[-1]["round_id"], offset_end, head_page=head_page)
 
-        while result[-1]["round_id"] > offset_end:
-            result = fetch_single_page(result[-1]["round_id"])
-            yield result
+    def fetch_roundlist_window(
+        self, offset_start: int, offset_end: int, head_page: list | None = None
+    ) -> list:
+        """Concurrently fetches every roundlist page between two round_ids.
 
-    def fetch_roundlist_to_offset(self, offset_end: int) -> list:
-        """Fetches list of rounds up to a specified offset."""
-        metadata_list = []
+        The range is split into fixed offset windows one page wide, so no page depends on the one before it.
+        Pages may still overlap where round_ids are sparse, overlapping rows are deduplicated by round_id.
 
-        for result in self.__fetch_roundlist_paged(0, offset_end):
-            # list concatenation appends each page to the master list
-            metadata_list += result
+        Args:
+            offset_start (int): round_id of the first (newest) page to fetch.
+            offset_end (int): only rounds with a round_id above this are returned.
+            head_page (list | None, optional): already fetched page at or above offset_start, used to size the windows and included in the result. Defaults to None.
 
-        return metadata_list
+        Returns:
+            list: metadata entries with offset_end < round_id, sorted newest first
+        """
+        if head_page is None:
+            head_page = self._get(self.roundlist_endpoint + str(offset_start))
+
+        metadata_index = {entry["round_id"]: entry for entry in head_page}
+
+        offsets = self._window_offsets(offset_start, offset_end, len(head_page))
+
+        self._log.info(f"Fetching {len(offsets)} roundlist windows between round_ids {offset_start} and {offset_end}")
+
+        with ThreadPoolExecutor(max_workers=self._limiter.concurrency()) as pool:
+            for page in pool.map(self._get, [self.roundlist_endpoint + str(offset) for offset in offsets]):
+                for entry in page:
+                    metadata_index[entry["round_id"]] = entry
+
+        return [
+            metadata_index[round_id]
+            for round_id in sorted(metadata_index, reverse=True)
+            if round_id > offset_end
+        ]
+
+    @staticmethod
+    def _window_offsets(offset_start: int, offset_end: int, page_size: int) -> list[int]:
+        """Offsets of the pages covering (offset_end, offset_start]. A page holds at least `page_size` consecutive round_ids, consecutive windows overlap by one in case the offset is exclusive."""
+        if page_size <= 1 or offset_start <= offset_end:
+            return [offset_start] if offset_start > offset_end else []
+
+        return list(range(offset_start, offset_end, -(page_size - 1)))
 
     def fetch_most_recent_round_id(self) -> int:
         """Gets the most recently completed round from the API."""
         return self._get("/roundlist?offset=0")[0]["round_id"]
 
-    def fetch_round_data_bulk(self, round_id_list: list[int]) -> tuple:
+    def fetch_roundlist_head(self, conditional: bool = False) -> list | None:
+        """Fetches the newest roundlist page, bypassing the cache. With `conditional`, returns None if the page hasn't changed since the last call."""
+        return self._get(self.roundlist_endpoint + "0", conditional=conditional)
+
+    @staticmethod
+    def _validators_from(headers) -> dict:
+        """Conditional request headers for the next request, from a response's validators. Servers that send neither just always get a full request."""
+        validators = {}
+
+        if headers.get("ETag"):
+            validators["If-None-Match"] = headers["ETag"]
+        if headers.get("Last-Modified"):
+            validators["If-Modified-Since"] = headers["Last-Modified"]
+
+        return validators
+
+    def fetch_round_data_bulk(self, round_id_list: list[int], failures: dict | None = None) -> tuple:
         """Fetches playercount and blackbox data from provided round id list.
 
         Args:
             round_id_list (list[int]): list of round ids to query
+            failures (dict | None, optional): If provided, each round succeeds or fails on its own: the exception of a failed round is stored under its round_id and both of its responses are None. Once a request is still rate limited after `max_retries` retries, every round of the batch not fetched yet fails with that RateLimitError too, so the rounds already fetched are kept and the rest are left for a later run. Otherwise the first failure is raised. Defaults to None.
 
         Returns:
             tuple: playercount_list and raw_blackbox_list responses
@@ -68,9 +142,29 @@ class APIFetch:
         self._log.info("Starting concurrent get...")
 
         playercount_list, raw_blackbox_list = self.__fetch_endpoints(
-            round_id_list, [self.playercounts_endpoint, self.blackbox_endpoint]
+            round_id_list, [self.playercounts_endpoint, self.blackbox_endpoint], isolate=failures is not None
         )
 
+        if failures is not None:
+            for idx, round_id in enumerate(round_id_list):
+                error = next(
+                    (r for r in (playercount_list[idx], raw_blackbox_list[idx]) if isinstance(r, Exception)),
+                    None,
+                )
+
+                if error is not None:
+                    failures[round_id] = error
+                    playercount_list[idx] = None
+                    raw_blackbox_list[idx] = None
+
+            if failures:
+                self._log.warning(f"{len(failures)} of {len(round_id_list)} rounds failed to fetch")
+
+            rate_limited = sum(isinstance(error, RateLimitError) for error in failures.values())
+
+            if rate_limited:
+                self._log.warning(f"Gave up on {rate_limited} rate limited rounds, they are left for a later run")
+
         self._log.info(
             f"Successfully got playercount and blackbox lists with lens: {len(playercount_list)}, {len(raw_blackbox_list)}"
         )
@@ -78,17 +172,19 @@ class APIFetch:
         return playercount_list, raw_blackbox_list
 
     def __fetch_endpoints(
-        self, round_id_list: list[int], endpoint_list: list[str]
+        self, round_id_list: list[int], endpoint_list: list[str], isolate: bool = False
     ) -> list[list]:
         """Builds urls from provided round_id_list and then concurrently fetches endpoints.
 
         Args:
             round_id_list (list[int]): _description_
             endpoint_list (list[str]): list of endpoint strings. ex: `['/abc/, '/def/']`
+            isolate (bool, optional): Return the exception of a failed request in place of its response instead of raising it. After the first RateLimitError, the remaining requests return it without being sent. Defaults to False.
 
         Returns:
             list[list]: list of responses in the order provided in `endpoint_list`.
         """
+        get = partial(self._get_isolated, rate_limit_errors=[]) if isolate else self._get
 
         # build a list of endpoints/id from each base endpoint
         full_endpoint_list = [
@@ -98,56 +194,118 @@ class APIFetch:
 
         # map our Session's get onto the iterable of endpoints for each iterable in the full list
         # query order is preserved with list() 
-        with ThreadPoolExecutor(max_workers=self.CONNECTIONS) as pool:
+        with ThreadPoolExecutor(max_workers=self._limiter.concurrency()) as pool:
             responses = [
-                list(pool.map(self._get, endpoint_iter))
+                list(pool.map(get, endpoint_iter))
                 for endpoint_iter in full_endpoint_list
             ]
 
         return responses
 
-    def _get(self, endpoint: str) -> dict | list:
+    def _get_isolated(self, endpoint: str, rate_limit_errors: list) -> dict | list | Exception:
+        """`_get` that returns per-request failures instead of raising them, so one bad round can't abort a batch.
+
+        `rate_limit_errors` is shared by every request of a batch: once one of them gave up on a 429, the others return
+        its RateLimitError straight away instead of queueing more retries against an exhausted limit.
+        """
+        if rate_limit_errors:
+            return rate_limit_errors[0]
+
+        try:
+            return self._get(endpoint)
+        except RateLimitError as e:
+            rate_limit_errors.append(e)
+            return e
+        except Exception as e:
+            return e
+
+    def _get(self, endpoint: str, conditional: bool = False) -> dict | list | None:
         """
-        Session HTTP GET wrapper. Returns json response.
+        Session HTTP GET wrapper. Returns json response. Every request waits on the shared rate limiter, and a 429 pauses all workers until the server's reset time before the request is retried.
         Args:
-            session (requests.Session): Session object for keep-alive connection pooling. Make sure this is defined at the highest level possible in the case of iterative functions.
             endpoint (str): full endpoint (+ round id) to query.
                 ex: /metadata/12345
+            conditional (bool, optional): Skip the cache and send the ETag / Last-Modified of the previous response, a 304 returns None. Defaults to False.
 
         Raises:
-            RateLimitError: HTTP status code 429: per-minute or per-hour rate limit has been exceeded and will be locked out. TODO: return the hour reset time on this exception
+            RateLimitError: HTTP status code 429 was still returned after `max_retries` retries. `retry_after` holds the last known reset delay in seconds.
             RoundNotFoundError: Either the URL queried was incorrect or the round is still ongoing.
+            CacheMissError: offline and the endpoint isn't cached.
 
         Returns:
-            dict | list: deserialized json response
+            dict | list | None: deserialized json response, None if a conditional request wasn't modified
         """
+        # a conditional request asks the server, unless there's only the cache to ask
+        conditional = conditional and not self.OFFLINE
+
+        if self._cache is not None and not conditional:
+            content = self._cache.get(endpoint, ignore_ttl=self.OFFLINE)
+
+            if content is not None:
+                self._log.debug(f"Cache hit for endpoint {endpoint}")
+                API_CACHE_HITS.inc(endpoint=endpoint_label(endpoint))
+                return loads(content)
+
+            if self.OFFLINE:
+                raise CacheMissError(endpoint)
 
         full_url = self.base_url + endpoint
+        route = endpoint_label(endpoint)
+
+        for attempt in range(self.MAX_RETRIES + 1):
+            self._limiter.acquire()
+
+            response = self._session.get(full_url, headers=self._validators.get(endpoint) if conditional else None)
 
-        response = self._session.get(full_url)
+            API_REQUEST_SECONDS.observe(response.elapsed.total_seconds(), endpoint=route, status=response.status_code)
+
+            if response.status_code != 429:
+                break
+
+            API_RATE_LIMITED.inc(endpoint=route)
+
+            delay = self._limiter.backoff(attempt, response.headers)
+
+            if attempt == self.MAX_RETRIES:
+                self._log.error(f"Rate limited on endpoint {endpoint} after {attempt} retries")
+                raise RateLimitError(retry_after=delay)
+
+            self._log.warning(f"Rate limited on endpoint {endpoint}, retrying in {delay:.1f} sec (attempt {attempt + 1}/{self.MAX_RETRIES})")
+            self._limiter.pause(delay)
+
+        self._limiter.update(response.headers, response.elapsed.total_seconds())
+
+        if conditional and response.status_code == 304:
+            self._log.debug(f"Endpoint {endpoint} not modified")
+            return None
 
         try:
             response.raise_for_status()
 
         except requests.exceptions.HTTPError as e:
-            if response.status_code == 429:
-                self._log.exception("Caught rate limit exception:", e, exc_info=1)
-                raise RateLimitError from e
-            elif response.status_code == 404:
+            if response.status_code == 404:
                 self._log.critical(f"Received 404 from endpoint {endpoint}")
                 raise RoundNotFoundError from e
             else:
-                self._log.exception("Unhandled HTTP error occurred:", e, exc_info=1)
-                raise requests.exceptions.HTTPError from e
+                self._log.exception(f"Unhandled HTTP error occurred on endpoint {endpoint}")
+                raise requests.exceptions.HTTPError(response=response) from e
 
         try:
             data_json = response.json()
-        except (ValueError, TypeError, JSONDecodeError) as e:
-            self._log.exception("Error in decoding JSON response:", e, exc_info=1)
+        except (ValueError, TypeError, JSONDecodeError):
+            self._log.exception(f"Error in decoding JSON response from endpoint {endpoint}")
             data_json = None
 
+        API_RESPONSE_BYTES.inc(len(response.content), endpoint=route)
+
+        if self._cache is not None and data_json is not None:
+            self._cache.put(endpoint, response.content)
+
+        if conditional:
+            self._validators[endpoint] = self._validators_from(response.headers)
+
         self._log.info(
-            f"Successful GET/deserialize of endpoint\t{endpoint}\t{response.elapsed.total_seconds()} sec\tratelimit remaining: {int(response.headers['X-Rate-Limit-Remaining'])}"
+            f"Successful GET/deserialize of endpoint\t{endpoint}\t{response.elapsed.total_seconds()} sec\tratelimit remaining: {response.headers.get('X-Rate-Limit-Remaining')}"
         )
 
         return data_json
@@ -0,0 +1,306 @@
+import asyncio
+import logging
+from json import loads
+from .api_fetch import APIFetch
+from .cache import ResponseCache
+from .exceptions import CacheMissError, RateLimitError, RoundNotFoundError
+from .metrics import API_CACHE_HITS, API_RATE_LIMITED, API_REQUEST_SECONDS, API_RESPONSE_BYTES, endpoint_label
+from .rate_limit import RateLimiter
+
+try:
+    import aiohttp
+except ImportError:  # optional dependency, installed with the `async` extra
+    aiohttp = None
+
+
+async def _gather(*coros) -> list:
+    """`asyncio.gather` that cancels and awaits the other tasks once one fails, then raises that first error unwrapped."""
+    try:
+        async with asyncio.TaskGroup() as group:
+            tasks = [group.create_task(coro) for coro in coros]
+    except BaseExceptionGroup as group_error:
+        raise group_error.exceptions[0] from None
+
+    return [task.result() for task in tasks]
+
+
+class AsyncAPIFetch:
+    def __init__(
+        self,
+        base_url: str = "https://api.paradisestation.org/stats",
+        max_connections: int = 200,
+        rate_limiter: RateLimiter | None = None,
+        max_retries: int = 5,
+        cache: ResponseCache | None = None,
+        offline: bool = False,
+    ) -> None:
+        """asyncio drop-in for `APIFetch`. Exposes the same blocking public methods, but runs every request on a private event loop over one keep-alive aiohttp connection pool.
+
+        The playercount and blackbox requests for a round are scheduled together, and every round in a batch is in flight at once, bounded only by `max_connections` and the shared rate limiter.
+
+        Args:
+            base_url (str, optional): Endpoint to query, should not need to change from default. Defaults to "https://api.paradisestation.org/stats".
+            max_connections (int, optional): Maximum number of requests in flight and size of the connection pool. Defaults to 200.
+            rate_limiter (RateLimiter, optional): Token bucket to pace requests with, can be shared with an `APIFetch`. Defaults to a new RateLimiter.
+            max_retries (int, optional): Number of times a request is retried after a 429 before RateLimitError is raised. Defaults to 5.
+            cache (ResponseCache, optional): On-disk cache consulted before every request and filled with every successful response. Defaults to None.
+            offline (bool, optional): Replay mode, serve everything from `cache` (ignoring TTLs) and never touch the network. Defaults to False.
+        """
+        if aiohttp is None:
+            raise ImportError("AsyncAPIFetch requires aiohttp, install with the `async` extra")
+
+        if offline and cache is None:
+            raise ValueError("Offline mode requires a response cache")
+
+        self._log = logging.getLogger(__name__)
+        self.base_url = base_url
+
+        self.CONNECTIONS = max_connections
+        self.MAX_RETRIES = max_retries
+        self.OFFLINE = offline
+        self._cache = cache
+        self._limiter = rate_limiter or RateLimiter(max_concurrency=max_connections)
+        self._validators = {}
+
+        # the session is bound to the loop it was created on, so both live as long as the fetcher
+        self._loop = asyncio.new_event_loop()
+        self._session = None
+        self._in_flight = None
+
+        self.blackbox_endpoint = "/blackbox/"
+        self.playercounts_endpoint = "/playercounts/"
+        self.roundlist_endpoint = ("/roundlist?offset=")
+        self.metadata_endpoint = "/metadata/"
+
+    def _run(self, coro):
+        return self._loop.run_until_complete(coro)
+
+    async def _open(self) -> None:
+        if self._session is None:
+            connector = aiohttp.TCPConnector(limit=self.CONNECTIONS, keepalive_timeout=30)
+            self._session = aiohttp.ClientSession(connector=connector)
+            self._in_flight = asyncio.Semaphore(self.CONNECTIONS)
+
+    def close(self) -> None:
+        """Closes the connection pool and the event loop."""
+        if self._session is not None:
+            self._run(self._session.close())
+            self._session = None
+
+        self._loop.close()
+
+    def fetch_roundlist_to_offset(self, offset_end: int) -> list:
+        """Fetches list of rounds newer than a specified offset, newest first and without duplicates."""
+        return self._run(self._fetch_roundlist_to_offset(offset_end))
+
+    def fetch_roundlist_window(
+        self, offset_start: int, offset_end: int, head_page: list | None = None
+    ) -> list:
+        """Concurrently fetches every roundlist page between two round_ids. See `APIFetch.fetch_roundlist_window`."""
+        return self._run(self._fetch_roundlist_window(offset_start, offset_end, head_page))
+
+    async def _fetch_roundlist_to_offset(self, offset_end: int) -> list:
+        head_page = await self._get(self.roundlist_endpoint + "0")
+
+        return await self._fetch_roundlist_window(head_page[-1]["round_id"], offset_end, head_page)
+
+    async def _fetch_roundlist_window(
+        self, offset_start: int, offset_end: int, head_page: list | None = None
+    ) -> list:
+        if head_page is None:
+            head_page = await self._get(self.roundlist_endpoint + str(offset_start))
+
+        metadata_index = {entry["round_id"]: entry for entry in head_page}
+
+        offsets = APIFetch._window_offsets(offset_start, offset_end, len(head_page))
+
+        pages = await _gather(
+            *(self._get(self.roundlist_endpoint + str(offset)) for offset in offsets)
+        )
+
+        for page in pages:
+            for entry in page:
+                metadata_index[entry["round_id"]] = entry
+
+        return [
+            metadata_index[round_id]
+            for round_id in sorted(metadata_index, reverse=True)
+            if round_id > offset_end
+        ]
+
+    def fetch_most_recent_round_id(self) -> int:
+        """Gets the most recently completed round from the API."""
+        return self._run(self._get("/roundlist?offset=0"))[0]["round_id"]
+
+    def fetch_roundlist_head(self, conditional: bool = False) -> list | None:
+        """Fetches the newest roundlist page, bypassing the cache. See `APIFetch.fetch_roundlist_head`."""
+        return self._run(self._get(self.roundlist_endpoint + "0", conditional=conditional))
+
+    def fetch_round_data_bulk(self, round_id_list: list[int], failures: dict | None = None) -> tuple:
+        """Fetches playercount and blackbox data from provided round id list.
+
+        Args:
+            round_id_list (list[int]): list of round ids to query
+            failures (dict | None, optional): If provided, each round succeeds or fails on its own: the exception of a failed round is stored under its round_id and both of its responses are None. Once a request is still rate limited after `max_retries` retries, the rounds still in flight are cancelled and fail with that RateLimitError too, so the rounds already fetched are kept and the rest are left for a later run. Otherwise the first failure is raised and the other requests are cancelled. Defaults to None.
+
+        Returns:
+            tuple: playercount_list and raw_blackbox_list responses
+        """
+        self._log.info("Starting async get...")
+
+        playercount_list, raw_blackbox_list = self._run(
+            self._fetch_rounds(round_id_list, failures)
+        )
+
+        self._log.info(
+            f"Successfully got playercount and blackbox lists with lens: {len(playercount_list)}, {len(raw_blackbox_list)}"
+        )
+
+        return playercount_list, raw_blackbox_list
+
+    async def _fetch_round(self, round_id: int, failures: dict | None) -> tuple:
+        """Schedules both endpoints of one round together."""
+        try:
+            return await _gather(
+                self._get(self.playercounts_endpoint + str(round_id)),
+                self._get(self.blackbox_endpoint + str(round_id)),
+            )
+        except RateLimitError:
+            raise
+        except Exception as e:
+            if failures is None:
+                raise
+
+            failures[round_id] = e
+            return None, None
+
+    async def _fetch_rounds(self, round_id_list: list[int], failures: dict | None = None) -> tuple[list, list]:
+        tasks = []
+
+        try:
+            async with asyncio.TaskGroup() as group:
+                tasks = [group.create_task(self._fetch_round(round_id, failures)) for round_id in round_id_list]
+
+        except BaseExceptionGroup as group_error:
+            error = group_error.exceptions[0]
+
+            # only a RateLimitError gets out of an isolated round, anything else is a bug and stays fatal
+            if failures is None or not isinstance(error, RateLimitError):
+                raise error from None
+
+            # the first give-up cancelled every round still in flight, they're left for a later run like the rate limited one
+            for round_id, task in zip(round_id_list, tasks):
+                if task.cancelled() or task.exception() is not None:
+                    failures[round_id] = error
+
+            rate_limited = sum(isinstance(e, RateLimitError) for e in failures.values())
+            self._log.warning(f"Gave up on {rate_limited} rate limited rounds, they are left for a later run")
+
+        if failures:
+            self._log.warning(f"{len(failures)} of {len(round_id_list)} rounds failed to fetch")
+
+        # tasks are in the order of round_id_list
+        round_results = [
+            (None, None) if task.cancelled() or task.exception() is not None else task.result()
+            for task in tasks
+        ]
+
+        playercount_list = [playercounts for playercounts, _ in round_results]
+        raw_blackbox_list = [blackbox for _, blackbox in round_results]
+
+        return playercount_list, raw_blackbox_list
+
+    async def _get(self, endpoint: str, conditional: bool = False) -> dict | list | None:
+        """
+        Async HTTP GET wrapper with the same retry and error semantics as `APIFetch._get`. Returns json response.
+        Args:
+            endpoint (str): full endpoint (+ round id) to query.
+                ex: /metadata/12345
+            conditional (bool, optional): Skip the cache and send the ETag / Last-Modified of the previous response, a 304 returns None. Defaults to False.
+
+        Raises:
+            RateLimitError: HTTP status code 429 was still returned after `max_retries` retries.
+            RoundNotFoundError: Either the URL queried was incorrect or the round is still ongoing.
+            CacheMissError: offline and the endpoint isn't cached.
+
+        Returns:
+            dict | list | None: deserialized json response, None if a conditional request wasn't modified
+        """
+        conditional = conditional and not self.OFFLINE
+
+        if self._cache is not None and not conditional:
+            content = self._cache.get(endpoint, ignore_ttl=self.OFFLINE)
+
+            if content is not None:
+                API_CACHE_HITS.inc(endpoint=endpoint_label(endpoint))
+                return loads(content)
+
+            if self.OFFLINE:
+                raise CacheMissError(endpoint)
+
+        await self._open()
+
+        full_url = self.base_url + endpoint
+        route = endpoint_label(endpoint)
+
+        async with self._in_flight:
+            for attempt in range(self.MAX_RETRIES + 1):
+                await self._limiter.acquire_async()
+
+                start = self._loop.time()
+
+                headers = self._validators.get(endpoint) if conditional else None
+
+                async with self._session.get(full_url, headers=headers) as response:
+                    if response.status == 429:
+                        API_REQUEST_SECONDS.observe(self._loop.time() - start, endpoint=route, status=429)
+                        API_RATE_LIMITED.inc(endpoint=route)
+
+                        delay = self._limiter.backoff(attempt, response.headers)
+
+                        if attempt == self.MAX_RETRIES:
+                            self._log.error(f"Rate limited on endpoint {endpoint} after {attempt} retries")
+                            raise RateLimitError(retry_after=delay)
+
+                        self._log.warning(f"Rate limited on endpoint {endpoint}, retrying in {delay:.1f} sec (attempt {attempt + 1}/{self.MAX_RETRIES})")
+                        self._limiter.pause(delay)
+                        continue
+
+                    if response.status >= 400 or response.status == 304:
+                        API_REQUEST_SECONDS.observe(self._loop.time() - start, endpoint=route, status=response.status)
+
+                    if conditional and response.status == 304:
+                        self._limiter.update(response.headers, self._loop.time() - start)
+                        return None
+
+                    if response.status == 404:
+                        self._log.critical(f"Received 404 from endpoint {endpoint}")
+                        raise RoundNotFoundError
+
+                    response.raise_for_status()
+
+                    content = await response.read()
+
+                    try:
+                        data_json = loads(content)
+                    except ValueError:
+                        self._log.exception(f"Error in decoding JSON response from endpoint {endpoint}")
+                        data_json = None
+
+                    if self._cache is not None and data_json is not None:
+                        self._cache.put(endpoint, content)
+
+                    if conditional:
+                        self._validators[endpoint] = APIFetch._validators_from(response.headers)
+
+                    elapsed = self._loop.time() - start
+                    self._limiter.update(response.headers, elapsed)
+
+                    API_REQUEST_SECONDS.observe(elapsed, endpoint=route, status=response.status)
+                    API_RESPONSE_BYTES.inc(len(content), endpoint=route)
+
+                    self._log.info(
+                        f"Successful GET/deserialize of endpoint\t{endpoint}\t{elapsed} sec\tratelimit remaining: {response.headers.get('X-Rate-Limit-Remaining')}"
+                    )
+
+                    return data_json
@@ -0,0 +1,17 @@
+import os
+import tempfile
+
+
+def write_atomic(path: str, data: bytes) -> None:
+    """Writes to a temp file next to `path` and renames it into place, so readers never see a partial file"""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
@@ -0,0 +1,101 @@
+import hashlib
+import json
+import logging
+import os
+import time
+import zlib
+from .atomic import write_atomic
+
+
+class ResponseCache:
+    def __init__(self, cache_dir: str, roundlist_ttl: float = 60.0, compression_level: int = 6) -> None:
+        """Persistent, compressed, content-addressed store of raw API responses.
+
+        Response bodies are zlib-compressed and stored once under the sha256 of their content in `objects/`.
+        Each endpoint gets a small ref file in `refs/` pointing at its current object and recording when it was fetched,
+        so identical payloads are stored once and a ref can be swapped atomically.
+
+        Completed rounds never change, so everything except the `/roundlist` head is cached indefinitely.
+
+        Args:
+            cache_dir (str): Directory to keep the cache in, created if missing.
+            roundlist_ttl (float, optional): Seconds a `/roundlist` page stays fresh. Defaults to 60.0.
+            compression_level (int, optional): zlib compression level. Defaults to 6.
+        """
+        self._log = logging.getLogger(__name__)
+        self.cache_dir = cache_dir
+        self.ROUNDLIST_TTL = roundlist_ttl
+        self.COMPRESSION_LEVEL = compression_level
+
+        self._objects_dir = os.path.join(cache_dir, "objects")
+        self._refs_dir = os.path.join(cache_dir, "refs")
+
+        os.makedirs(self._objects_dir, exist_ok=True)
+        os.makedirs(self._refs_dir, exist_ok=True)
+
+    def ttl_for(self, endpoint: str) -> float | None:
+        """Seconds an endpoint stays fresh, None if it never expires"""
+        if endpoint.startswith("/roundlist"):
+            return self.ROUNDLIST_TTL
+        return None
+
+    @staticmethod
+    def _sharded_path(base_dir: str, digest: str) -> str:
+        return os.path.join(base_dir, digest[:2], digest)
+
+    def _ref_path(self, endpoint: str) -> str:
+        return self._sharded_path(self._refs_dir, hashlib.sha256(endpoint.encode()).hexdigest())
+
+    def get(self, endpoint: str, ignore_ttl: bool = False) -> bytes | None:
+        """Returns the cached response body of an endpoint, or None if it's missing or expired.
+
+        Args:
+            endpoint (str): endpoint as passed to `APIFetch._get`. ex: /blackbox/12345
+            ignore_ttl (bool, optional): Return expired entries too, used for offline replay. Defaults to False.
+        """
+        try:
+            with open(self._ref_path(endpoint), "rb") as f:
+                ref = json.loads(f.read())
+
+            ttl = self.ttl_for(endpoint)
+
+            if not ignore_ttl and ttl is not None and time.time() - ref["fetched_at"] > ttl:
+                return None
+
+            with open(self._sharded_path(self._objects_dir, ref["object"]), "rb") as f:
+                return zlib.decompress(f.read())
+
+        except FileNotFoundError:
+            return None
+
+        except (ValueError, KeyError, zlib.error):
+            self._log.warning(f"Ignoring corrupt cache entry for endpoint {endpoint}")
+            return None
+
+    def endpoints(self, prefix: str = "") -> list[str]:
+        """Lists every cached endpoint starting with `prefix`, ex: `/blackbox/`"""
+        endpoint_list = []
+
+        for shard in os.scandir(self._refs_dir):
+            for ref_entry in os.scandir(shard.path):
+                try:
+                    with open(ref_entry.path, "rb") as f:
+                        endpoint = json.loads(f.read())["endpoint"]
+                except (ValueError, KeyError):
+                    continue
+
+                if endpoint.startswith(prefix):
+                    endpoint_list.append(endpoint)
+
+        return endpoint_list
+
+    def put(self, endpoint: str, content: bytes) -> None:
+        """Stores a response body and points the endpoint's ref at it"""
+        digest = hashlib.sha256(content).hexdigest()
+        object_path = self._sharded_path(self._objects_dir, digest)
+
+        if not os.path.exists(object_path):
+            write_atomic(object_path, zlib.compress(content, self.COMPRESSION_LEVEL))
+
+        ref = {"endpoint": endpoint, "object": digest, "fetched_at": time.time()}
+        write_atomic(self._ref_path(endpoint), json.dumps(ref).encode())
@@ -1,32 +1,161 @@
+import atexit
+import hashlib
+import json
 import logging
-from sqlalchemy import create_engine, select
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from psycopg.types.json import Jsonb
+from sqlalchemy import bindparam, case, create_engine, delete, func, literal_column, select, text, union_all, update
 from sqlalchemy.orm import Session
-from sqlalchemy.dialects.postgresql import insert
-from .models import round_table, metadata_table, db_metadata
+from sqlalchemy.dialects.postgresql import JSONB, insert
+from .metrics import DB_COMMIT_SECONDS, DB_ROWS, DB_ROWS_PER_SECOND, DB_ROWS_UNCHANGED, DB_WORKER_ROWS_PER_SECOND
+from .atomic import write_atomic
+from .transform import TransformData
+from .models import (
+    round_table,
+    metadata_table,
+    dead_letter_table,
+    sync_state_table,
+    sync_gap_table,
+    raw_payload_table,
+    fact_tables,
+    db_metadata,
+    round_partition_name,
+)
+
+try:
+    from psycopg_pool import ConnectionPool
+except ImportError:  # optional, only needed for the pool load method
+    ConnectionPool = None
+
+# one engine, and so one connection pool, per database for the whole process
+_engines = {}
+
+
+def _get_engine(db_uri: str):
+    engine = _engines.get(db_uri)
+
+    if engine is None:
+        engine = _engines[db_uri] = create_engine(db_uri, echo=False)
+
+    return engine
 
 
 class DatabaseLoader:
-    def __init__(self, config, chunksize: int = 1000) -> None:
+    def __init__(
+        self,
+        config,
+        chunksize: int = 1000,
+        retry_base_delay: int = 300,
+        retry_max_delay: int = 86400,
+        pending_retry_delay: int = 600,
+        pending_max_attempts: int = 36,
+        load_method: str = "insert",
+        pool_size: int = 4,
+    ) -> None:
         """Handler for interacting with database.
 
         Args:
             config (Config): Pulls target table, schema, and DB URI from set env vars.
             chunksize (int, optional): Number of rows to push to database at a time. Larger batches will hit the Postgre upload limit and be generally error-prone and unperformant. Defaults to 1000.
+            retry_base_delay (int, optional): Seconds before a dead-lettered round is retried after its first failure, doubled on every further failure. Defaults to 300.
+            retry_max_delay (int, optional): Upper bound on the retry delay in seconds. Defaults to 86400.
+            pending_retry_delay (int, optional): Fixed retry delay in seconds for rounds whose data 404'd, which usually means the round is still in progress. Defaults to 600.
+            pending_max_attempts (int, optional): Attempts after which a pending round is backed off like any other failure. Defaults to 36.
+            load_method (str, optional): Default upload path, `insert` for chunked multi-row INSERTs or `copy` for COPY into a staging table followed by one merge, or `pool` for chunks upserted in parallel over a connection pool. Can be overridden per call. Defaults to "insert".
+            pool_size (int, optional): Connections, and so chunks in flight at once, of the `pool` load method. Defaults to 4.
         """
         self._log = logging.getLogger(__name__)
         self.db_uri = config.db_uri
         self.db_ods_schema = config.db_ods_schema
 
         self.CHUNKSIZE = chunksize
-        self.engine = create_engine(self.db_uri, echo=False)
+        self.RETRY_BASE_DELAY = retry_base_delay
+        self.RETRY_MAX_DELAY = retry_max_delay
+        self.PENDING_RETRY_DELAY = pending_retry_delay
+        self.PENDING_MAX_ATTEMPTS = pending_max_attempts
+        self.LOAD_METHOD = load_method
+        self.POOL_SIZE = pool_size
+        self.SCHEMA_CACHE_FILE = config.db_schema_cache_file
+        self.ROUNDS_PARTITION_SIZE = config.db_rounds_partition_size
+        self.engine = _get_engine(self.db_uri)
         self.db_metadata = db_metadata
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        # (lower, upper) round_id bounds of the rounds table's partitions, read from the catalog on first use
+        self._round_partitions = None
 
         # FIXME: shouldn't have to specify the tables list here since they're already registed to the same metadata object that we're importing from the other file
-        self.db_metadata.create_all(bind=self.engine, tables=[round_table, metadata_table])
+        self.tables = [
+            round_table,
+            metadata_table,
+            dead_letter_table,
+            sync_state_table,
+            sync_gap_table,
+            raw_payload_table,
+            *fact_tables.values(),
+        ]
+
+        self.db_create_schema()
+
+    def _schema_fingerprint(self) -> str:
+        """Hash of every table's columns, types and indexes as declared in models.py"""
+        digest = hashlib.sha256()
+
+        for table in self.tables:
+            digest.update(repr(table).encode())
+
+            for index in sorted(table.indexes, key=lambda index: index.name):
+                digest.update(repr(index).encode())
+
+        return digest.hexdigest()
+
+    def _read_schema_cache(self) -> dict:
+        try:
+            with open(self.SCHEMA_CACHE_FILE) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def db_create_schema(self, use_cache: bool = True) -> bool:
+        """
+        Creates the tables and indexes that don't exist yet. create_all costs a few catalog queries per table, so once it has
+        run against a database and schema, the fingerprint of the models is cached in SCHEMA_CACHE_FILE and later runs with
+        unchanged models skip it. Tables dropped behind its back are only recreated by `migrate` or after deleting the file.
+
+        Args:
+            use_cache (bool, optional): Skip create_all when the cached fingerprint matches. Defaults to True.
+
+        Returns:
+            bool: whether create_all ran
+        """
+        # the password isn't needed to tell databases apart and has no business in a cache file
+        target = f"{self.engine.url.render_as_string(hide_password=True)}#{self.db_ods_schema}"
+        fingerprint = self._schema_fingerprint()
+
+        if use_cache and self.SCHEMA_CACHE_FILE and self._read_schema_cache().get(target) == fingerprint:
+            self._log.debug(f"Schema of {target} matches the cached fingerprint, skipping create_all")
+            return False
 
-    def __upsert_to_database(self, data_list: list, target_table) -> str:
+        self.db_metadata.create_all(bind=self.engine, tables=self.tables)
+
+        if self.SCHEMA_CACHE_FILE:
+            schema_cache = self._read_schema_cache()
+            schema_cache[target] = fingerprint
+
+            try:
+                write_atomic(self.SCHEMA_CACHE_FILE, json.dumps(schema_cache, indent=2).encode())
+            except OSError as e:
+                self._log.warning(f"Couldn't write the schema cache {self.SCHEMA_CACHE_FILE}: {e}")
+
+        return True
+
+    def __upsert_to_database(self, data_list: list, target_table) -> int:
         """
         Upserts values to specified table. Chunking algorithm partially derived from the Pandas to_sql() implementation.
+        Returns the number of rows written, rows whose content hash didn't change aren't.
 
         """
         self._log.info(
@@ -58,31 +187,701 @@ class DatabaseLoader:
                 update_stmt = insert_stmt.on_conflict_do_update(
                     index_elements=["round_id"], 
                     set_=update_cols,
+                    # a row that changed since the hash check still goes through, an identical one isn't rewritten
+                    where=target_table.c["content_hash"].is_distinct_from(insert_stmt.excluded.content_hash),
                 )
 
-                session.execute(update_stmt)
+                chunk_start = time.perf_counter()
 
-                inserted_rowcount += chunk_iter_len
+                # rowcount isn't kept for INSERTs, rows skipped by the content hash guard aren't returned
+                inserted_rowcount += len(session.execute(update_stmt.returning(target_table.c["round_id"])).all())
 
                 session.commit()
+
+                DB_COMMIT_SECONDS.observe(time.perf_counter() - chunk_start, table=target_table.name, method="insert")
                 
                 self._log.info(
                     f"Chunk of len {chunk_iter_len} successfully committed, {num_chunks - i} to go"
                 )
 
-        result_statement = f"Inserted {inserted_rowcount} rows into {target_table}"
+        return inserted_rowcount
+
+    def __copy_to_database(self, data_list: list, target_table) -> int:
+        """
+        Upserts values to specified table by streaming them with COPY into a temporary staging table, then merging the staging table in with a single INSERT ... ON CONFLICT DO UPDATE.
+        Skips statement compilation and parameter binding entirely, so there's no chunk size to tune. Requires the psycopg (3) driver.
+        Returns the number of rows written.
+
+        """
+        self._log.info(
+            f"Starting COPY upsert against {target_table} with list of len {len(data_list)}"
+        )
+
+        preparer = self.engine.dialect.identifier_preparer
+        target = preparer.format_table(target_table)
+        staging = preparer.quote(f"{target_table.name}_staging")
+
+        # columns with a server default, ex: loaded_at, are filled in by the staging table
+        columns = [col.name for col in target_table.columns if col.server_default is None]
+        jsonb_columns = {col.name for col in target_table.columns if isinstance(col.type, JSONB)}
+        copy_column_list = ", ".join(preparer.quote(col) for col in columns)
+        column_list = ", ".join(preparer.quote(col.name) for col in target_table.columns)
+
+        update_list = ", ".join(
+            f"{preparer.quote(col.name)} = EXCLUDED.{preparer.quote(col.name)}"
+            for col in target_table.columns
+            if col.name != "round_id"
+        )
+        unchanged_guard = f"WHERE {target}.content_hash IS DISTINCT FROM EXCLUDED.content_hash"
+
+        connection = self.engine.raw_connection()
+        merge_start = time.perf_counter()
+
+        try:
+            with connection.cursor() as cursor:
+                if not hasattr(cursor, "copy"):
+                    raise ValueError("COPY loading requires the psycopg driver, use a postgresql+psycopg:// URI")
+
+                cursor.execute(
+                    f"CREATE TEMPORARY TABLE {staging} (LIKE {target} INCLUDING DEFAULTS) ON COMMIT DROP"
+                )
+
+                with cursor.copy(f"COPY {staging} ({copy_column_list}) FROM STDIN") as copy:
+                    # the last row of a round_id wins, a duplicate in the batch would fail the merge
+                    for row in {row["round_id"]: row for row in data_list}.values():
+                        copy.write_row(
+                            [
+                                Jsonb(row.get(col)) if col in jsonb_columns and row.get(col) is not None else row.get(col)
+                                for col in columns
+                            ]
+                        )
+
+                cursor.execute(
+                    f"INSERT INTO {target} ({column_list}) "
+                    f"SELECT {column_list} FROM {staging} "
+                    f"ON CONFLICT (round_id) DO UPDATE SET {update_list} {unchanged_guard}"
+                )
+
+                inserted_rowcount = cursor.rowcount
+
+            connection.commit()
+
+        except BaseException:
+            connection.rollback()
+            raise
+
+        finally:
+            connection.close()
+
+        DB_COMMIT_SECONDS.observe(time.perf_counter() - merge_start, table=target_table.name, method="copy")
+
+        self._log.info(f"COPY merge of {inserted_rowcount} rows successfully committed")
+
+        return inserted_rowcount
+
+    def _get_pool(self):
+        """The psycopg connection pool of the `pool` load method, opened on first use and closed at exit"""
+        with self._pool_lock:
+            if self._pool is None:
+                if ConnectionPool is None:
+                    raise ImportError("Pooled loading requires psycopg_pool, install psycopg with the `pool` extra")
+
+                # libpq takes the SQLAlchemy URI once the +driver suffix is gone
+                conninfo = self.engine.url.set(drivername="postgresql").render_as_string(hide_password=False)
+
+                self._pool = ConnectionPool(
+                    conninfo, min_size=self.POOL_SIZE, max_size=self.POOL_SIZE, name="para_stats-load", open=True
+                )
+                atexit.register(self.db_close_pool)
+
+        return self._pool
+
+    def db_close_pool(self) -> None:
+        """Closes the connection pool of the `pool` load method, if it was ever opened"""
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.close()
+                self._pool = None
+
+    def __pool_upsert_to_database(self, data_list: list, target_table) -> int:
+        """
+        Upserts values to specified table over several pooled connections at once. The rows are split into round_id ranges that
+        don't overlap, so no two connections ever wait on each other's row locks, and every chunk goes out as one pipelined
+        executemany and its own commit. Throughput is logged and recorded per worker thread. Returns the number of rows written.
+
+        """
+        self._log.info(
+            f"Starting pooled upsert against {target_table} with list of len {len(data_list)} over {self.POOL_SIZE} connections"
+        )
+
+        # the last row of a round_id wins, like in the COPY merge, sorted so chunks are disjoint ranges
+        rows = sorted({row["round_id"]: row for row in data_list}.values(), key=lambda row: row["round_id"])
+
+        if not rows:
+            return 0
+
+        preparer = self.engine.dialect.identifier_preparer
+        target = preparer.format_table(target_table)
+
+        # columns with a server default, ex: loaded_at, take it on insert and from EXCLUDED on update
+        columns = [col.name for col in target_table.columns if col.server_default is None]
+        jsonb_columns = {col.name for col in target_table.columns if isinstance(col.type, JSONB)}
+        column_list = ", ".join(preparer.quote(col) for col in columns)
+
+        update_list = ", ".join(
+            f"{preparer.quote(col.name)} = EXCLUDED.{preparer.quote(col.name)}"
+            for col in target_table.columns
+            if col.name != "round_id"
+        )
+
+        upsert_stmt = (
+            f"INSERT INTO {target} ({column_list}) VALUES ({', '.join(['%s'] * len(columns))}) "
+            f"ON CONFLICT (round_id) DO UPDATE SET {update_list} "
+            f"WHERE {target}.content_hash IS DISTINCT FROM EXCLUDED.content_hash"
+        )
+
+        # small batches are still spread over every connection
+        chunksize = min(self.CHUNKSIZE, -(-len(rows) // self.POOL_SIZE))
+        chunks = [rows[i : i + chunksize] for i in range(0, len(rows), chunksize)]
+
+        pool = self._get_pool()
+        # rows and busy seconds per worker, each worker holds one pooled connection at a time
+        throughput = {}
+
+        def upsert_chunk(chunk: list) -> int:
+            worker = threading.current_thread().name.rsplit("_", 1)[-1]
+            chunk_start = time.perf_counter()
+
+            with pool.connection() as connection, connection.cursor() as cursor:
+                with connection.pipeline():
+                    cursor.executemany(
+                        upsert_stmt,
+                        [
+                            [
+                                Jsonb(row.get(col)) if col in jsonb_columns and row.get(col) is not None else row.get(col)
+                                for col in columns
+                            ]
+                            for row in chunk
+                        ],
+                    )
+
+                # summed over the statements of the executemany as their results come in, complete once the pipeline synced
+                written_rowcount = cursor.rowcount
+
+                connection.commit()
+
+            elapsed = time.perf_counter() - chunk_start
+            DB_COMMIT_SECONDS.observe(elapsed, table=target_table.name, method="pool")
+
+            worker_rows, worker_seconds = throughput.get(worker, (0, 0.0))
+            throughput[worker] = (worker_rows + len(chunk), worker_seconds + elapsed)
+
+            self._log.info(
+                f"Chunk of len {len(chunk)} from round_id {chunk[0]['round_id']} to {chunk[-1]['round_id']} committed by worker {worker}"
+            )
+
+            return written_rowcount
+
+        with ThreadPoolExecutor(max_workers=self.POOL_SIZE, thread_name_prefix="db-pool") as executor:
+            # sum() re-raises the first failed chunk, chunks committed before it stay committed like the insert path's
+            inserted_rowcount = sum(executor.map(upsert_chunk, chunks))
+
+        for worker, (worker_rows, worker_seconds) in sorted(throughput.items()):
+            if worker_seconds > 0:
+                DB_WORKER_ROWS_PER_SECOND.set(worker_rows / worker_seconds, table=target_table.name, worker=worker)
+
+            self._log.info(
+                f"Worker {worker} upserted {worker_rows} rows in {worker_seconds:.2f} sec ({worker_rows / max(worker_seconds, 1e-9):.0f} rows/sec)"
+            )
+
+        return inserted_rowcount
+
+    def db_fetch_content_hashes(self, target_table, round_id_list: list[int]) -> dict:
+        """Returns round_id to stored content_hash for the rounds of `round_id_list` that are already in `target_table`"""
+        if not round_id_list:
+            return {}
+
+        stmt = select(target_table.c["round_id"], target_table.c["content_hash"]).where(
+            target_table.c["round_id"].in_(round_id_list)
+        )
+
+        with Session(self.engine) as session:
+            return dict(session.execute(stmt).fetchall())
+
+    def _skip_unchanged(self, data_list: list, target_table) -> list:
+        """Drops the rows whose content hash is already stored, filling in the hash of rows that come without one"""
+        for row in data_list:
+            if not row.get("content_hash"):
+                row["content_hash"] = TransformData.content_hash(row)
+
+        stored_hashes = self.db_fetch_content_hashes(target_table, [row["round_id"] for row in data_list])
+        changed_list = [row for row in data_list if stored_hashes.get(row["round_id"]) != row["content_hash"]]
+
+        unchanged_rowcount = len(data_list) - len(changed_list)
+
+        if unchanged_rowcount:
+            DB_ROWS_UNCHANGED.inc(unchanged_rowcount, table=target_table.name)
+            self._log.info(f"Skipping {unchanged_rowcount} unchanged rows of {target_table}")
+
+        return changed_list
+
+    def db_round_partitions(self) -> list[tuple[str, int, int]] | None:
+        """Returns name, lower and upper round_id bound of each partition of the rounds table in round_id order, or None when it isn't partitioned"""
+        with self.engine.connect() as connection:
+            relkind = connection.execute(
+                text(
+                    "SELECT c.relkind FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace "
+                    "WHERE n.nspname = :schema AND c.relname = :table"
+                ),
+                {"schema": round_table.schema, "table": round_table.name},
+            ).scalar()
+
+            if relkind != "p":
+                return None
+
+            result = connection.execute(
+                text(
+                    "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) FROM pg_inherits i "
+                    "JOIN pg_class c ON c.oid = i.inhrelid "
+                    "JOIN pg_class p ON p.oid = i.inhparent "
+                    "JOIN pg_namespace n ON n.oid = p.relnamespace "
+                    "WHERE n.nspname = :schema AND p.relname = :table"
+                ),
+                {"schema": round_table.schema, "table": round_table.name},
+            )
+
+            partitions = []
+
+            for name, bound in result:
+                match = re.search(r"FROM \((-?\d+)\) TO \((-?\d+)\)", bound)
+
+                # a DEFAULT partition has no range of its own
+                if match:
+                    partitions.append((name, int(match.group(1)), int(match.group(2))))
+
+        return sorted(partitions, key=lambda partition: partition[1])
+
+    def db_ensure_round_partitions(self, round_id_list: list[int]) -> int:
+        """
+        Creates the partitions of the rounds table that `round_id_list` falls into and that don't exist yet, one per block of
+        ROUNDS_PARTITION_SIZE round_ids. Blocks are cut short where a partition of an earlier, different size already sits.
+        Does nothing when partitioning is off or the table hasn't been converted by `migrate` yet.
+
+        Returns:
+            int: number of partitions created
+        """
+        if not self.ROUNDS_PARTITION_SIZE or not round_id_list:
+            return 0
+
+        if self._round_partitions is None:
+            partitions = self.db_round_partitions()
+
+            if partitions is None:
+                self._log.warning(f"{round_table.fullname} isn't partitioned yet, run `python main.py migrate` to convert it")
+                self._round_partitions = []
+                self.ROUNDS_PARTITION_SIZE = 0
+                return 0
+
+            self._round_partitions = [(lower, upper) for _, lower, upper in partitions]
+
+        preparer = self.engine.dialect.identifier_preparer
+        target = preparer.format_table(round_table)
+        created_rowcount = 0
+
+        for round_id in sorted(set(round_id_list)):
+            if any(lower <= round_id < upper for lower, upper in self._round_partitions):
+                continue
+
+            lower = round_id // self.ROUNDS_PARTITION_SIZE * self.ROUNDS_PARTITION_SIZE
+            upper = lower + self.ROUNDS_PARTITION_SIZE
+            lower = max([lower, *[bound for _, bound in self._round_partitions if bound <= round_id]])
+            upper = min([upper, *[bound for bound, _ in self._round_partitions if bound > round_id]])
+
+            partition = f"{preparer.quote_schema(round_table.schema)}.{preparer.quote(round_partition_name(round_table.name, lower))}"
+
+            with self.engine.begin() as connection:
+                connection.execute(
+                    text(f"CREATE TABLE IF NOT EXISTS {partition} PARTITION OF {target} FOR VALUES FROM ({lower}) TO ({upper})")
+                )
+
+            self._round_partitions.append((lower, upper))
+            created_rowcount += 1
+
+            self._log.info(f"Created partition {partition} for round_ids {lower} to {upper - 1}")
+
+        return created_rowcount
+
+    def db_maintain_rounds(self, recent_partitions: int = 2) -> list[str]:
+        """
+        Vacuums and analyzes the rounds table. Partitioned, only the newest `recent_partitions` are vacuumed, older ones
+        no longer change, and then the parent is analyzed: autovacuum never does, so without it the planner has no statistics
+        for queries that span partitions.
+
+        Args:
+            recent_partitions (int, optional): newest partitions to vacuum, 0 for all of them. Defaults to 2.
+
+        Returns:
+            list[str]: the tables vacuumed
+        """
+        preparer = self.engine.dialect.identifier_preparer
+        target = preparer.format_table(round_table)
+        partitions = self.db_round_partitions()
+
+        if partitions is None:
+            vacuumed = [target]
+        else:
+            newest = partitions[-recent_partitions:] if recent_partitions else partitions
+            vacuumed = [f"{preparer.quote_schema(round_table.schema)}.{preparer.quote(name)}" for name, _, _ in newest]
+
+        # VACUUM can't run inside a transaction block
+        with self.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+            for table in vacuumed:
+                start = time.perf_counter()
+                connection.execute(text(f"VACUUM (ANALYZE) {table}"))
+                self._log.info(f"Vacuumed {table} in {time.perf_counter() - start:.2f} sec")
+
+            if partitions is not None:
+                connection.execute(text(f"ANALYZE {target}"))
+                self._log.info(f"Analyzed {target}")
+
+        return vacuumed
+
+    def __upload(self, data_list: list, target_table, method: str | None) -> int:
+        """Upserts through the given load method after dropping unchanged rows. Returns the number of rows written."""
+        method = method or self.LOAD_METHOD
+        start = time.perf_counter()
+
+        data_list = self._skip_unchanged(data_list, target_table)
+
+        if target_table is round_table:
+            self.db_ensure_round_partitions([row["round_id"] for row in data_list])
+
+        if method == "insert":
+            written_rowcount = self.__upsert_to_database(data_list, target_table)
+        elif method == "copy":
+            written_rowcount = self.__copy_to_database(data_list, target_table)
+        elif method == "pool":
+            written_rowcount = self.__pool_upsert_to_database(data_list, target_table)
+        else:
+            raise ValueError(f"Unknown load method {method}")
+
+        elapsed = time.perf_counter() - start
+
+        DB_ROWS.inc(len(data_list), table=target_table.name, method=method)
+
+        if data_list and elapsed > 0:
+            DB_ROWS_PER_SECOND.set(len(data_list) / elapsed, table=target_table.name, method=method)
+
+        self._log.info(f"Inserted {written_rowcount} rows into {target_table}")
+
+        return written_rowcount
+
+    def db_upload_rounds(self, round_list: list, method: str | None = None) -> int:
+        """Upserts compiled round data into db rounds table and clears any dead letters they had. `method` overrides the loader's default load_method. Returns the number of rows written, unchanged rounds aren't."""
+        written_rowcount = self.__upload(round_list, round_table, method)
+        self.db_clear_failures([entry["round_id"] for entry in round_list])
+        return written_rowcount
+
+    def db_upload_facts(self, facts: dict, round_id_list: list[int]) -> int:
+        """
+        Replaces the blackbox fact rows of a batch of rounds. Every fact table is cleared for the batch and refilled in one transaction, so a round never shows half its facts and keys removed by a transform fix disappear.
+
+        Args:
+            facts (dict): rows per key_type, as returned by `TransformData.collect_fact_batch`.
+            round_id_list (list[int]): every round in the batch, including rounds that produced no facts.
+
+        Returns:
+            int: number of fact rows inserted
+        """
+        inserted_rowcount = 0
+        start = time.perf_counter()
+
+        with Session(self.engine) as session:
+            for key_type, fact_table in fact_tables.items():
+                session.execute(delete(fact_table).where(fact_table.c["round_id"].in_(round_id_list)))
+
+                rows = facts.get(key_type)
+
+                if rows:
+                    session.execute(insert(fact_table), rows)
+                    inserted_rowcount += len(rows)
+                    DB_ROWS.inc(len(rows), table=fact_table.name, method="insert")
+
+            session.commit()
+
+        DB_COMMIT_SECONDS.observe(time.perf_counter() - start, table="facts", method="insert")
+
+        self._log.info(f"Inserted {inserted_rowcount} fact rows for {len(round_id_list)} rounds")
+
+        return inserted_rowcount
+
+    def db_fetch_round_stats_page(self, limit: int, after_round_id: int = 0) -> list[dict]:
+        """Returns round_id and stats of one page of loaded rounds in ascending round_id order, keyset paginated for backfills"""
+        with Session(self.engine) as session:
+            stmt = (
+                select(round_table.c["round_id"], round_table.c["stats"])
+                .where(round_table.c["round_id"] > after_round_id)
+                .order_by(round_table.c["round_id"])
+                .limit(limit)
+            )
+
+            round_list = [dict(row) for row in session.execute(stmt).mappings()]
+
+        return round_list
+
+    def db_land_raw_payloads(self, payload_list: list[dict]) -> None:
+        """Upserts raw payload rows, as packed by `TransformData.collect_raw_payload_batch`, into the landing table"""
+        if not payload_list:
+            return
+
+        insert_stmt = insert(raw_payload_table).values(landed_at=func.now())
+        upsert_stmt = insert_stmt.on_conflict_do_update(
+            index_elements=["round_id"],
+            set_={
+                "playercounts": insert_stmt.excluded.playercounts,
+                "blackbox": insert_stmt.excluded.blackbox,
+                "transform_version": insert_stmt.excluded.transform_version,
+                "landed_at": func.now(),
+            },
+        )
+        start = time.perf_counter()
+
+        with Session(self.engine) as session:
+            session.execute(upsert_stmt, payload_list)
+            session.commit()
+
+        DB_ROWS.inc(len(payload_list), table=raw_payload_table.name, method="insert")
+        DB_COMMIT_SECONDS.observe(time.perf_counter() - start, table=raw_payload_table.name, method="insert")
+
+    def db_fetch_stale_raw_page(
+        self,
+        limit: int,
+        transform_version: int | None,
+        after_round_id: int = 0,
+        end_round_id: int | None = None,
+    ) -> list[dict]:
+        """
+        Returns the metadata rows of one page of rounds that have raw payloads but whose rounds row is missing or was built by
+        another transform_version, in ascending round_id order, keyset paginated for reprocessing.
+
+        Args:
+            limit (int): page size.
+            transform_version (int | None): the current TRANSFORM_VERSION, None to return every round with raw payloads.
+            after_round_id (int, optional): only rounds above this round_id. Defaults to 0.
+            end_round_id (int | None, optional): only rounds up to and including this round_id. Defaults to None (no upper bound).
+        """
+        stmt = (
+            select(metadata_table)
+            .join(raw_payload_table, raw_payload_table.c["round_id"] == metadata_table.c["round_id"])
+            .outerjoin(round_table, round_table.c["round_id"] == metadata_table.c["round_id"])
+            .where(metadata_table.c["round_id"] > after_round_id)
+            .order_by(metadata_table.c["round_id"])
+            .limit(limit)
+        )
+
+        if transform_version is not None:
+            stmt = stmt.where(round_table.c["transform_version"].is_distinct_from(transform_version))
+
+        if end_round_id is not None:
+            stmt = stmt.where(metadata_table.c["round_id"] <= end_round_id)
+
+        with Session(self.engine) as session:
+            metadata_list = [dict(row) for row in session.execute(stmt).mappings()]
+
+        return metadata_list
+
+    def db_fetch_raw_payloads(self, round_id_list: list[int]) -> dict:
+        """Returns round_id to its unpacked (playercounts, blackbox) responses, for the rounds of `round_id_list` that have raw payloads"""
+        stmt = select(
+            raw_payload_table.c["round_id"], raw_payload_table.c["playercounts"], raw_payload_table.c["blackbox"]
+        ).where(raw_payload_table.c["round_id"].in_(round_id_list))
+
+        with Session(self.engine) as session:
+            return {
+                round_id: (TransformData.unpack_payload(playercounts), TransformData.unpack_payload(blackbox))
+                for round_id, playercounts, blackbox in session.execute(stmt)
+            }
+
+    def db_fetch_playercount_page(self, limit: int, after_round_id: int = 0) -> list[dict]:
+        """Returns round_id and JSONB playercounts of one page of loaded rounds without compact playercounts, keyset paginated for backfills"""
+        with Session(self.engine) as session:
+            stmt = (
+                select(round_table.c["round_id"], round_table.c["playercounts"])
+                .where(
+                    round_table.c["round_id"] > after_round_id,
+                    round_table.c["playercount_deltas"].is_(None),
+                    round_table.c["playercounts"].is_not(None),
+                )
+                .order_by(round_table.c["round_id"])
+                .limit(limit)
+            )
+
+            round_list = [dict(row) for row in session.execute(stmt).mappings()]
+
+        return round_list
+
+    def db_update_playercounts(self, round_list: list[dict]) -> None:
+        """
+        Rewrites only the playercount columns of already loaded rounds, as set by `TransformData.attach_playercounts`. Their
+        content_hash is cleared, the stored row no longer matches it and the next sync of those rounds writes them in full.
+        """
+        if not round_list:
+            return
+
+        columns = ("playercounts", "playercount_start", "playercount_interval", "playercount_deltas")
+
+        stmt = (
+            update(round_table)
+            .where(round_table.c["round_id"] == bindparam("b_round_id"))
+            .values({**{column: bindparam(f"b_{column}") for column in columns}, "content_hash": None})
+        )
+
+        with Session(self.engine) as session:
+            session.connection().execute(
+                stmt,
+                [{f"b_{column}": entry[column] for column in ("round_id", *columns)} for entry in round_list],
+            )
+            session.commit()
+
+    def db_fetch_playercounts(self, round_id_list: list[int]) -> dict:
+        """
+        Reads the playercount series of rounds as NumPy arrays, from the compact columns where a round has them and its JSONB otherwise.
+
+        Returns:
+            dict: round_id to a (timestamps as datetime64[s] UTC, counts as int32) tuple, rounds without playercounts are left out
+        """
+        stmt = select(
+            round_table.c["round_id"],
+            # the JSONB is only pulled (and detoasted) for rounds that have no compact form
+            case((round_table.c["playercount_deltas"].is_(None), round_table.c["playercounts"])),
+            round_table.c["playercount_start"],
+            round_table.c["playercount_interval"],
+            round_table.c["playercount_deltas"],
+        ).where(round_table.c["round_id"].in_(round_id_list))
+
+        series = {}
+
+        with Session(self.engine) as session:
+            for round_id, playercounts, start, interval, deltas in session.execute(stmt):
+                if deltas is None:
+                    compact = TransformData.compact_playercounts(playercounts)
+
+                    if compact is None:
+                        if playercounts:
+                            self._log.warning(f"Playercounts of round {round_id} aren't evenly sampled, left out")
+                        continue
+
+                    start, interval, deltas = compact
+
+                series[round_id] = TransformData.expand_playercounts(start, interval, deltas)
+
+        return series
+
+    def db_record_failures(self, failures: dict, stage: str) -> None:
+        """
+        Upserts failed rounds into the dead-letter table. Each further failure of a round bumps its attempt_count and doubles its retry delay.
+
+        A 404 means the round hasn't finished yet, so those are recorded at stage `pending` and retried every
+        PENDING_RETRY_DELAY seconds instead, until PENDING_MAX_ATTEMPTS is reached.
+
+        Args:
+            failures (dict): exception raised for each failed round_id.
+            stage (str): pipeline stage the rounds failed in, ex: `fetch` or `transform`.
+        """
+        if not failures:
+            return
+
+        rows = []
+
+        for round_id, error in failures.items():
+            http_status = self._failure_http_status(error)
+            is_pending = http_status == 404
+
+            rows.append(
+                {
+                    "round_id": round_id,
+                    "stage": "pending" if is_pending else stage,
+                    "error_class": type(error).__name__,
+                    "error_message": str(error),
+                    "http_status": http_status,
+                    "attempt_count": 1,
+                    "first_failed_at": func.now(),
+                    "last_failed_at": func.now(),
+                    "next_retry_at": func.now() + literal_column("interval '1 second'") * (
+                        self.PENDING_RETRY_DELAY if is_pending else self.RETRY_BASE_DELAY
+                    ),
+                }
+            )
+
+        with Session(self.engine) as session:
+            insert_stmt = insert(dead_letter_table).values(rows)
+
+            retry_delay = case(
+                (
+                    (insert_stmt.excluded["http_status"] == 404)
+                    & (dead_letter_table.c["attempt_count"] < self.PENDING_MAX_ATTEMPTS),
+                    self.PENDING_RETRY_DELAY,
+                ),
+                else_=func.least(
+                    self.RETRY_BASE_DELAY * func.power(2, dead_letter_table.c["attempt_count"]),
+                    self.RETRY_MAX_DELAY,
+                ),
+            )
+
+            update_stmt = insert_stmt.on_conflict_do_update(
+                index_elements=["round_id"],
+                set_={
+                    "stage": insert_stmt.excluded["stage"],
+                    "error_class": insert_stmt.excluded["error_class"],
+                    "error_message": insert_stmt.excluded["error_message"],
+                    "http_status": insert_stmt.excluded["http_status"],
+                    "attempt_count": dead_letter_table.c["attempt_count"] + 1,
+                    "last_failed_at": func.now(),
+                    "next_retry_at": func.now() + literal_column("interval '1 second'") * retry_delay,
+                },
+            )
+
+            session.execute(update_stmt)
+            session.commit()
+
+        self._log.warning(f"Recorded {len(failures)} failed rounds in {dead_letter_table} at stage {stage}")
+
+    def db_clear_failures(self, round_id_list: list[int]) -> None:
+        """Removes rounds from the dead-letter table once they've been loaded"""
+        with Session(self.engine) as session:
+            session.execute(
+                delete(dead_letter_table).where(dead_letter_table.c["round_id"].in_(round_id_list))
+            )
+            session.commit()
+
+    @staticmethod
+    def _failure_http_status(error: Exception) -> int | None:
+        """Best-effort HTTP status of a failed request"""
+        status = getattr(error, "http_status", None)
+
+        if status is None:
+            response = getattr(error, "response", None)
+            status = getattr(response, "status_code", None)
 
-        return result_statement
+        if status is None:
+            # aiohttp.ClientResponseError
+            status = getattr(error, "status", None)
 
-    def db_upload_rounds(self, round_list: list) -> str:
-        """Upserts compiled round data into db rounds table"""
-        result = self.__upsert_to_database(round_list, round_table)
-        return result
+        return status
 
-    def db_upload_metadata(self, metadata_list: list) -> str:
-        """Upserts compiled metadata into db metadata table"""
-        result = self.__upsert_to_database(metadata_list, metadata_table)
-        return result
+    @staticmethod
+    def _retry_pending():
+        """EXISTS clause matching metadata rows whose dead letter isn't due for a retry yet"""
+        return (
+            select(dead_letter_table.c["round_id"])
+            .where(dead_letter_table.c["round_id"] == metadata_table.c["round_id"])
+            .where(dead_letter_table.c["next_retry_at"] > func.now())
+        ).exists()
+
+    def db_upload_metadata(self, metadata_list: list, method: str | None = None) -> int:
+        """Upserts compiled metadata into db metadata table. `method` overrides the loader's default load_method. Returns the number of rows written."""
+        written_rowcount = self.__upload(metadata_list, metadata_table, method)
+        return written_rowcount
 
     def db_fetch_round_ids(self) -> list[int]:
         """Pulls all round_id entries from db metadata table, sorted high to low"""
@@ -103,23 +902,57 @@ class DatabaseLoader:
 
         return round_id_list
 
-    def db_fetch_metadata_difference(self) -> list[dict]:
+    def _metadata_difference_stmt(self, above_round_id: int | None = None, before_round_id: int | None = None):
+        """
+        Builds the query for metadata rows without a partner in the rounds table, newest first.
+
+        With `above_round_id` (the rounds watermark) only the metadata above it is anti-joined against the rounds
+        table. Below it, only dead-lettered rounds whose retry is due are returned, so the cost follows the number
+        of new and retryable rounds instead of the size of either table.
+        """
+        loaded_stmt = (
+            select(round_table.c["round_id"])
+            .where(round_table.c["round_id"] == metadata_table.c["round_id"])
+        ).exists()
+
+        # binary negation for NOT EXISTS
+        new_stmt = select(metadata_table).where(~loaded_stmt).where(~self._retry_pending())
+
+        if before_round_id is not None:
+            new_stmt = new_stmt.where(metadata_table.c["round_id"] < before_round_id)
+
+        if above_round_id is None:
+            return new_stmt.order_by(metadata_table.c["round_id"].desc())
+
+        retry_stmt = (
+            select(metadata_table)
+            .join(dead_letter_table, dead_letter_table.c["round_id"] == metadata_table.c["round_id"])
+            .where(dead_letter_table.c["next_retry_at"] <= func.now())
+            .where(metadata_table.c["round_id"] <= above_round_id)
+        )
+
+        if before_round_id is not None:
+            retry_stmt = retry_stmt.where(metadata_table.c["round_id"] < before_round_id)
+
+        difference = union_all(
+            new_stmt.where(metadata_table.c["round_id"] > above_round_id),
+            retry_stmt,
+        ).subquery()
+
+        return select(difference).order_by(difference.c["round_id"].desc())
+
+    def db_fetch_metadata_difference(self, above_round_id: int | None = None) -> list[dict]:
         """
         Returns metadata rows that do not exist in the collected round data table. 
+
+        Args:
+            above_round_id (int | None, optional): rounds watermark, see `_metadata_difference_stmt`. Defaults to None (compare the whole table).
         """
 
         self._log.info("Pulling metadata for difference comparison")
 
         with Session(self.engine) as session:
-            exists_stmt = (
-                select(metadata_table.c["round_id"])
-                .where(round_table.c["round_id"] == metadata_table.c["round_id"])
-            ).exists()
-
-            stmt = (
-                # binary negation for NOT EXISTS
-                select(metadata_table).where(~exists_stmt)
-            )
+            stmt = self._metadata_difference_stmt(above_round_id)
 
             result = session.execute(stmt)
 
@@ -134,6 +967,143 @@ class DatabaseLoader:
 
         return metadata_list
 
+    def db_fetch_metadata_difference_page(
+        self,
+        limit: int,
+        before_round_id: int | None = None,
+        include_loaded: bool = False,
+        above_round_id: int | None = None,
+    ) -> list[dict]:
+        """
+        Returns one page of the metadata difference, newest first. Keyset paginated on round_id so each page is a short, index-driven query.
+
+        Args:
+            limit (int): maximum number of metadata rows to return.
+            before_round_id (int | None, optional): only return rows with a round_id below this value. Pass the last round_id of the previous page. Defaults to None (start from the newest row).
+            include_loaded (bool, optional): page through every metadata row, including rounds already loaded, to rebuild the rounds table. Defaults to False.
+            above_round_id (int | None, optional): rounds watermark, see `_metadata_difference_stmt`. Ignored with `include_loaded`. Defaults to None (compare the whole table).
+        """
+        with Session(self.engine) as session:
+            if include_loaded:
+                stmt = select(metadata_table).order_by(metadata_table.c["round_id"].desc())
+
+                if before_round_id is not None:
+                    stmt = stmt.where(metadata_table.c["round_id"] < before_round_id)
+            else:
+                stmt = self._metadata_difference_stmt(above_round_id, before_round_id)
+
+            result = session.execute(stmt.limit(limit))
+
+            metadata_list = [dict(row) for row in result.mappings()]
+
+        self._log.info(f"Pulled metadata-difference page of len {len(metadata_list)} below round_id {before_round_id}")
+
+        return metadata_list
+
+    def db_fetch_lowest_unloaded_round_id(self) -> int | None:
+        """Lowest metadata round_id that was neither loaded nor dead-lettered, None if there is none. Full anti-join, only used to seed the rounds watermark."""
+        with Session(self.engine) as session:
+            loaded_stmt = (
+                select(round_table.c["round_id"])
+                .where(round_table.c["round_id"] == metadata_table.c["round_id"])
+            ).exists()
+
+            failed_stmt = (
+                select(dead_letter_table.c["round_id"])
+                .where(dead_letter_table.c["round_id"] == metadata_table.c["round_id"])
+            ).exists()
+
+            stmt = select(func.min(metadata_table.c["round_id"])).where(~loaded_stmt).where(~failed_stmt)
+
+            round_id = session.execute(stmt).scalar()
+
+        return round_id
+
+    def db_get_watermark(self, name: str) -> int | None:
+        """Returns the round_id of a sync watermark, None if it was never set"""
+        with Session(self.engine) as session:
+            stmt = select(sync_state_table.c["round_id"]).where(sync_state_table.c["name"] == name)
+
+            round_id = session.execute(stmt).scalar()
+
+        return round_id
+
+    def db_set_watermark(self, name: str, round_id: int) -> None:
+        """Upserts a sync watermark"""
+        with Session(self.engine) as session:
+            insert_stmt = insert(sync_state_table).values(name=name, round_id=round_id, updated_at=func.now())
+
+            session.execute(
+                insert_stmt.on_conflict_do_update(
+                    index_elements=["name"],
+                    set_={"round_id": insert_stmt.excluded["round_id"], "updated_at": func.now()},
+                )
+            )
+            session.commit()
+
+        self._log.info(f"Set {name} watermark to round_id {round_id}")
+
+    def db_record_gaps(self, gap_list: list[tuple[int, int]]) -> None:
+        """Records round_id ranges missing from the roundlist, as inclusive (gap_start, gap_end) tuples. Known gaps are left as they are."""
+        if not gap_list:
+            return
+
+        rows = [
+            {"gap_start": gap_start, "gap_end": gap_end, "check_count": 0, "first_seen_at": func.now()}
+            for gap_start, gap_end in gap_list
+        ]
+
+        with Session(self.engine) as session:
+            session.execute(insert(sync_gap_table).values(rows).on_conflict_do_nothing(index_elements=["gap_start"]))
+            session.commit()
+
+        self._log.info(f"Recorded {len(gap_list)} round_id gaps in {sync_gap_table}")
+
+    def db_fetch_gaps(self, limit: int) -> list[dict]:
+        """Returns up to `limit` known gaps, least recently checked first"""
+        with Session(self.engine) as session:
+            stmt = (
+                select(sync_gap_table)
+                .order_by(sync_gap_table.c["last_checked_at"].asc().nulls_first(), sync_gap_table.c["gap_start"].desc())
+                .limit(limit)
+            )
+
+            gap_list = [dict(row) for row in session.execute(stmt).mappings()]
+
+        return gap_list
+
+    def db_update_gap(self, gap: dict, remaining_gap_list: list[tuple[int, int]]) -> None:
+        """Replaces a rechecked gap with the ranges still missing inside it, keeping when it was first seen"""
+        with Session(self.engine) as session:
+            session.execute(delete(sync_gap_table).where(sync_gap_table.c["gap_start"] == gap["gap_start"]))
+
+            if remaining_gap_list:
+                rows = [
+                    {
+                        "gap_start": gap_start,
+                        "gap_end": gap_end,
+                        "check_count": gap["check_count"] + 1,
+                        "first_seen_at": gap["first_seen_at"],
+                        "last_checked_at": func.now(),
+                    }
+                    for gap_start, gap_end in remaining_gap_list
+                ]
+                session.execute(insert(sync_gap_table).values(rows))
+
+            session.commit()
+
+    def db_expire_gaps(self, max_age: int) -> int:
+        """Deletes gaps first seen more than `max_age` seconds ago, those round_ids most likely never finished. Returns the number of gaps deleted."""
+        with Session(self.engine) as session:
+            result = session.execute(
+                delete(sync_gap_table).where(
+                    sync_gap_table.c["first_seen_at"] < func.now() - literal_column("interval '1 second'") * max_age
+                )
+            )
+            session.commit()
+
+        return result.rowcount
+
     def db_fetch_most_recent_round_id(self) -> int:
         """Gets most recent round_id from metadata table"""
         with Session(self.engine) as session:
@@ -145,7 +1115,10 @@ class DatabaseLoader:
 
             result = session.execute(stmt)
             
-            round_id = result.fetchone()[0]
+            row = result.fetchone()
+
+            # an empty table means everything is missing
+            round_id = row[0] if row is not None else 0
 
             self._log.info(f"Successfully pulled most recent round_id from database with value: {round_id}")
 
@@ -1,7 +1,34 @@
 class RateLimitError(Exception):
+    http_status = 429
+
+    def __init__(self, retry_after: float | None = None) -> None:
+        # pass the fields on to Exception so they survive pickling to and from worker processes
+        super().__init__(retry_after)
+        self.retry_after = retry_after
+
     def __str__(self) -> str:
+        if self.retry_after is not None:
+            return f"Exceeded API rate limit. Retry after {self.retry_after:.0f} sec."
         return "Exceeded API rate limit."
     
 class RoundNotFoundError(Exception):
+    http_status = 404
+
     def __str__(self) -> str:
-        return "HTTP response status 404: round not found or is still ongoing."
\ No newline at end of file
+        return "HTTP response status 404: round not found or is still ongoing."
+
+class BlackboxDecodeError(Exception):
+    def __init__(self, key_name: str | None = None) -> None:
+        super().__init__(key_name)
+        self.key_name = key_name
+
+    def __str__(self) -> str:
+        return f"Malformed blackbox entry with key_name {self.key_name}."
+
+class CacheMissError(Exception):
+    def __init__(self, endpoint: str | None = None) -> None:
+        super().__init__(endpoint)
+        self.endpoint = endpoint
+
+    def __str__(self) -> str:
+        return f"Endpoint {self.endpoint} is not in the response cache and the fetcher is offline."
\ No newline at end of file
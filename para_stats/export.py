@@ -0,0 +1,301 @@
+import json
+import logging
+import os
+import re
+from datetime import datetime, timezone
+from sqlalchemy import case, select, text
+from .atomic import write_atomic
+from .models import round_table
+from .transform import TransformData
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # optional, only needed for exports
+    pa = None
+    pq = None
+
+
+class ParquetExporter:
+    STATE_FILE = "_export_state.json"
+    # server_id is the partition key, so it's stored in the directory names instead of the files
+    DATETIME_COLUMNS = ("init_datetime", "start_datetime", "shutdown_datetime", "end_datetime", "loaded_at")
+    TEXT_COLUMNS = ("commit_hash", "game_mode", "game_mode_result", "end_state", "map_name")
+
+    def __init__(
+        self,
+        engine,
+        output_dir: str,
+        stats_keys: list[str] | None = None,
+        batch_size: int = 5000,
+        compression: str = "zstd",
+    ) -> None:
+        """Exports the rounds table into a Parquet dataset for offline analytics, so heavy queries never touch the ODS.
+
+        The dataset is hive-partitioned as `month=YYYY-MM/server_id=<server>/`, by the month the round started.
+        Playercounts become two list columns, `playercount_timestamps` and `playercount_values`. Each of
+        `stats_keys` becomes its own `stat_<key>` column: a number for amounts, a map of numbers for tallies
+        and a JSON string for everything else. Only those keys are pulled out of the JSONB, on the server.
+
+        Exports are incremental by `loaded_at`, so rounds loaded late, ex: dead-letter retries, filled gaps, reloads
+        and reprocessed rounds, are exported by the next run whatever their round_id. `_export_state.json` records
+        the loaded_at the last run went up to and the type picked for each stats key, so every run appends one new
+        file per partition it touches. A round rewritten after its export is exported again, keep the row with the
+        latest `loaded_at` per round_id. Files and the state file start with `.` or `_` while being written, which
+        Parquet readers skip.
+
+        Read it memory-mapped and with only the columns needed, ex:
+        `pq.read_table(output_dir, columns=["round_id", "stat_round_end_clients"], memory_map=True)`
+
+        Args:
+            engine (Engine): engine of the database holding the rounds table.
+            output_dir (str): root directory of the dataset, created if missing.
+            stats_keys (list[str] | None, optional): blackbox key_names to export as typed columns. Defaults to None (no stats columns).
+            batch_size (int, optional): rows pulled from the server-side cursor at a time, each batch is one row group per partition. Defaults to 5000.
+            compression (str, optional): Parquet compression codec. Defaults to "zstd".
+        """
+        if pa is None:
+            raise ImportError("Parquet export requires pyarrow, install with the `parquet` extra")
+
+        self._log = logging.getLogger(__name__)
+        self.engine = engine
+        self.output_dir = output_dir
+        self.stats_keys = list(stats_keys or [])
+
+        self.BATCH_SIZE = batch_size
+        self.COMPRESSION = compression
+
+        self._state_path = os.path.join(output_dir, self.STATE_FILE)
+        self._writers = {}
+        self._file_counts = {}
+
+    @staticmethod
+    def stats_column(key_name: str) -> str:
+        """Column name of an exported stats key, ex: `RND Production list` -> `stat_RND_Production_list`"""
+        return "stat_" + re.sub(r"\W+", "_", key_name).strip("_")
+
+    @staticmethod
+    def _arrow_type(key_type: str):
+        if key_type == "amount":
+            return pa.float64()
+        if key_type == "tally":
+            return pa.map_(pa.string(), pa.float64())
+        return pa.string()
+
+    @staticmethod
+    def _stats_value(value, key_type: str):
+        if value is None:
+            return None
+        if key_type == "amount":
+            return TransformData._to_number(value)
+        if key_type == "tally":
+            # a round where the key has another shape loses it rather than failing the export
+            if not isinstance(value, dict):
+                return None
+            return [(str(k), TransformData._to_number(v)) for k, v in value.items()]
+        return json.dumps(value)
+
+    def load_state(self) -> dict:
+        try:
+            with open(self._state_path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {"loaded_before": None, "stats_key_types": {}}
+
+    def _save_state(self, state: dict) -> None:
+        write_atomic(self._state_path, json.dumps(state, indent=2).encode())
+
+    def _loaded_before(self) -> datetime:
+        """
+        Upper bound on the loaded_at of the rounds this run exports. loaded_at is the start of the transaction that wrote a
+        round, so a transaction still open could commit rounds below any bound read off the clock. The start of the oldest
+        open transaction is taken instead: everything loaded before it is committed and seen by queries started afterwards.
+        """
+        # a transaction of its own, pg_stat_activity is only read once per transaction.
+        # other roles' sessions only show their xact_start to members of pg_read_all_stats.
+        with self.engine.connect() as connection:
+            return connection.execute(
+                text(
+                    "SELECT coalesce(min(xact_start), now()) FROM pg_stat_activity "
+                    "WHERE datname = current_database() AND backend_type = 'client backend'"
+                )
+            ).scalar()
+
+    def _schema(self, key_types: dict):
+        fields = [
+            pa.field("round_id", pa.int32(), nullable=False),
+            *[pa.field(name, pa.timestamp("us", tz="UTC")) for name in self.DATETIME_COLUMNS],
+            *[pa.field(name, pa.string()) for name in self.TEXT_COLUMNS],
+            pa.field("playercount_timestamps", pa.list_(pa.timestamp("s", tz="UTC"))),
+            pa.field("playercount_values", pa.list_(pa.int32())),
+        ]
+
+        fields.extend(pa.field(self.stats_column(key), self._arrow_type(key_types[key])) for key in self.stats_keys)
+
+        return pa.schema(fields)
+
+    @staticmethod
+    def _partition(row: dict) -> tuple[str, str]:
+        started = row["start_datetime"] or row["init_datetime"]
+        month = started.astimezone(timezone.utc).strftime("%Y-%m") if started is not None else "unknown"
+
+        return month, row["server_id"] or "unknown"
+
+    @staticmethod
+    def _playercount_columns(row: dict) -> tuple:
+        if row["playercount_deltas"] is not None:
+            return TransformData.expand_playercounts(
+                row["playercount_start"], row["playercount_interval"], row["playercount_deltas"]
+            )
+
+        playercounts = row["playercounts"]
+
+        if not playercounts:
+            return None, None
+
+        timestamps = []
+
+        for timestamp in playercounts:
+            parsed = datetime.fromisoformat(timestamp)
+            timestamps.append(parsed if parsed.tzinfo is not None else parsed.replace(tzinfo=timezone.utc))
+
+        return timestamps, [int(count) for count in playercounts.values()]
+
+    def _writer(self, partition: tuple[str, str], schema, run_name: str):
+        writer = self._writers.get(partition)
+
+        if writer is None:
+            month, server_id = partition
+            directory = os.path.join(self.output_dir, f"month={month}", f"server_id={server_id}")
+            os.makedirs(directory, exist_ok=True)
+
+            # a partition closed early and reopened by a late round gets a second file instead of overwriting the first
+            sequence = self._file_counts.get(partition, 0)
+            self._file_counts[partition] = sequence + 1
+
+            file_name = f"{run_name}-{sequence}.parquet"
+            tmp_path = os.path.join(directory, "." + file_name)
+            writer = pq.ParquetWriter(tmp_path, schema, compression=self.COMPRESSION)
+            self._writers[partition] = (writer, tmp_path, os.path.join(directory, file_name))
+            return writer
+
+        return writer[0]
+
+    def _close_writers(self, before_month: str | None = None) -> None:
+        """Finishes the files of every partition, or of the months before `before_month`. Rounds come in round_id order, so those won't get more rows this run."""
+        for partition in list(self._writers):
+            if before_month is not None and partition[0] >= before_month:
+                continue
+
+            writer, tmp_path, final_path = self._writers.pop(partition)
+            writer.close()
+            os.replace(tmp_path, final_path)
+
+    def _write_batch(self, rows: list[dict], schema, key_types: dict, run_name: str) -> None:
+        by_partition = {}
+
+        for row in rows:
+            by_partition.setdefault(self._partition(row), []).append(row)
+
+        for partition, partition_rows in by_partition.items():
+            columns = {
+                name: [row[name] for row in partition_rows]
+                for name in ("round_id", *self.DATETIME_COLUMNS, *self.TEXT_COLUMNS)
+            }
+
+            playercount_columns = [self._playercount_columns(row) for row in partition_rows]
+            columns["playercount_timestamps"] = [timestamps for timestamps, _ in playercount_columns]
+            columns["playercount_values"] = [values for _, values in playercount_columns]
+
+            for key in self.stats_keys:
+                columns[self.stats_column(key)] = [self._stats_value(row[key], key_types[key]) for row in partition_rows]
+
+            table = pa.Table.from_pydict(columns, schema=schema)
+            self._writer(partition, schema, run_name).write_table(table)
+
+        self._close_writers(before_month=min(month for month, _ in by_partition))
+
+    def _infer_key_types(self, key_types: dict, rows: list[dict]) -> dict:
+        """Fixes the column type of every stats key on its first non-null value, later runs reuse it from the state file"""
+        for key in self.stats_keys:
+            if key in key_types:
+                continue
+
+            value = next((row[key] for row in rows if row[key] is not None), None)
+
+            if value is not None:
+                key_types[key] = TransformData.infer_key_type(value)
+
+        return key_types
+
+    def export(self) -> int:
+        """Appends every round loaded since the last export to the dataset. Returns the number of rounds exported."""
+        os.makedirs(self.output_dir, exist_ok=True)
+
+        state = self.load_state()
+        loaded_after = datetime.fromisoformat(state["loaded_before"]) if state.get("loaded_before") else None
+        key_types = dict(state.get("stats_key_types", {}))
+        loaded_before = self._loaded_before()
+
+        # one file per partition and run, named after where the run started so a retried run overwrites its own files
+        if loaded_after is not None:
+            run_name = f"part-{loaded_after.astimezone(timezone.utc):%Y%m%dT%H%M%S%fZ}"
+        else:
+            run_name = f"part-{state.get('last_round_id', 0) + 1:010d}"
+
+        self._file_counts.clear()
+
+        stmt = (
+            select(
+                *[column for column in round_table.columns if column.name not in ("playercounts", "stats")],
+                # rounds with compact playercounts don't need their JSONB detoasted
+                case((round_table.c["playercount_deltas"].is_(None), round_table.c["playercounts"])).label("playercounts"),
+                *[round_table.c["stats"][key].label(key) for key in self.stats_keys],
+            )
+            .where(round_table.c["loaded_at"] < loaded_before)
+            .order_by(round_table.c["round_id"])
+        )
+
+        if loaded_after is not None:
+            stmt = stmt.where(round_table.c["loaded_at"] >= loaded_after)
+        elif state.get("last_round_id"):
+            # state of an export that went by round_id, picks up where it left off
+            stmt = stmt.where(round_table.c["round_id"] > state["last_round_id"])
+
+        exported_rowcount = 0
+        schema = None
+
+        try:
+            # stream_results opens a server-side cursor, so only one batch is ever held in memory
+            with self.engine.connect().execution_options(stream_results=True, max_row_buffer=self.BATCH_SIZE) as connection:
+                result = connection.execute(stmt)
+
+                for partition in result.mappings().partitions(self.BATCH_SIZE):
+                    rows = [dict(row) for row in partition]
+
+                    if schema is None:
+                        key_types = self._infer_key_types(key_types, rows)
+                        # keys never seen yet are exported as JSON, and stay that way
+                        key_types.update({key: key_types.get(key, "text") for key in self.stats_keys})
+                        schema = self._schema(key_types)
+
+                    self._write_batch(rows, schema, key_types, run_name)
+
+                    exported_rowcount += len(rows)
+
+                    self._log.info(f"Exported {exported_rowcount} rounds up to round_id {rows[-1]['round_id']}")
+
+            self._close_writers()
+
+        except BaseException:
+            # drop the unfinished files, the next run starts from the same loaded_at again
+            for writer, tmp_path, _ in self._writers.values():
+                writer.close()
+                os.unlink(tmp_path)
+            self._writers.clear()
+            raise
+
+        if exported_rowcount:
+            self._save_state({"loaded_before": loaded_before.isoformat(), "stats_key_types": key_types})
+
+        return exported_rowcount
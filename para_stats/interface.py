@@ -0,0 +1,449 @@
+import logging
+import threading
+from config import Config
+from .api_fetch import APIFetch
+from .cache import ResponseCache
+from .transform import TRANSFORM_VERSION, TransformData
+from .pipeline import RoundPipeline
+from .watch import RoundWatcher
+from . import metrics
+
+class ETLInterface:
+    def __init__(
+        self,
+        url: str = Config.api_url,
+        use_async: bool = Config.use_async,
+        cache_dir: str | None = Config.cache_dir,
+        offline: bool = Config.offline,
+        load_facts: bool = Config.load_facts,
+        land_raw: bool = Config.land_raw,
+    ) -> None:
+        self._log = logging.getLogger(__name__)
+        self.load_facts = load_facts
+        self.land_raw = land_raw
+
+        # with a cache dir every response is kept on disk, offline replays the whole run from it
+        cache = ResponseCache(cache_dir, Config.cache_roundlist_ttl) if cache_dir else None
+
+        if use_async:
+            # aiohttp is only imported by the runs that use it
+            from .async_api_fetch import AsyncAPIFetch
+
+            self._fetcher = AsyncAPIFetch(url, cache=cache, offline=offline)
+        else:
+            self._fetcher = APIFetch(url, cache=cache, offline=offline)
+
+        self._transformer = TransformData(
+            processes=Config.transform_processes,
+            playercount_format=Config.playercount_format,
+            keys=Config.blackbox_keys,
+            exclude_keys=Config.blackbox_exclude_keys,
+            key_rules=Config.blackbox_key_rules,
+        )
+        self._db_loader = None
+
+    @property
+    def _db(self):
+        """The DatabaseLoader, built on first use so the SQLAlchemy and driver imports and the schema check stay off the path to the first API request"""
+        if self._db_loader is None:
+            from .db import DatabaseLoader
+
+            # note: this should automatically create the tables from the schemas if they don't exist
+            self._db_loader = DatabaseLoader(Config, load_method=Config.db_load_method, pool_size=Config.db_pool_size)
+
+        return self._db_loader
+
+    def close(self) -> None:
+        """Shuts down the transformer's worker processes and closes the fetcher's connections, and with `use_async` its event loop."""
+        self._transformer.close()
+        self._fetcher.close()
+
+    def __enter__(self) -> "ETLInterface":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def update_metadata(self, head_page: list | None = None):
+        """Fetches the roundlist entries newer than the metadata watermark. An already fetched `head_page` saves a request, and needs no more when it reaches back to the watermark."""
+        if head_page is not None:
+            new_round_id = head_page[0]["round_id"] if head_page else 0
+        else:
+            new_round_id = self._fetcher.fetch_most_recent_round_id()
+
+        old_round_id = self._metadata_watermark()
+
+        if new_round_id > old_round_id and head_page is not None:
+            new_metadata_list = self._fetcher.fetch_roundlist_window(
+                head_page[-1]["round_id"], old_round_id, head_page=head_page
+            )
+        elif new_round_id > old_round_id:
+            new_metadata_list = self._fetcher.fetch_roundlist_to_offset(old_round_id)
+        else:
+            new_metadata_list = []
+
+        self._log.info(f"Found {len(new_metadata_list)} metadata entries to update.")
+
+        return self._transformer.prep_metadata(new_metadata_list)
+
+    def recheck_gaps(self, limit: int = 50, max_age: int = 172800) -> int:
+        """Re-reads the roundlist around known round_id gaps and loads the rounds that have turned up since.
+
+        Args:
+            limit (int, optional): Maximum number of gaps rechecked per run, least recently checked first. Defaults to 50.
+            max_age (int, optional): Seconds after which a gap is given up on, its rounds most likely never finished. Defaults to 172800.
+
+        Returns:
+            int: number of metadata rows found inside gaps
+        """
+        # a replay can only see what the cache saw, the gaps are left for the next online run
+        if self._fetcher.OFFLINE:
+            return 0
+
+        expired_rowcount = self._db.db_expire_gaps(max_age)
+
+        if expired_rowcount:
+            self._log.info(f"Gave up on {expired_rowcount} round_id gaps older than {max_age} seconds")
+
+        filled_rowcount = 0
+
+        for gap in self._db.db_fetch_gaps(limit):
+            # one past the gap, so it's covered whether the roundlist offset is inclusive or exclusive
+            page = self._fetcher.fetch_roundlist_window(gap["gap_end"] + 1, gap["gap_start"] - 1)
+            found_metadata_list = [entry for entry in page if entry["round_id"] <= gap["gap_end"]]
+
+            if found_metadata_list:
+                self.load_metadata(self._transformer.prep_metadata(found_metadata_list))
+                filled_rowcount += len(found_metadata_list)
+
+            remaining_gap_list = self._find_gaps(
+                [gap["gap_start"] - 1, *(entry["round_id"] for entry in found_metadata_list), gap["gap_end"] + 1]
+            )
+            self._db.db_update_gap(gap, remaining_gap_list)
+
+        self._log.info(f"Found {filled_rowcount} metadata entries inside known round_id gaps.")
+
+        return filled_rowcount
+
+    @staticmethod
+    def _find_gaps(round_id_list: list[int]) -> list[tuple[int, int]]:
+        """Inclusive (gap_start, gap_end) ranges of round_ids missing between the given ones"""
+        gap_list = []
+        sorted_round_ids = sorted(round_id_list)
+
+        for lower, upper in zip(sorted_round_ids, sorted_round_ids[1:]):
+            if upper > lower + 1:
+                gap_list.append((lower + 1, upper - 1))
+
+        return gap_list
+
+    def _metadata_watermark(self) -> int:
+        """Newest round_id pulled from the roundlist, falls back to the metadata table before the first watermarked run"""
+        round_id = self._db.db_get_watermark("metadata")
+
+        if round_id is None:
+            round_id = self._db.db_fetch_most_recent_round_id()
+
+        return round_id
+
+    def _rounds_watermark(self) -> int:
+        """round_id at or below which every metadata row was loaded or dead-lettered, seeded with one full comparison on first use"""
+        round_id = self._db.db_get_watermark("rounds")
+
+        if round_id is None:
+            lowest_round_id = self._db.db_fetch_lowest_unloaded_round_id()
+            round_id = lowest_round_id - 1 if lowest_round_id is not None else self._metadata_watermark()
+            self._db.db_set_watermark("rounds", round_id)
+
+        return round_id
+
+    def stream_missing_round_data(
+        self,
+        batch_size: int = 100,
+        queue_size: int = 2,
+        reload: bool = False,
+        stop_event: threading.Event | None = None,
+    ) -> int:
+        """Streams missing round data through fetch, transform and load in fixed-size batches. With `reload`, every round is re-processed. Setting `stop_event` ends the run after the batches in flight. Returns the number of rounds loaded."""
+        # everything up to here is loaded or dead-lettered once the run completes
+        metadata_watermark = self._metadata_watermark()
+
+        pipeline = RoundPipeline(
+            self._fetcher,
+            self._transformer,
+            self._db,
+            batch_size=batch_size,
+            queue_size=queue_size,
+            reload=reload,
+            load_facts=self.load_facts,
+            above_round_id=self._rounds_watermark(),
+            stop_event=stop_event,
+            land_raw=self.land_raw,
+        )
+
+        loaded_rowcount = pipeline.run()
+
+        # a stopped run may have left rounds below the metadata watermark behind
+        if stop_event is None or not stop_event.is_set():
+            self._db.db_set_watermark("rounds", metadata_watermark)
+
+        return loaded_rowcount
+
+    def backfill_facts(self, batch_size: int = 500) -> int:
+        """Rebuilds the blackbox fact tables from the stats already in the rounds table. Key types are inferred from the data. Returns the number of rounds flattened."""
+        after_round_id = 0
+        flattened_rowcount = 0
+
+        while round_batch := self._db.db_fetch_round_stats_page(batch_size, after_round_id):
+            facts = self._transformer.collect_fact_batch(round_batch)
+            round_id_list = [entry["round_id"] for entry in round_batch]
+
+            self._db.db_upload_facts(facts, round_id_list)
+
+            flattened_rowcount += len(round_batch)
+            after_round_id = round_id_list[-1]
+
+        return flattened_rowcount
+
+    def backfill_compact_playercounts(self, batch_size: int = 500) -> int:
+        """Adds compact playercounts to rounds loaded without them, and drops their JSONB with the `compact` format. Returns the number of rounds compacted."""
+        if self._transformer.PLAYERCOUNT_FORMAT == "json":
+            self._log.warning("Playercount format is json, set PARA_STATS_PLAYERCOUNT_FORMAT to compact or both to compact loaded rounds")
+            return 0
+
+        after_round_id = 0
+        compacted_rowcount = 0
+
+        while round_batch := self._db.db_fetch_playercount_page(batch_size, after_round_id):
+            for entry in round_batch:
+                self._transformer.attach_playercounts(entry, entry["playercounts"])
+
+            compacted_round_list = [entry for entry in round_batch if entry["playercount_deltas"] is not None]
+            self._db.db_update_playercounts(compacted_round_list)
+
+            compacted_rowcount += len(compacted_round_list)
+            after_round_id = round_batch[-1]["round_id"]
+
+        return compacted_rowcount
+
+    def prep_rounds(
+        self, metadata_list: list, playercount_list: list, raw_blackbox_list: list, failures: dict | None = None
+    ) -> list:
+        """Cleans and returns list of rounds ready for upload. With `failures`, rounds that can't be cleaned are dead-lettered and left out."""
+        skipped_round_ids = set(failures) if failures is not None else set()
+        
+        collected_round_list = self._transformer.collect_round_batch(
+            metadata_list, 
+            playercount_list, 
+            raw_blackbox_list,
+            failures=failures,
+        )
+
+        if failures is not None:
+            self._db.db_record_failures(
+                {round_id: e for round_id, e in failures.items() if round_id not in skipped_round_ids},
+                "transform",
+            )
+
+        return collected_round_list
+
+    def load_metadata(self, metadata_list: list) -> int:
+        """Uploads metadata list to the database, then records any round_id gaps below the new rows and moves the watermarks. Returns the number of rows written."""
+        self._log.info("Uploading metadata...")
+
+        # read before the upload, the fallback looks at the metadata table itself
+        metadata_watermark = self._metadata_watermark()
+
+        written_rowcount = self._db.db_upload_metadata(metadata_list)
+
+        if not metadata_list:
+            return written_rowcount
+
+        round_id_list = [entry["round_id"] for entry in metadata_list]
+        new_round_ids = [round_id for round_id in round_id_list if round_id > metadata_watermark]
+
+        if new_round_ids:
+            # on an empty table there's nothing to measure a gap below the oldest round against
+            lower_bound = [metadata_watermark] if metadata_watermark else []
+            self._db.db_record_gaps(self._find_gaps(lower_bound + new_round_ids))
+            self._db.db_set_watermark("metadata", max(new_round_ids))
+
+        # rounds that turn up below the rounds watermark, ex: a filled gap, have to be seen by the next difference
+        rounds_watermark = self._db.db_get_watermark("rounds")
+
+        if rounds_watermark is not None and min(round_id_list) <= rounds_watermark:
+            self._db.db_set_watermark("rounds", min(round_id_list) - 1)
+
+        return written_rowcount
+
+    def load_rounds(self, collected_round_list: list) -> int:
+        """Uploads collected round list to the database. Returns the number of rows written."""
+        written_rowcount = self._db.db_upload_rounds(collected_round_list)
+
+        return written_rowcount
+
+
+def init_script(
+    cache_dir: str | None = Config.cache_dir,
+    offline: bool = Config.offline,
+    reload: bool = False,
+    load_facts: bool = Config.load_facts,
+    backfill_facts: bool = False,
+    metrics_file: str | None = Config.metrics_file,
+    metrics_port: int = Config.metrics_port,
+    compact_playercounts: bool = False,
+    land_raw: bool = Config.land_raw,
+    use_async: bool = Config.use_async,
+):
+    if metrics_port:
+        metrics.registry.serve(metrics_port)
+
+    try:
+        with ETLInterface(
+            use_async=use_async, cache_dir=cache_dir, offline=offline, load_facts=load_facts, land_raw=land_raw
+        ) as interface:
+            if backfill_facts:
+                print("Backfilling blackbox fact tables from loaded rounds...")
+                print(f"Flattened {interface.backfill_facts()} rounds.")
+
+            if compact_playercounts:
+                print("Compacting playercounts of loaded rounds...")
+                print(f"Compacted {interface.backfill_compact_playercounts()} rounds.")
+
+            print("Checking for new rounds...")
+
+            # check if we need to update the master metadata list
+            metadata_to_update = interface.update_metadata()
+
+            # send it to the database
+            if metadata_to_update:
+                print(f"Loaded {interface.load_metadata(metadata_to_update)} metadata rows.")
+            else:
+                print("Database metadata table is already up to date!")
+
+            # rounds that were still in progress when an earlier run read the roundlist
+            filled_rowcount = interface.recheck_gaps()
+
+            if filled_rowcount:
+                print(f"Found {filled_rowcount} rounds inside known round_id gaps.")
+
+            print("Updating round playercount and blackbox data...")
+
+            # fill in round data with what we're missing, batch by batch
+            loaded_rowcount = interface.stream_missing_round_data(reload=reload)
+
+            if not loaded_rowcount:
+                print("Nothing to update!")
+                return
+
+            print(f"Loaded {loaded_rowcount} rounds.")
+
+            print("Done!")
+
+    finally:
+        # written even when the run fails, that's when the numbers matter most
+        if metrics_file:
+            metrics.registry.write_textfile(metrics_file)
+
+
+def watch_script(
+    interval: float = Config.watch_interval,
+    jitter: float = Config.watch_jitter,
+    cache_dir: str | None = Config.cache_dir,
+    load_facts: bool = Config.load_facts,
+    metrics_file: str | None = Config.metrics_file,
+    metrics_port: int = Config.metrics_port,
+    land_raw: bool = Config.land_raw,
+    use_async: bool = Config.use_async,
+):
+    if metrics_port:
+        metrics.registry.serve(metrics_port)
+
+    with ETLInterface(use_async=use_async, cache_dir=cache_dir, load_facts=load_facts, land_raw=land_raw) as interface:
+        print(f"Watching for new rounds every {interval} sec, stop with SIGTERM or Ctrl+C...")
+
+        RoundWatcher(interface, interval=interval, jitter=jitter, metrics_file=metrics_file).run()
+
+    print("Done!")
+
+
+def migrate_script(batch_size: int = 5000):
+    from .db import DatabaseLoader
+    from .migrate import SchemaMigrator
+
+    # DatabaseLoader creates any tables that don't exist yet, the migrator updates the ones that do
+    db = DatabaseLoader(Config)
+    # the cached schema check trusts tables it has already seen, migrate always looks at the catalog
+    db.db_create_schema(use_cache=False)
+
+    print("Migrating schema...")
+
+    SchemaMigrator(db.engine, batch_size=batch_size, rounds_partition_size=Config.db_rounds_partition_size).migrate()
+
+    print("Done!")
+
+
+def maintain_script(recent_partitions: int = 2):
+    from .db import DatabaseLoader
+
+    db = DatabaseLoader(Config)
+
+    print("Vacuuming and analyzing the rounds table...")
+
+    vacuumed = db.db_maintain_rounds(recent_partitions=recent_partitions)
+
+    print(f"Done! Vacuumed {len(vacuumed)} tables")
+
+
+def reprocess_script(
+    start_round_id: int | None = None,
+    end_round_id: int | None = None,
+    batch_size: int = 200,
+    load_facts: bool = Config.load_facts,
+    force: bool = False,
+):
+    from .db import DatabaseLoader
+    from .reprocess import RoundReprocessor
+
+    db = DatabaseLoader(Config, load_method=Config.db_load_method, pool_size=Config.db_pool_size)
+    transformer = TransformData(
+        processes=Config.transform_processes,
+        playercount_format=Config.playercount_format,
+        keys=Config.blackbox_keys,
+        exclude_keys=Config.blackbox_exclude_keys,
+        key_rules=Config.blackbox_key_rules,
+    )
+
+    if force:
+        print("Rebuilding every round from its raw payloads...")
+    else:
+        print(f"Rebuilding rounds older than transform version {TRANSFORM_VERSION} from their raw payloads...")
+
+    try:
+        reprocessed_rowcount = RoundReprocessor(
+            transformer,
+            db,
+            start_round_id=start_round_id,
+            end_round_id=end_round_id,
+            batch_size=batch_size,
+            load_facts=load_facts,
+            force=force,
+        ).run()
+    finally:
+        transformer.close()
+
+    print(f"Done! Reprocessed {reprocessed_rowcount} rounds")
+
+
+def export_script(output_dir: str = Config.export_dir, stats_keys: list[str] = Config.export_stats_keys, batch_size: int = 5000):
+    from .db import DatabaseLoader
+    from .export import ParquetExporter
+
+    db = DatabaseLoader(Config)
+    exporter = ParquetExporter(db.engine, output_dir, stats_keys=stats_keys, batch_size=batch_size)
+
+    print(f"Exporting new rounds to {output_dir}...")
+
+    exported_rowcount = exporter.export()
+
+    print(f"Done! Exported {exported_rowcount} rounds")
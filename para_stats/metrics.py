@@ -0,0 +1,282 @@
+import logging
+import threading
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from .atomic import write_atomic
+
+OPENMETRICS_CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+# request and commit latencies, from a cache hit on the local network to a slow bulk merge
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labelnames: tuple, labelvalues: tuple, extra: dict | None = None) -> str:
+    pairs = list(zip(labelnames, labelvalues))
+
+    if extra:
+        pairs.extend(extra.items())
+
+    if not pairs:
+        return ""
+
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric(ABC):
+    TYPE = "unknown"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels: dict) -> tuple:
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"Metric {self.name} takes labels {self.labelnames}, got {tuple(labels)}")
+
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    @abstractmethod
+    def _samples(self) -> list[str]:
+        """Sample lines of the metric, called with `_lock` held"""
+
+    def expose(self) -> str:
+        lines = [f"# HELP {self.name} {_escape(self.documentation)}", f"# TYPE {self.name} {self.TYPE}"]
+
+        with self._lock:
+            lines.extend(self._samples())
+
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    """Monotonically increasing total. Exposed with the OpenMetrics `_total` suffix."""
+
+    TYPE = "counter"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self) -> list[str]:
+        return [
+            f"{self.name}_total{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in self._values.items()
+        ]
+
+
+class Gauge(_Metric):
+    """Value that can go up and down, ex: rate limit headroom."""
+
+    TYPE = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        key = self._key(labels)
+
+        with self._lock:
+            self._values[key] = value
+
+    def _samples(self) -> list[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in self._values.items()
+        ]
+
+
+class Histogram(_Metric):
+    """Distribution of observed values in cumulative buckets, plus their sum and count."""
+
+    TYPE = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        # counts are kept per bucket and only made cumulative on exposition, so an observation is one increment
+        index = bisect_left(self.buckets, value)
+
+        with self._lock:
+            counts = self._values.get(key)
+
+            if counts is None:
+                counts = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+
+            counts[0][index] += 1
+            counts[1] += value
+
+    def _samples(self) -> list[str]:
+        samples = []
+
+        for key, (bucket_counts, total) in self._values.items():
+            cumulative = 0
+
+            for bound, count in zip((*self.buckets, float("inf")), bucket_counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, {"le": _format_value(float(bound))})
+                samples.append(f"{self.name}_bucket{labels} {cumulative}")
+
+            labels = _format_labels(self.labelnames, key)
+            samples.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            samples.append(f"{self.name}_count{labels} {cumulative}")
+
+        return samples
+
+
+class MetricsRegistry:
+    def __init__(self) -> None:
+        """In-process store of every metric of a run, exposed in the OpenMetrics text format.
+
+        Recording is a dict update under a per-metric lock, so instrumentation can stay on in production.
+        The registry is exported either as a text file written at the end of a run, for node_exporter's
+        textfile collector, or over a local HTTP endpoint for long-running processes.
+        """
+        self._log = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def _register(self, metric_cls, name: str, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+
+            if metric is None:
+                metric = self._metrics[name] = metric_cls(name, *args, **kwargs)
+            elif not isinstance(metric, metric_cls):
+                raise ValueError(f"Metric {name} is already registered as a {metric.TYPE}")
+
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: tuple = ()) -> Counter:
+        return self._register(Counter, name, documentation, labelnames)
+
+    def gauge(self, name: str, documentation: str, labelnames: tuple = ()) -> Gauge:
+        return self._register(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def exposition(self) -> str:
+        """Renders every metric in the OpenMetrics text format"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+
+        return "".join(metric.expose() + "\n" for metric in metrics) + "# EOF\n"
+
+    def write_textfile(self, path: str) -> None:
+        """Writes the exposition to `path` atomically, so a scraper never reads a partial file"""
+        write_atomic(path, self.exposition().encode())
+
+        self._log.info(f"Wrote metrics to {path}")
+
+    def serve(self, port: int, address: str = "127.0.0.1") -> ThreadingHTTPServer:
+        """Serves the exposition at `/metrics` from a daemon thread. Returns the server, call `shutdown()` to stop it."""
+        registry = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args) -> None:
+                pass
+
+            def do_GET(self) -> None:
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+
+                data = registry.exposition().encode()
+
+                self.send_response(200)
+                self.send_header("Content-Type", OPENMETRICS_CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        server = ThreadingHTTPServer((address, port), MetricsHandler)
+        server.daemon_threads = True
+
+        threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+
+        self._log.info(f"Serving metrics on http://{address}:{server.server_address[1]}/metrics")
+
+        return server
+
+
+def endpoint_label(endpoint: str) -> str:
+    """Collapses an endpoint to its route so label cardinality stays fixed, ex: /blackbox/12345 -> /blackbox"""
+    path = endpoint.split("?", 1)[0].rstrip("/")
+    head, _, tail = path.rpartition("/")
+
+    return head if tail.isdigit() and head else path
+
+
+registry = MetricsRegistry()
+
+API_REQUEST_SECONDS = registry.histogram(
+    "para_stats_api_request_duration_seconds", "Latency of stats API requests", ("endpoint", "status")
+)
+API_RESPONSE_BYTES = registry.counter(
+    "para_stats_api_response_bytes", "Bytes downloaded from the stats API", ("endpoint",)
+)
+API_CACHE_HITS = registry.counter(
+    "para_stats_api_cache_hits", "Requests served from the response cache", ("endpoint",)
+)
+API_RATE_LIMITED = registry.counter(
+    "para_stats_api_rate_limited", "Responses with HTTP status 429", ("endpoint",)
+)
+RATE_LIMIT_REMAINING = registry.gauge(
+    "para_stats_rate_limit_remaining", "Requests the API will still accept in the current window"
+)
+RATE_LIMIT_RATE = registry.gauge(
+    "para_stats_rate_limit_rate", "Request rate in requests/sec the rate limiter currently allows"
+)
+
+TRANSFORM_ROUND_SECONDS = registry.histogram(
+    "para_stats_transform_round_duration_seconds",
+    "Transform time per round, averaged over each batch",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0),
+)
+TRANSFORM_ROUNDS = registry.counter(
+    "para_stats_transform_rounds", "Rounds cleaned by the transformer", ("result",)
+)
+
+DB_ROWS = registry.counter(
+    "para_stats_db_rows_upserted", "Rows upserted into the ODS tables", ("table", "method")
+)
+DB_ROWS_UNCHANGED = registry.counter(
+    "para_stats_db_rows_unchanged", "Rows left out of an upsert because their content hash was already stored", ("table",)
+)
+DB_ROWS_PER_SECOND = registry.gauge(
+    "para_stats_db_upsert_rows_per_second", "Throughput of the most recent upload", ("table", "method")
+)
+DB_COMMIT_SECONDS = registry.histogram(
+    "para_stats_db_chunk_commit_duration_seconds",
+    "Latency of one chunk's statement and commit, the whole merge for COPY",
+    ("table", "method"),
+)
+DB_WORKER_ROWS_PER_SECOND = registry.gauge(
+    "para_stats_db_pool_worker_upsert_rows_per_second",
+    "Throughput of each worker thread of the pool load method over the most recent upload, while it was busy. A worker checks out whichever pooled connection is free for each chunk",
+    ("table", "worker"),
+)
+
+WATCH_POLLS = registry.counter(
+    "para_stats_watch_polls", "Roundlist head polls of the watcher", ("result",)
+)
+WATCH_LAST_POLL = registry.gauge(
+    "para_stats_watch_last_poll_timestamp_seconds", "Unix time of the watcher's last completed poll"
+)
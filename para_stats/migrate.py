@@ -0,0 +1,431 @@
+import logging
+from sqlalchemy import text
+from sqlalchemy.schema import CreateIndex
+from sqlalchemy.types import DateTime
+from .models import (
+    round_table,
+    metadata_table,
+    dead_letter_table,
+    sync_state_table,
+    sync_gap_table,
+    raw_payload_table,
+    fact_tables,
+    round_partition_name,
+)
+
+
+class SchemaMigrator:
+    def __init__(self, engine, batch_size: int = 5000, lock_timeout: str = "10s", rounds_partition_size: int = 0) -> None:
+        """Brings an existing, populated ODS schema up to date with models.py in place, without holding a long exclusive lock.
+
+        Steps, each safe to re-run after an interruption:
+            1. add columns the models declare but the tables lack (metadata-only in Postgres)
+            2. convert Text datetime columns to timestamptz: a shadow column is added and kept in sync by a trigger,
+               backfilled in round_id batches that each commit on their own, then swapped in by a short transaction
+            3. with `rounds_partition_size`, move an unpartitioned rounds table into a range-partitioned one the same way:
+               a shadow table kept in sync by a trigger, backfilled in batches, then swapped in by renames
+            4. build missing indexes with CREATE INDEX CONCURRENTLY, partition by partition on a partitioned table
+
+        Args:
+            engine (Engine): engine of the target database.
+            batch_size (int, optional): Number of round_ids backfilled per transaction. Defaults to 5000.
+            lock_timeout (str, optional): Postgres lock_timeout for every step that locks a live table, so it gives up instead of queueing behind long queries. Defaults to "10s".
+            rounds_partition_size (int, optional): round_ids per partition of the rounds table, 0 leaves it unpartitioned. Defaults to 0.
+        """
+        self._log = logging.getLogger(__name__)
+        self.engine = engine
+        self.BATCH_SIZE = batch_size
+        self.LOCK_TIMEOUT = lock_timeout
+        self.ROUNDS_PARTITION_SIZE = rounds_partition_size
+
+        self._preparer = engine.dialect.identifier_preparer
+        self.tables = [
+            round_table,
+            metadata_table,
+            dead_letter_table,
+            sync_state_table,
+            sync_gap_table,
+            raw_payload_table,
+            *fact_tables.values(),
+        ]
+
+    def migrate(self) -> None:
+        for table in self.tables:
+            self.add_missing_columns(table)
+            self.convert_datetime_columns(table)
+
+            if table is round_table and self.ROUNDS_PARTITION_SIZE:
+                self.partition_rounds()
+
+            self.create_missing_indexes(table)
+
+        with self.engine.begin() as connection:
+            connection.execute(
+                text(f"DROP FUNCTION IF EXISTS {self._preparer.quote_schema(round_table.schema)}.para_stats_try_timestamptz(text)")
+            )
+
+        self._log.info("Schema is up to date")
+
+    def _column_types(self, connection, table) -> dict:
+        result = connection.execute(
+            text(
+                "SELECT column_name, data_type FROM information_schema.columns "
+                "WHERE table_schema = :schema AND table_name = :table"
+            ),
+            {"schema": table.schema, "table": table.name},
+        )
+
+        return dict(result.fetchall())
+
+    def _relkind(self, connection, schema: str, name: str) -> str | None:
+        return connection.execute(
+            text(
+                "SELECT c.relkind FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace "
+                "WHERE n.nspname = :schema AND c.relname = :name"
+            ),
+            {"schema": schema, "name": name},
+        ).scalar()
+
+    def _partitions(self, connection, table) -> list[str]:
+        result = connection.execute(
+            text(
+                "SELECT c.relname FROM pg_inherits i "
+                "JOIN pg_class c ON c.oid = i.inhrelid "
+                "JOIN pg_class p ON p.oid = i.inhparent "
+                "JOIN pg_namespace n ON n.oid = p.relnamespace "
+                "WHERE n.nspname = :schema AND p.relname = :table ORDER BY c.relname"
+            ),
+            {"schema": table.schema, "table": table.name},
+        )
+
+        return [name for (name,) in result]
+
+    def add_missing_columns(self, table) -> None:
+        target = self._preparer.format_table(table)
+        ddl_compiler = self.engine.dialect.ddl_compiler(self.engine.dialect, None)
+
+        with self.engine.begin() as connection:
+            connection.execute(text(f"SET LOCAL lock_timeout = '{self.LOCK_TIMEOUT}'"))
+            existing_columns = self._column_types(connection, table)
+
+            for column in table.columns:
+                if column.name in existing_columns:
+                    continue
+
+                column_type = column.type.compile(dialect=self.engine.dialect)
+
+                # a stable default like now() is stored once in the catalog, existing rows aren't rewritten to fill it in
+                if column.server_default is not None:
+                    column_type += f" DEFAULT {ddl_compiler.get_column_default_string(column)}"
+
+                    if not column.nullable:
+                        column_type += " NOT NULL"
+
+                self._log.info(f"Adding column {column.name} {column_type} to {table.fullname}")
+
+                connection.execute(
+                    text(f"ALTER TABLE {target} ADD COLUMN IF NOT EXISTS {self._preparer.quote(column.name)} {column_type}")
+                )
+
+    def convert_datetime_columns(self, table) -> None:
+        with self.engine.connect() as connection:
+            existing_columns = self._column_types(connection, table)
+
+        columns = [
+            column.name
+            for column in table.columns
+            if isinstance(column.type, DateTime) and existing_columns.get(column.name) == "text"
+        ]
+
+        if not columns:
+            return
+
+        self._log.info(f"Converting {columns} of {table.fullname} to timestamptz")
+
+        target = self._preparer.format_table(table)
+        schema = self._preparer.quote_schema(table.schema)
+        cast_function = f"{schema}.para_stats_try_timestamptz"
+        sync_function = self._preparer.quote(f"{table.name}_tz_sync")
+        trigger = self._preparer.quote(f"{table.name}_tz_sync")
+        shadows = {column: self._preparer.quote(f"{column}__tz") for column in columns}
+        quoted = {column: self._preparer.quote(column) for column in columns}
+
+        # ADD COLUMN and CREATE TRIGGER take locks on the live table, queued behind a long query they'd block every writer
+        with self.engine.begin() as connection:
+            connection.execute(text(f"SET LOCAL lock_timeout = '{self.LOCK_TIMEOUT}'"))
+
+            # naive strings are read as UTC, malformed ones become NULL instead of failing the batch
+            connection.execute(
+                text(
+                    f"CREATE OR REPLACE FUNCTION {cast_function}(value text) RETURNS timestamptz "
+                    f"LANGUAGE plpgsql IMMUTABLE SET timezone = 'UTC' AS $$ "
+                    f"BEGIN RETURN NULLIF(value, '')::timestamptz; "
+                    f"EXCEPTION WHEN others THEN RETURN NULL; END $$"
+                )
+            )
+
+            for column in columns:
+                connection.execute(text(f"ALTER TABLE {target} ADD COLUMN IF NOT EXISTS {shadows[column]} timestamptz"))
+
+            # keeps rows written while the backfill runs in sync
+            assignments = " ".join(
+                f"NEW.{shadows[column]} := {cast_function}(NEW.{quoted[column]}::text);" for column in columns
+            )
+            connection.execute(
+                text(
+                    f"CREATE OR REPLACE FUNCTION {schema}.{sync_function}() RETURNS trigger "
+                    f"LANGUAGE plpgsql AS $$ BEGIN {assignments} RETURN NEW; END $$"
+                )
+            )
+            connection.execute(text(f"DROP TRIGGER IF EXISTS {trigger} ON {target}"))
+            connection.execute(
+                text(
+                    f"CREATE TRIGGER {trigger} BEFORE INSERT OR UPDATE ON {target} "
+                    f"FOR EACH ROW EXECUTE FUNCTION {schema}.{sync_function}()"
+                )
+            )
+
+        with self.engine.connect() as connection:
+            min_round_id, max_round_id = connection.execute(
+                text(f"SELECT min(round_id), max(round_id) FROM {target}")
+            ).one()
+
+        if min_round_id is not None:
+            set_list = ", ".join(f"{shadows[column]} = {cast_function}({quoted[column]})" for column in columns)
+
+            for batch_start in range(min_round_id, max_round_id + 1, self.BATCH_SIZE):
+                # one short transaction per batch, so row locks are only ever held on one batch
+                with self.engine.begin() as connection:
+                    connection.execute(
+                        text(f"UPDATE {target} SET {set_list} WHERE round_id >= :start AND round_id < :end"),
+                        {"start": batch_start, "end": batch_start + self.BATCH_SIZE},
+                    )
+
+                self._log.info(
+                    f"Backfilled {table.fullname} up to round_id {min(batch_start + self.BATCH_SIZE - 1, max_round_id)} of {max_round_id}"
+                )
+
+        # the swap only touches the catalog, so the exclusive lock is held for milliseconds
+        with self.engine.begin() as connection:
+            connection.execute(text(f"SET LOCAL lock_timeout = '{self.LOCK_TIMEOUT}'"))
+            connection.execute(text(f"DROP TRIGGER {trigger} ON {target}"))
+
+            for column in columns:
+                connection.execute(text(f"ALTER TABLE {target} DROP COLUMN {quoted[column]}"))
+                connection.execute(text(f"ALTER TABLE {target} RENAME COLUMN {shadows[column]} TO {quoted[column]}"))
+
+            connection.execute(text(f"DROP FUNCTION {schema}.{sync_function}()"))
+
+        self._log.info(f"Swapped timestamptz columns into {table.fullname}")
+
+    def partition_rounds(self) -> None:
+        """Moves an unpartitioned rounds table into one range-partitioned by round_id. The old table is kept, renamed, until dropped by hand."""
+        table = round_table
+        size = self.ROUNDS_PARTITION_SIZE
+        schema_name = table.schema
+        schema = self._preparer.quote_schema(schema_name)
+        target = self._preparer.format_table(table)
+
+        with self.engine.connect() as connection:
+            if self._relkind(connection, schema_name, table.name) != "r":
+                return
+
+            existing_columns = list(self._column_types(connection, table))
+
+        shadow_name = f"{table.name}__partitioned"
+        old_name = f"{table.name}__unpartitioned"
+        shadow = f"{schema}.{self._preparer.quote(shadow_name)}"
+        sync_function = f"{schema}.{self._preparer.quote(f'{table.name}_partition_sync')}"
+        trigger = self._preparer.quote(f"{table.name}_partition_sync")
+
+        self._log.info(f"Moving {table.fullname} into partitions of {size} round_ids")
+
+        update_list = ", ".join(
+            f"{self._preparer.quote(column)} = EXCLUDED.{self._preparer.quote(column)}"
+            for column in existing_columns
+            if column != "round_id"
+        )
+
+        def create_partition(lower_bound: int) -> str:
+            partition = f"{schema}.{self._preparer.quote(round_partition_name(table.name, lower_bound))}"
+            return f"CREATE TABLE IF NOT EXISTS {partition} PARTITION OF {shadow} FOR VALUES FROM ({lower_bound}) TO ({lower_bound + size})"
+
+        with self.engine.begin() as connection:
+            connection.execute(text(f"SET LOCAL lock_timeout = '{self.LOCK_TIMEOUT}'"))
+
+            # same columns in the same order, so the trigger can copy whole rows
+            connection.execute(
+                text(
+                    f"CREATE TABLE IF NOT EXISTS {shadow} (LIKE {target} INCLUDING DEFAULTS INCLUDING STORAGE, "
+                    f"CONSTRAINT {self._preparer.quote(f'{shadow_name}_pkey')} PRIMARY KEY (round_id)) "
+                    f"PARTITION BY RANGE (round_id)"
+                )
+            )
+
+            # keeps rows written while the backfill runs in sync, creating their partition when it's new
+            connection.execute(
+                text(
+                    f"CREATE OR REPLACE FUNCTION {sync_function}() RETURNS trigger LANGUAGE plpgsql AS $$ "
+                    f"DECLARE lower_bound integer; partition_name text; BEGIN "
+                    f"IF TG_OP = 'DELETE' THEN DELETE FROM {shadow} WHERE round_id = OLD.round_id; RETURN NULL; END IF; "
+                    f"lower_bound := floor(NEW.round_id::numeric / {size})::integer * {size}; "
+                    f"partition_name := '{table.name}_p' || lpad(lower_bound::text, 10, '0'); "
+                    f"IF to_regclass(format('%I.%I', '{schema_name}', partition_name)) IS NULL THEN "
+                    f"EXECUTE format('CREATE TABLE IF NOT EXISTS %I.%I PARTITION OF {shadow} FOR VALUES FROM (%s) TO (%s)', "
+                    f"'{schema_name}', partition_name, lower_bound, lower_bound + {size}); END IF; "
+                    f"INSERT INTO {shadow} SELECT (NEW).* ON CONFLICT (round_id) DO UPDATE SET {update_list}; "
+                    f"RETURN NULL; END $$"
+                )
+            )
+            connection.execute(text(f"DROP TRIGGER IF EXISTS {trigger} ON {target}"))
+            connection.execute(
+                text(
+                    f"CREATE TRIGGER {trigger} AFTER INSERT OR UPDATE OR DELETE ON {target} "
+                    f"FOR EACH ROW EXECUTE FUNCTION {sync_function}()"
+                )
+            )
+
+        with self.engine.connect() as connection:
+            min_round_id, max_round_id = connection.execute(
+                text(f"SELECT min(round_id), max(round_id) FROM {target}")
+            ).one()
+
+        if min_round_id is not None:
+            with self.engine.begin() as connection:
+                for lower_bound in range(min_round_id // size * size, max_round_id + 1, size):
+                    connection.execute(text(create_partition(lower_bound)))
+
+            for batch_start in range(min_round_id, max_round_id + 1, self.BATCH_SIZE):
+                # rows the trigger already copied are newer than this batch's snapshot, so they're left alone
+                with self.engine.begin() as connection:
+                    connection.execute(
+                        text(
+                            f"INSERT INTO {shadow} SELECT * FROM {target} WHERE round_id >= :start AND round_id < :end "
+                            f"ON CONFLICT (round_id) DO NOTHING"
+                        ),
+                        {"start": batch_start, "end": batch_start + self.BATCH_SIZE},
+                    )
+
+                self._log.info(
+                    f"Copied {table.fullname} up to round_id {min(batch_start + self.BATCH_SIZE - 1, max_round_id)} of {max_round_id}"
+                )
+
+        # renames only, so the exclusive lock is held for milliseconds
+        with self.engine.begin() as connection:
+            connection.execute(text(f"SET LOCAL lock_timeout = '{self.LOCK_TIMEOUT}'"))
+            connection.execute(text(f"DROP TRIGGER {trigger} ON {target}"))
+            connection.execute(text(f"DROP FUNCTION {sync_function}()"))
+
+            # index names are unique per schema, the old table's make way for the ones built on the new table
+            old_indexes = connection.execute(
+                text("SELECT indexname FROM pg_indexes WHERE schemaname = :schema AND tablename = :table"),
+                {"schema": schema_name, "table": table.name},
+            ).scalars().all()
+
+            connection.execute(text(f"ALTER TABLE {target} RENAME TO {self._preparer.quote(old_name)}"))
+
+            for index_name in old_indexes:
+                connection.execute(
+                    text(
+                        f"ALTER INDEX {schema}.{self._preparer.quote(index_name)} "
+                        f"RENAME TO {self._preparer.quote(f'{index_name}__unpartitioned')}"
+                    )
+                )
+
+            connection.execute(text(f"ALTER TABLE {shadow} RENAME TO {self._preparer.quote(table.name)}"))
+            connection.execute(
+                text(
+                    f"ALTER TABLE {target} RENAME CONSTRAINT {self._preparer.quote(f'{shadow_name}_pkey')} "
+                    f"TO {self._preparer.quote(f'{table.name}_pkey')}"
+                )
+            )
+
+        self._log.info(f"Swapped partitioned {table.fullname} in, the old table is kept as {old_name} until dropped by hand")
+
+    def _index_is_valid(self, connection, schema: str, index_name: str) -> bool | None:
+        return connection.execute(
+            text(
+                "SELECT i.indisvalid FROM pg_index i "
+                "JOIN pg_class c ON c.oid = i.indexrelid "
+                "JOIN pg_namespace n ON n.oid = c.relnamespace "
+                "WHERE n.nspname = :schema AND c.relname = :index"
+            ),
+            {"schema": schema, "index": index_name},
+        ).scalar()
+
+    def _create_partitioned_index(self, connection, table, index) -> None:
+        """
+        CREATE INDEX CONCURRENTLY doesn't work on a partitioned table, so the index is created on the parent alone, built
+        concurrently on each partition and attached to it. The parent's index turns valid once every partition's is attached.
+        """
+        schema = self._preparer.quote_schema(table.schema)
+        target = self._preparer.format_table(table)
+        create_index = str(CreateIndex(index, if_not_exists=True).compile(dialect=self.engine.dialect))
+        on_clause = f" ON {target} "
+
+        connection.execute(text(create_index.replace(on_clause, f" ON ONLY {target} ", 1)))
+
+        for partition in self._partitions(connection, table):
+            partition_index = (
+                index.name.replace(table.name, partition, 1) if table.name in index.name else f"{partition}_{index.name}"
+            )
+
+            is_attached = connection.execute(
+                text(
+                    "SELECT 1 FROM pg_inherits i "
+                    "JOIN pg_index x ON x.indexrelid = i.inhrelid "
+                    "WHERE i.inhparent = to_regclass(:parent_index) AND x.indrelid = to_regclass(:partition)"
+                ),
+                {"parent_index": f"{schema}.{self._preparer.quote(index.name)}", "partition": f"{schema}.{self._preparer.quote(partition)}"},
+            ).scalar()
+
+            if is_attached:
+                continue
+
+            if self._index_is_valid(connection, table.schema, partition_index) is False:
+                self._log.warning(f"Dropping invalid index {partition_index}")
+                connection.execute(text(f"DROP INDEX CONCURRENTLY {schema}.{self._preparer.quote(partition_index)}"))
+
+            self._log.info(f"Building index {partition_index} on partition {partition}")
+
+            connection.execute(
+                text(
+                    create_index.replace(index.name, partition_index, 1)
+                    .replace(on_clause, f" ON {schema}.{self._preparer.quote(partition)} ", 1)
+                    .replace("CREATE INDEX", "CREATE INDEX CONCURRENTLY", 1)
+                )
+            )
+            connection.execute(
+                text(
+                    f"ALTER INDEX {schema}.{self._preparer.quote(index.name)} "
+                    f"ATTACH PARTITION {schema}.{self._preparer.quote(partition_index)}"
+                )
+            )
+
+    def create_missing_indexes(self, table) -> None:
+        # CREATE INDEX CONCURRENTLY can't run inside a transaction block
+        with self.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+            is_partitioned = self._relkind(connection, table.schema, table.name) == "p"
+
+            for index in table.indexes:
+                # a failed concurrent build leaves an invalid index behind that IF NOT EXISTS would skip
+                is_valid = self._index_is_valid(connection, table.schema, index.name)
+
+                if is_valid:
+                    continue
+
+                if is_partitioned:
+                    self._log.info(f"Building index {index.name} on partitioned {table.fullname}")
+                    self._create_partitioned_index(connection, table, index)
+                    continue
+
+                if is_valid is False:
+                    self._log.warning(f"Dropping invalid index {index.name}")
+                    connection.execute(
+                        text(f"DROP INDEX CONCURRENTLY {self._preparer.quote_schema(table.schema)}.{self._preparer.quote(index.name)}")
+                    )
+
+                self._log.info(f"Building index {index.name} on {table.fullname}")
+
+                create_index = str(CreateIndex(index, if_not_exists=True).compile(dialect=self.engine.dialect))
+                connection.execute(text(create_index.replace("CREATE INDEX", "CREATE INDEX CONCURRENTLY", 1)))
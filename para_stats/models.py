@@ -1,6 +1,6 @@
 from config import Config
-from sqlalchemy import Column, Table, MetaData
-from sqlalchemy.types import Integer, Text
+from sqlalchemy import Column, Index, Table, MetaData, func
+from sqlalchemy.types import DateTime, Double, Integer, LargeBinary, Text
 from sqlalchemy.dialects.postgresql import JSONB
 
 """
@@ -9,36 +9,171 @@ https://blog.codinghorror.com/object-relational-mapping-is-the-vietnam-of-comput
 
 db_metadata = MetaData(schema=Config.db_ods_schema)
 
+
+def round_partition_name(table_name: str, lower_bound: int) -> str:
+    """Name of the partition of a range-partitioned rounds table starting at round_id `lower_bound`, ex: rounds_p0000100000"""
+    return f"{table_name}_p{lower_bound:010d}"
+
+
+# existing schemas with Text datetime columns, or an unpartitioned rounds table, are converted in place by `python main.py migrate`
 round_table = Table(
     Config.db_ods_rounds_table,
     db_metadata,
     Column("round_id", Integer, primary_key=True),
-    Column("init_datetime", Text),
-    Column("start_datetime", Text),
-    Column("shutdown_datetime", Text),
-    Column("end_datetime", Text),
+    Column("init_datetime", DateTime(timezone=True)),
+    Column("start_datetime", DateTime(timezone=True)),
+    Column("shutdown_datetime", DateTime(timezone=True)),
+    Column("end_datetime", DateTime(timezone=True)),
     Column("commit_hash", Text),
     Column("game_mode", Text),
     Column("game_mode_result", Text),
     Column("end_state", Text),
     Column("map_name", Text),
     Column("server_id", Text),
-    Column("playercounts", JSONB),
-    Column("stats", JSONB)
+    # none_as_null, so rounds stored compact have a SQL NULL here instead of a JSON null
+    Column("playercounts", JSONB(none_as_null=True)),
+    Column("stats", JSONB),
+    # compact playercounts, see TransformData.compact_playercounts. NULL when the round only has the JSONB.
+    Column("playercount_start", DateTime(timezone=True)),
+    Column("playercount_interval", Integer),
+    Column("playercount_deltas", LargeBinary),
+    # TransformData.content_hash of the row, unchanged rows are neither sent nor rewritten
+    Column("content_hash", Text),
+    # TRANSFORM_VERSION of the cleaning rules that built stats, `reprocess` rebuilds older rounds from the raw payloads
+    Column("transform_version", Integer),
+    # start of the transaction that last wrote the row, set by the database and never by the loader. Exports pick up the
+    # rounds loaded since the previous one by it, whatever their round_id.
+    Column("loaded_at", DateTime(timezone=True), nullable=False, server_default=func.now()),
+    Index(f"ix_{Config.db_ods_rounds_table}_end_datetime", "end_datetime"),
+    Index(f"ix_{Config.db_ods_rounds_table}_loaded_at", "loaded_at"),
+    Index(f"ix_{Config.db_ods_rounds_table}_game_mode", "game_mode"),
+    Index(f"ix_{Config.db_ods_rounds_table}_map_name", "map_name"),
+    Index(f"ix_{Config.db_ods_rounds_table}_stats", "stats", postgresql_using="gin"),
+    # with PARA_STATS_ROUNDS_PARTITION_SIZE, one partition per block of round_ids, created by the loader as rounds arrive.
+    # round_id is the only key that keeps the primary key, and so ON CONFLICT (round_id), valid on a partitioned table.
+    **({"postgresql_partition_by": "RANGE (round_id)"} if Config.db_rounds_partition_size else {}),
 )
 
 metadata_table = Table(
     Config.db_ods_metadata_table,
     db_metadata,
     Column("round_id", Integer, primary_key=True),
-    Column("init_datetime", Text),
-    Column("start_datetime", Text),
-    Column("shutdown_datetime", Text),
-    Column("end_datetime", Text),
+    Column("init_datetime", DateTime(timezone=True)),
+    Column("start_datetime", DateTime(timezone=True)),
+    Column("shutdown_datetime", DateTime(timezone=True)),
+    Column("end_datetime", DateTime(timezone=True)),
     Column("commit_hash", Text),
     Column("game_mode", Text),
     Column("game_mode_result", Text),
     Column("end_state", Text),
     Column("map_name", Text),
     Column("server_id", Text),
-)
\ No newline at end of file
+    Column("content_hash", Text),
+    Index(f"ix_{Config.db_ods_metadata_table}_end_datetime", "end_datetime"),
+    Index(f"ix_{Config.db_ods_metadata_table}_game_mode", "game_mode"),
+    Index(f"ix_{Config.db_ods_metadata_table}_map_name", "map_name"),
+)
+
+# rounds whose fetch or transform failed, retried by later runs once next_retry_at has passed
+dead_letter_table = Table(
+    Config.db_ods_dead_letter_table,
+    db_metadata,
+    Column("round_id", Integer, primary_key=True),
+    Column("stage", Text),
+    Column("error_class", Text),
+    Column("error_message", Text),
+    Column("http_status", Integer),
+    Column("attempt_count", Integer, nullable=False),
+    Column("first_failed_at", DateTime(timezone=True), nullable=False),
+    Column("last_failed_at", DateTime(timezone=True), nullable=False),
+    Column("next_retry_at", DateTime(timezone=True), nullable=False),
+    Index(f"ix_{Config.db_ods_dead_letter_table}_next_retry_at", "next_retry_at"),
+)
+
+# high-water marks of the incremental sync, one row per name:
+#   metadata: newest round_id pulled from the roundlist
+#   rounds: every metadata row at or below it has been loaded or dead-lettered
+sync_state_table = Table(
+    Config.db_ods_sync_state_table,
+    db_metadata,
+    Column("name", Text, primary_key=True),
+    Column("round_id", Integer, nullable=False),
+    Column("updated_at", DateTime(timezone=True), nullable=False),
+)
+
+# round_id ranges missing from the roundlist below the metadata watermark, usually rounds still in progress
+# when the roundlist was read. Rechecked on every run until they're filled or old enough to be given up on.
+sync_gap_table = Table(
+    Config.db_ods_sync_gap_table,
+    db_metadata,
+    Column("gap_start", Integer, primary_key=True),
+    Column("gap_end", Integer, nullable=False),
+    Column("check_count", Integer, nullable=False),
+    Column("first_seen_at", DateTime(timezone=True), nullable=False),
+    Column("last_checked_at", DateTime(timezone=True)),
+)
+
+# untouched /playercounts and /blackbox responses of fetched rounds, as zlib-compressed JSON, landed with PARA_STATS_LAND_RAW.
+# transform_version is the TRANSFORM_VERSION that was current when the round was fetched.
+raw_payload_table = Table(
+    Config.db_ods_raw_payload_table,
+    db_metadata,
+    Column("round_id", Integer, primary_key=True),
+    Column("playercounts", LargeBinary),
+    Column("blackbox", LargeBinary),
+    Column("transform_version", Integer, nullable=False),
+    Column("landed_at", DateTime(timezone=True), nullable=False),
+)
+
+# blackbox fact tables, one narrow row per metric value, split by key_type. Filled from the same cleaned
+# response that goes into round_table.stats, so cross-round aggregates never have to detoast the JSONB.
+# key_type "amount" is a single number and lands in the tally table with an empty sub_key.
+tally_table = Table(
+    Config.db_ods_tally_table,
+    db_metadata,
+    Column("round_id", Integer, primary_key=True),
+    Column("key_name", Text, primary_key=True),
+    Column("sub_key", Text, primary_key=True),
+    Column("value", Double),
+    Index(f"ix_{Config.db_ods_tally_table}_key", "key_name", "sub_key"),
+)
+
+# deeper levels than the second are joined into leaf_key with "/"
+nested_tally_table = Table(
+    Config.db_ods_nested_tally_table,
+    db_metadata,
+    Column("round_id", Integer, primary_key=True),
+    Column("key_name", Text, primary_key=True),
+    Column("sub_key", Text, primary_key=True),
+    Column("leaf_key", Text, primary_key=True),
+    Column("value", Double),
+    Index(f"ix_{Config.db_ods_nested_tally_table}_key", "key_name", "sub_key", "leaf_key"),
+)
+
+associative_table = Table(
+    Config.db_ods_associative_table,
+    db_metadata,
+    Column("round_id", Integer, primary_key=True),
+    Column("key_name", Text, primary_key=True),
+    Column("row_index", Integer, primary_key=True),
+    Column("field", Text, primary_key=True),
+    Column("value", Text),
+    Index(f"ix_{Config.db_ods_associative_table}_key", "key_name", "field"),
+)
+
+text_table = Table(
+    Config.db_ods_text_table,
+    db_metadata,
+    Column("round_id", Integer, primary_key=True),
+    Column("key_name", Text, primary_key=True),
+    Column("item_index", Integer, primary_key=True),
+    Column("value", Text),
+    Index(f"ix_{Config.db_ods_text_table}_key", "key_name"),
+)
+
+fact_tables = {
+    "tally": tally_table,
+    "nested tally": nested_tally_table,
+    "associative": associative_table,
+    "text": text_table,
+}
\ No newline at end of file
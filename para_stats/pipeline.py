@@ -0,0 +1,220 @@
+import logging
+import queue
+import threading
+
+
+# sentinel pushed through the queues once a stage has nothing left to hand downstream
+_DONE = object()
+
+
+class RoundPipeline:
+    def __init__(
+        self,
+        fetcher,
+        transformer,
+        db,
+        batch_size: int = 100,
+        queue_size: int = 2,
+        reload: bool = False,
+        load_facts: bool = False,
+        above_round_id: int | None = None,
+        stop_event: threading.Event | None = None,
+        land_raw: bool = False,
+    ) -> None:
+        """Streams missing rounds through the fetch, transform and load stages in fixed-size batches.
+
+        Each stage runs in its own thread and hands batches downstream over a bounded queue, so at most
+        `queue_size` batches can be waiting between two stages. Peak memory is therefore bounded by the
+        batch size rather than by the size of the backlog, and the first batch is upserted as soon as it
+        has been fetched and cleaned. Each round succeeds or fails on its own: failed rounds are written to the
+        dead-letter table and retried by a later run once their backoff has passed.
+
+        Args:
+            fetcher (APIFetch): fetcher used to pull playercount and blackbox data.
+            transformer (TransformData): transformer used to clean and collect each batch.
+            db (DatabaseLoader): loader used to page the metadata difference and upsert the rounds.
+            batch_size (int, optional): Number of rounds per batch. Defaults to 100.
+            queue_size (int, optional): Maximum number of batches waiting between two stages. Defaults to 2.
+            reload (bool, optional): Re-process every round in the metadata table, not just the missing ones. Defaults to False.
+            load_facts (bool, optional): Also flatten each batch into the blackbox fact tables. Defaults to False.
+            above_round_id (int | None, optional): rounds watermark, below it only dead-lettered rounds due for a retry are picked up. Defaults to None (compare the whole metadata table).
+            stop_event (threading.Event | None, optional): once set, no new batch is started, but batches already fetched are still transformed and loaded. Defaults to None.
+            land_raw (bool, optional): Also keep the untouched responses of every fetched round in the raw payload table, including rounds whose transform fails. Defaults to False.
+        """
+        self._log = logging.getLogger(__name__)
+        self._fetcher = fetcher
+        self._transformer = transformer
+        self._db = db
+
+        self.BATCH_SIZE = batch_size
+        self.QUEUE_SIZE = queue_size
+        self.RELOAD = reload
+        self.LOAD_FACTS = load_facts
+        self.ABOVE_ROUND_ID = above_round_id
+        self.LAND_RAW = land_raw
+
+        self._stop = threading.Event()
+        self._drain = stop_event if stop_event is not None else threading.Event()
+        self._errors = []
+
+    def _put(self, target_queue: queue.Queue, item) -> bool:
+        """Blocking put that gives up once another stage has failed. Returns False if the pipeline is stopping."""
+        while not self._stop.is_set():
+            try:
+                target_queue.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+
+        return False
+
+    def _get(self, source_queue: queue.Queue):
+        """Blocking get that gives up once another stage has failed. Returns `_DONE` if the pipeline is stopping."""
+        while not self._stop.is_set():
+            try:
+                return source_queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+
+        return _DONE
+
+    def _fail(self, stage: str, e: Exception) -> None:
+        self._log.exception(f"Pipeline stage {stage} failed, stopping pipeline", exc_info=e)
+        self._errors.append(e)
+        self._stop.set()
+
+    def _iter_metadata_batches(self):
+        """Pages through the metadata difference newest-first with keyset pagination."""
+        before_round_id = None
+
+        while not self._stop.is_set() and not self._drain.is_set():
+            metadata_batch = self._db.db_fetch_metadata_difference_page(
+                self.BATCH_SIZE, before_round_id, include_loaded=self.RELOAD, above_round_id=self.ABOVE_ROUND_ID
+            )
+
+            if not metadata_batch:
+                return
+
+            yield metadata_batch
+
+            before_round_id = metadata_batch[-1]["round_id"]
+
+    def _fetch_stage(self, fetch_queue: queue.Queue) -> None:
+        try:
+            for metadata_batch in self._iter_metadata_batches():
+                round_id_list = [entry["round_id"] for entry in metadata_batch]
+                fetch_failures = {}
+
+                playercount_list, raw_blackbox_list = self._fetcher.fetch_round_data_bulk(
+                    round_id_list, failures=fetch_failures
+                )
+
+                if not self._put(fetch_queue, (metadata_batch, playercount_list, raw_blackbox_list, fetch_failures)):
+                    return
+
+        except Exception as e:
+            self._fail("fetch", e)
+
+        finally:
+            self._put(fetch_queue, _DONE)
+
+    def _transform_stage(self, fetch_queue: queue.Queue, load_queue: queue.Queue) -> None:
+        try:
+            while (batch := self._get(fetch_queue)) is not _DONE:
+                metadata_batch, playercount_list, raw_blackbox_list, fetch_failures = batch
+                failures = dict(fetch_failures)
+
+                facts = None
+                raw_payloads = None
+
+                if self.LAND_RAW:
+                    raw_payloads = self._transformer.collect_raw_payload_batch(
+                        [metadata["round_id"] for metadata in metadata_batch], playercount_list, raw_blackbox_list, fetch_failures
+                    )
+
+                if self.LOAD_FACTS:
+                    # key types have to be read off the raw entries before cleaning drops them
+                    key_types_by_round = {
+                        metadata["round_id"]: self._transformer.blackbox_key_types(raw_response)
+                        for metadata, raw_response in zip(metadata_batch, raw_blackbox_list)
+                    }
+
+                collected_round_list = self._transformer.collect_round_batch(
+                    metadata_batch, playercount_list, raw_blackbox_list, failures=failures
+                )
+
+                if self.LOAD_FACTS:
+                    facts = self._transformer.collect_fact_batch(collected_round_list, key_types_by_round)
+
+                transform_failures = {
+                    round_id: error for round_id, error in failures.items() if round_id not in fetch_failures
+                }
+
+                if not self._put(load_queue, (collected_round_list, facts, raw_payloads, fetch_failures, transform_failures)):
+                    return
+
+        except Exception as e:
+            self._fail("transform", e)
+
+        finally:
+            self._put(load_queue, _DONE)
+
+    def run(self) -> int:
+        """Runs the pipeline until the metadata difference is exhausted.
+
+        Raises:
+            Exception: the first exception raised by any stage. Batches upserted before the failure are kept.
+
+        Returns:
+            int: number of rounds written, unchanged rounds skipped by their content hash aren't counted
+        """
+        fetch_queue = queue.Queue(maxsize=self.QUEUE_SIZE)
+        load_queue = queue.Queue(maxsize=self.QUEUE_SIZE)
+
+        workers = [
+            threading.Thread(target=self._fetch_stage, args=(fetch_queue,), name="pipeline-fetch", daemon=True),
+            threading.Thread(target=self._transform_stage, args=(fetch_queue, load_queue), name="pipeline-transform", daemon=True),
+        ]
+
+        for worker in workers:
+            worker.start()
+
+        loaded_rowcount = 0
+        failed_rowcount = 0
+
+        # the load stage runs in the calling thread so the DB session never crosses threads
+        try:
+            while (batch := self._get(load_queue)) is not _DONE:
+                collected_round_list, facts, raw_payloads, fetch_failures, transform_failures = batch
+
+                # landed first, so a round whose transform failed can still be reprocessed once the rules are fixed
+                if raw_payloads:
+                    self._db.db_land_raw_payloads(raw_payloads)
+
+                if collected_round_list:
+                    # rounds whose content hash didn't change aren't written, so aren't counted
+                    loaded_rowcount += self._db.db_upload_rounds(collected_round_list)
+
+                    if facts is not None:
+                        self._db.db_upload_facts(facts, [entry["round_id"] for entry in collected_round_list])
+
+                self._db.db_record_failures(fetch_failures, "fetch")
+                self._db.db_record_failures(transform_failures, "transform")
+                failed_rowcount += len(fetch_failures) + len(transform_failures)
+
+        except Exception as e:
+            self._fail("load", e)
+
+        finally:
+            # no-op after a clean run, unblocks the other stages after a failure or interrupt
+            self._stop.set()
+
+            for worker in workers:
+                worker.join()
+
+        if self._errors:
+            raise self._errors[0]
+
+        self._log.info(f"Pipeline finished, {loaded_rowcount} rounds loaded, {failed_rowcount} rounds dead-lettered")
+
+        return loaded_rowcount
@@ -0,0 +1,201 @@
+import asyncio
+import logging
+import math
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from .metrics import RATE_LIMIT_RATE, RATE_LIMIT_REMAINING
+
+
+class RateLimiter:
+    def __init__(
+        self,
+        initial_rate: float = 10.0,
+        burst: int = 10,
+        reserve: int = 2,
+        max_concurrency: int = 10,
+        default_window: float = 60.0,
+    ) -> None:
+        """Thread-safe token bucket shared by every request an `APIFetch` makes.
+
+        The refill rate is re-derived from the `X-Rate-Limit-*` headers of each response so that the remaining quota
+        is spread evenly over the time left until the limit resets. A 429 pauses every worker until the server's
+        `Retry-After`/reset time, and the number of workers worth running is estimated from the current rate and the
+        observed request latency (Little's law).
+
+        Args:
+            initial_rate (float, optional): Requests per second allowed before the first rate limit headers are seen. Defaults to 10.0.
+            burst (int, optional): Bucket capacity, i.e. how many requests may be sent back to back. Defaults to 10.
+            reserve (int, optional): Number of requests per window left unused as headroom so we never hit the hard limit. Defaults to 2.
+            max_concurrency (int, optional): Upper bound returned by `concurrency()`. Defaults to 10.
+            default_window (float, optional): Window length in seconds assumed when the server sends no reset time. Defaults to 60.0.
+        """
+        self._log = logging.getLogger(__name__)
+        # reentrant so acquire() can wait on the condition while try_acquire() takes the lock again
+        self._cond = threading.Condition(threading.RLock())
+
+        self.BURST = burst
+        self.RESERVE = reserve
+        self.MAX_CONCURRENCY = max_concurrency
+        self.DEFAULT_WINDOW = default_window
+
+        self.rate = initial_rate
+        self.remaining = None
+        self._tokens = float(burst)
+        self._last_refill = time.monotonic()
+        self._paused_until = 0.0
+        self._reset_at = None
+        self._latency = None
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.BURST, self._tokens + (now - self._last_refill) * self.rate)
+        self._last_refill = now
+
+    def try_acquire(self) -> float:
+        """Takes a token if one is available. Returns 0 on success, otherwise the number of seconds to wait before trying again."""
+        with self._cond:
+            now = time.monotonic()
+
+            if now < self._paused_until:
+                return self._paused_until - now
+
+            self._refill(now)
+
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+
+            return (1 - self._tokens) / self.rate if self.rate > 0 else self.DEFAULT_WINDOW
+
+    def acquire(self) -> None:
+        """Blocks until a request may be sent."""
+        with self._cond:
+            while (wait := self.try_acquire()) > 0:
+                self._cond.wait(wait)
+
+    async def acquire_async(self) -> None:
+        """Waits without blocking the event loop until a request may be sent."""
+        while (wait := self.try_acquire()) > 0:
+            await asyncio.sleep(wait)
+
+    def pause(self, seconds: float) -> None:
+        """Stops every worker from sending for `seconds`, e.g. after a 429."""
+        with self._cond:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._tokens = 0.0
+            self._cond.notify_all()
+
+        self._log.warning(f"Rate limiter paused for {seconds:.1f} sec")
+
+    def update(self, headers, elapsed: float | None = None) -> None:
+        """Re-derives the refill rate from a response's rate limit headers.
+
+        Args:
+            headers (Mapping): response headers. Reads `X-Rate-Limit-Remaining` and, when present, `X-Rate-Limit-Reset` and `X-Rate-Limit-Limit`.
+            elapsed (float | None, optional): request latency in seconds, used to size concurrency. Defaults to None.
+        """
+        remaining = headers.get("X-Rate-Limit-Remaining")
+        reset_in = self.parse_reset(headers.get("X-Rate-Limit-Reset"))
+
+        if reset_in is None:
+            reset_in = self.parse_period(headers.get("X-Rate-Limit-Limit"))
+
+        with self._cond:
+            if elapsed is not None:
+                # exponentially weighted so a few slow requests don't collapse concurrency
+                self._latency = elapsed if self._latency is None else 0.8 * self._latency + 0.2 * elapsed
+
+            if remaining is None:
+                return
+
+            now = time.monotonic()
+            self._refill(now)
+            self.remaining = int(remaining)
+
+            window = reset_in if reset_in is not None else self.DEFAULT_WINDOW
+            usable = max(self.remaining - self.RESERVE, 0)
+
+            if usable == 0:
+                self._paused_until = max(self._paused_until, now + window)
+                self._tokens = 0.0
+                self._log.warning(f"Rate limit headroom exhausted, pausing for {window:.1f} sec")
+            else:
+                self.rate = usable / max(window, 1.0)
+                # never hold more tokens than the server will still accept this window
+                self._tokens = min(self._tokens, float(usable))
+
+            RATE_LIMIT_REMAINING.set(self.remaining)
+            RATE_LIMIT_RATE.set(self.rate)
+
+            self._cond.notify_all()
+
+    def backoff(self, attempt: int, headers=None) -> float:
+        """Returns how long to wait before retrying after a 429. Prefers the server's `Retry-After`/reset time over exponential backoff."""
+        delay = None
+
+        if headers is not None:
+            delay = self.parse_reset(headers.get("Retry-After"))
+
+            if delay is None:
+                delay = self.parse_reset(headers.get("X-Rate-Limit-Reset"))
+
+        if delay is None:
+            delay = min(2 ** attempt, self.DEFAULT_WINDOW)
+
+        # jitter so the workers don't all come back in the same instant
+        return delay + random.uniform(0, 1)
+
+    def concurrency(self) -> int:
+        """Number of concurrent workers needed to keep up with the current rate at the observed latency."""
+        with self._cond:
+            if self._latency is None:
+                return self.MAX_CONCURRENCY
+
+            needed = math.ceil(self.rate * self._latency) + 1
+
+        return max(1, min(self.MAX_CONCURRENCY, needed))
+
+    @staticmethod
+    def parse_reset(value: str | None) -> float | None:
+        """Parses a reset/retry header into seconds from now. Accepts delta seconds, an epoch timestamp or an ISO 8601 datetime."""
+        if not value:
+            return None
+
+        try:
+            number = float(value)
+        except ValueError:
+            number = None
+
+        if number is not None:
+            # anything this large is an epoch timestamp rather than a delta
+            if number > 1e9:
+                return max(number - time.time(), 0.0)
+            return max(number, 0.0)
+
+        try:
+            reset_at = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return None
+
+        if reset_at.tzinfo is None:
+            reset_at = reset_at.replace(tzinfo=timezone.utc)
+
+        return max((reset_at - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+    @staticmethod
+    def parse_period(value: str | None) -> float | None:
+        """Parses a limit period such as `1m` or `1h` into seconds."""
+        if not value:
+            return None
+
+        units = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+        unit = value[-1].lower()
+
+        if unit not in units:
+            return None
+
+        try:
+            return float(value[:-1]) * units[unit]
+        except ValueError:
+            return None
@@ -0,0 +1,104 @@
+import logging
+import threading
+from .pipeline import RoundPipeline
+from .transform import TRANSFORM_VERSION
+
+
+class RawPayloadFetch:
+    def __init__(self, db) -> None:
+        """Stands in for APIFetch in a RoundPipeline, serving round data from the raw payload table instead of the API.
+
+        Args:
+            db (DatabaseLoader): loader of the database holding the raw payloads.
+        """
+        self._log = logging.getLogger(__name__)
+        self._db = db
+
+    def fetch_round_data_bulk(self, round_id_list: list[int], failures: dict | None = None) -> tuple:
+        """Same contract as `APIFetch.fetch_round_data_bulk`, a round without raw payloads fails with a LookupError"""
+        payloads = self._db.db_fetch_raw_payloads(round_id_list)
+
+        playercount_list = []
+        raw_blackbox_list = []
+
+        for round_id in round_id_list:
+            playercounts, raw_blackbox = payloads.get(round_id, (None, None))
+
+            if round_id not in payloads:
+                error = LookupError(f"No raw payloads landed for round {round_id}")
+
+                if failures is None:
+                    raise error
+
+                failures[round_id] = error
+
+            playercount_list.append(playercounts)
+            raw_blackbox_list.append(raw_blackbox)
+
+        return playercount_list, raw_blackbox_list
+
+
+class RoundReprocessor(RoundPipeline):
+    def __init__(
+        self,
+        transformer,
+        db,
+        start_round_id: int | None = None,
+        end_round_id: int | None = None,
+        batch_size: int = 200,
+        queue_size: int = 2,
+        load_facts: bool = False,
+        stop_event: threading.Event | None = None,
+        force: bool = False,
+    ) -> None:
+        """Rebuilds rounds from their raw payloads after the cleaning rules changed, without touching the API.
+
+        Only rounds with raw payloads whose rounds row is missing or was built by another TRANSFORM_VERSION are picked up,
+        so an interrupted run picks up where it stopped and a finished one has nothing left to do. Batches go through the
+        same read, transform and load stages as a sync, each in its own thread, and with PARA_STATS_TRANSFORM_PROCESSES
+        the blackbox cleaning of a batch is spread over worker processes. Rows come back through the regular upsert, so
+        the content hash, partitions and load method all apply, and rounds that still fail to clean are dead-lettered.
+
+        Args:
+            transformer (TransformData): transformer holding the current cleaning rules.
+            db (DatabaseLoader): loader used to read the raw payloads and upsert the rebuilt rounds.
+            start_round_id (int | None, optional): first round_id to reprocess. Defaults to None (the oldest).
+            end_round_id (int | None, optional): last round_id to reprocess. Defaults to None (the newest).
+            batch_size (int, optional): Number of rounds per batch. Defaults to 200.
+            queue_size (int, optional): Maximum number of batches waiting between two stages. Defaults to 2.
+            load_facts (bool, optional): Also rebuild the blackbox fact rows of each batch. Defaults to False.
+            stop_event (threading.Event | None, optional): once set, no new batch is started. Defaults to None.
+            force (bool, optional): Rebuild every round with raw payloads in the range whatever its transform_version, ex: after changing the blackbox key projection. Rows that come out the same are still skipped by their content hash. Defaults to False.
+        """
+        super().__init__(
+            RawPayloadFetch(db),
+            transformer,
+            db,
+            batch_size=batch_size,
+            queue_size=queue_size,
+            load_facts=load_facts,
+            stop_event=stop_event,
+        )
+
+        self.START_ROUND_ID = start_round_id
+        self.END_ROUND_ID = end_round_id
+        self.FORCE = force
+
+    def _iter_metadata_batches(self):
+        """Pages through the stale rounds oldest-first with keyset pagination."""
+        after_round_id = self.START_ROUND_ID - 1 if self.START_ROUND_ID is not None else 0
+
+        while not self._stop.is_set() and not self._drain.is_set():
+            metadata_batch = self._db.db_fetch_stale_raw_page(
+                self.BATCH_SIZE,
+                None if self.FORCE else TRANSFORM_VERSION,
+                after_round_id=after_round_id,
+                end_round_id=self.END_ROUND_ID,
+            )
+
+            if not metadata_batch:
+                return
+
+            yield metadata_batch
+
+            after_round_id = metadata_batch[-1]["round_id"]
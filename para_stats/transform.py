@@ -1,11 +1,189 @@
+import fnmatch
+import hashlib
 import logging
 import json
+import multiprocessing
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from .exceptions import BlackboxDecodeError
+from .metrics import TRANSFORM_ROUND_SECONDS, TRANSFORM_ROUNDS
+
+try:
+    import orjson
+except ImportError:  # optional dependency, installed with the `fast` extra
+    orjson = None
+
+# orjson's JSONDecodeError subclasses json.JSONDecodeError, so callers only ever need to catch the latter
+json_loads = orjson.loads if orjson is not None else json.loads
+
+DATETIME_FIELDS = ("init_datetime", "start_datetime", "shutdown_datetime", "end_datetime")
+
+PLAYERCOUNT_FORMATS = ("json", "compact", "both")
+
+# bump whenever clean_blackbox_response changes its output, `reprocess` then rebuilds every older round from its raw payloads
+TRANSFORM_VERSION = 1
+
+# compact playercount deltas, little-endian int16: a step of more than 32767 players doesn't happen
+PLAYERCOUNT_DELTA_DTYPE = "<i2"
+
+# one transformer per pool worker process, built on first use
+_worker_transformer = None
+
+
+def _init_worker(keys: list[str] | None, exclude_keys: list[str] | None, key_rules: dict | None) -> None:
+    """Pool worker initializer: builds the worker's transformer with the parent's key projection"""
+    global _worker_transformer
+
+    _worker_transformer = TransformData(keys=keys, exclude_keys=exclude_keys, key_rules=key_rules)
+
+
+def _clean_blackbox_chunk(raw_blackbox_chunk: list) -> list:
+    """Pool worker: cleans a chunk of blackbox responses, returning the exception in place of any round that fails"""
+    global _worker_transformer
+
+    if _worker_transformer is None:
+        _worker_transformer = TransformData()
+
+    return [_worker_transformer._clean_or_error(raw_response) for raw_response in raw_blackbox_chunk]
 
 
 class TransformData:
-    def __init__(self) -> None:
+    def __init__(
+        self,
+        processes: int = 1,
+        chunksize: int = 8,
+        playercount_format: str = "json",
+        keys: list[str] | None = None,
+        exclude_keys: list[str] | None = None,
+        key_rules: dict | None = None,
+    ) -> None:
+        """Cleans API responses into rows for the database.
+
+        Blackbox entries can be projected to the keys that are actually queried. Which keys to keep is decided on the
+        key_name alone, before raw_data is decoded, so dropped entries cost neither the JSON decode nor space in stats.
+        Raw payloads are landed untouched, so a changed projection can be applied to history with `reprocess --force`.
+
+        Args:
+            processes (int, optional): Worker processes used to clean blackbox responses. 1 cleans in the calling thread, 0 uses one per CPU. Defaults to 1.
+            chunksize (int, optional): Rounds sent to a worker process at a time. Defaults to 8.
+            playercount_format (str, optional): How playercounts are stored, `json` for the raw response in the playercounts JSONB, `compact` for the `playercount_*` columns only, `both` for both. Series the compact form can't hold always keep their JSONB. Defaults to "json".
+            keys (list[str] | None, optional): key_names to keep, as fnmatch patterns, ex: `["round_end_*", "admin_secrets_fun_used"]`. Defaults to None (every key).
+            exclude_keys (list[str] | None, optional): key_names to drop, as fnmatch patterns, applied after `keys`. Defaults to None.
+            key_rules (dict | None, optional): key_name to the fields kept of its data: sub-keys of a tally, or of each row of an associative list. A key with a rule is kept even when `keys` doesn't match it. Defaults to None.
+
+        Raises:
+            ValueError: unknown `playercount_format`.
+        """
         self._log = logging.getLogger(__name__)
 
+        if playercount_format not in PLAYERCOUNT_FORMATS:
+            raise ValueError(f"Unknown playercount format {playercount_format}, expected one of {PLAYERCOUNT_FORMATS}")
+
+        self.PLAYERCOUNT_FORMAT = playercount_format
+
+        self.KEYS = list(keys) if keys else None
+        self.EXCLUDE_KEYS = list(exclude_keys or [])
+        self.KEY_RULES = dict(key_rules or {})
+        # decisions per key_name, the same few hundred names come back in every round
+        self._key_projections = {}
+
+        self.PROCESSES = processes if processes > 0 else multiprocessing.cpu_count()
+        self.CHUNKSIZE = chunksize
+        self._pool = None
+
+    def close(self) -> None:
+        """Shuts down the worker pool, if one was started"""
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def _clean_or_error(self, blackbox_response: list) -> dict | Exception:
+        try:
+            return self.clean_blackbox_response(blackbox_response)
+        except Exception as e:
+            return e
+
+    def _clean_blackbox_list(self, raw_blackbox_list: list) -> list:
+        """Cleans every response in order, in the worker pool when parallel. Failed rounds hold their exception."""
+        if self.PROCESSES <= 1 or len(raw_blackbox_list) <= self.CHUNKSIZE:
+            return [self._clean_or_error(raw_response) for raw_response in raw_blackbox_list]
+
+        if self._pool is None:
+            # spawn, since the pipeline stages run in threads and forking a threaded process can deadlock
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.PROCESSES,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(self.KEYS, self.EXCLUDE_KEYS, self.KEY_RULES),
+            )
+
+        chunks = [
+            raw_blackbox_list[i : i + self.CHUNKSIZE]
+            for i in range(0, len(raw_blackbox_list), self.CHUNKSIZE)
+        ]
+
+        # map yields in submission order, so the flattened result lines up with raw_blackbox_list
+        return [
+            cleaned_response
+            for cleaned_chunk in self._pool.map(_clean_blackbox_chunk, chunks)
+            for cleaned_response in cleaned_chunk
+        ]
+
+    def parse_datetimes(self, metadata: dict) -> dict:
+        """Converts the ISO 8601 datetime strings of a metadata row to timezone-aware datetimes, in place. Naive values are taken as UTC, unparseable ones become None."""
+        for field in DATETIME_FIELDS:
+            value = metadata.get(field)
+
+            if value is None or isinstance(value, datetime):
+                continue
+
+            try:
+                parsed = datetime.fromisoformat(value)
+            except (TypeError, ValueError):
+                self._log.warning(f"Unparseable {field} {value!r} in round {metadata.get('round_id')}")
+                metadata[field] = None
+                continue
+
+            metadata[field] = parsed if parsed.tzinfo is not None else parsed.replace(tzinfo=timezone.utc)
+
+        return metadata
+
+    def prep_metadata(self, metadata_list: list) -> list:
+        """Prepares roundlist entries for upload"""
+        for metadata in metadata_list:
+            self.parse_datetimes(metadata)
+            metadata["content_hash"] = self.content_hash(metadata)
+
+        return metadata_list
+
+    def _key_projection(self, key_name: str) -> tuple[bool, list | None]:
+        """Whether a key is kept, and the fields its rule keeps (None for all of them)"""
+        projection = self._key_projections.get(key_name)
+
+        if projection is None:
+            name = str(key_name)
+            rule = self.KEY_RULES.get(name)
+            keep = (
+                self.KEYS is None
+                or rule is not None
+                or any(fnmatch.fnmatchcase(name, pattern) for pattern in self.KEYS)
+            ) and not any(fnmatch.fnmatchcase(name, pattern) for pattern in self.EXCLUDE_KEYS)
+
+            projection = self._key_projections[key_name] = (keep, rule)
+
+        return projection
+
+    @staticmethod
+    def _project_fields(data, fields: list):
+        """Keeps only `fields` of a dict, or of each dict in a list, leaves anything else as it is"""
+        if isinstance(data, dict):
+            return {field: data[field] for field in fields if field in data}
+        if isinstance(data, list):
+            return [TransformData._project_fields(item, fields) if isinstance(item, dict) else item for item in data]
+        return data
+
     def clean_blackbox_response(self, blackbox_response: list) -> dict:
         """
         Takes a raw blackbox response and cleans it up for insertion into DB. Returns a dictionary.
@@ -45,24 +223,36 @@ class TransformData:
             },
         ]
         ```
+
+        Raises:
+            BlackboxDecodeError: an entry is not a dict or its raw_data can't be deserialized.
         """
 
         if blackbox_response is None:
             return None
 
         cleaned_response = {}
+        is_projected = self.KEYS is not None or bool(self.EXCLUDE_KEYS) or bool(self.KEY_RULES)
 
         for entry in blackbox_response:
             if not isinstance(entry, dict):
-                print(type(entry))
-                print(entry)
-                raise TypeError
+                self._log.error(f"Blackbox entry of type {type(entry)} is not a dict: {entry}")
+                raise BlackboxDecodeError
+
+            fields = None
+
+            if is_projected:
+                keep, fields = self._key_projection(entry.get("key_name"))
+
+                # never decoded, so a malformed raw_data of a dropped key can't fail the round either
+                if not keep:
+                    continue
 
             try:
-                raw_data = json.loads(entry["raw_data"])
-            except (json.JSONDecodeError, TypeError) as e:
-                self._log.exception("Exception while decoding raw_data", e, exc_info=1)
-                raise Exception(entry) from e
+                raw_data = json_loads(entry["raw_data"])
+            except (json.JSONDecodeError, TypeError, KeyError) as e:
+                self._log.exception(f"Exception while decoding raw_data of entry {entry.get('key_name')}")
+                raise BlackboxDecodeError(entry.get("key_name")) from e
 
             # now it's deserialized and we should hopefully be able to index it directly
             data = raw_data["data"]
@@ -83,6 +273,9 @@ class TransformData:
                 # should always be "/list"... SHOULD!
                 data = data[next(iter(data))]
 
+            if fields is not None:
+                data = self._project_fields(data, fields)
+
             cleaned_response[entry["key_name"]] = data
 
         return cleaned_response
@@ -92,17 +285,317 @@ class TransformData:
         round_metadata_list: list,
         playercount_list: list,
         raw_blackbox_list: list,
+        failures: dict | None = None,
     ) -> list:
-        cleaned_blackbox_list = []
+        """Cleans each round's blackbox response and attaches it and the playercounts to the round's metadata.
 
-        for raw_response in raw_blackbox_list:
-            cleaned_response = self.clean_blackbox_response(raw_response)
-            cleaned_blackbox_list.append(cleaned_response)
+        Args:
+            round_metadata_list (list): metadata rows, in the same order as the response lists.
+            playercount_list (list): playercount responses.
+            raw_blackbox_list (list): raw blackbox responses.
+            failures (dict | None, optional): If provided, rounds already in it (failed fetches) are skipped, and a round whose blackbox can't be cleaned is added to it instead of aborting the batch. Defaults to None.
+
+        Returns:
+            list: collected rounds, without the failed ones
+        """
+        collected_round_list = []
+        failed_rowcount = 0
+        start = time.perf_counter()
+
+        # failed fetches have no blackbox, so there's nothing to skip here
+        cleaned_blackbox_list = self._clean_blackbox_list(raw_blackbox_list)
 
         for idx, metadata in enumerate(round_metadata_list):
-            metadata["playercounts"] = playercount_list[idx]
-            metadata["stats"] = cleaned_blackbox_list[idx]
+            if failures is not None and metadata["round_id"] in failures:
+                continue
+
+            cleaned_response = cleaned_blackbox_list[idx]
+
+            if isinstance(cleaned_response, Exception):
+                if failures is None:
+                    raise cleaned_response
+
+                self._log.error(f"Failed to clean blackbox of round {metadata['round_id']}: {cleaned_response}")
+                failures[metadata["round_id"]] = cleaned_response
+                failed_rowcount += 1
+                continue
+
+            self.parse_datetimes(metadata)
+            self.attach_playercounts(metadata, playercount_list[idx])
+            metadata["stats"] = cleaned_response
+            metadata["transform_version"] = TRANSFORM_VERSION
+            metadata["content_hash"] = self.content_hash(metadata)
+            collected_round_list.append(metadata)
+
+        # the work happens in bulk (and maybe in other processes), so each batch is recorded as its per-round average
+        if round_metadata_list:
+            TRANSFORM_ROUND_SECONDS.observe((time.perf_counter() - start) / len(round_metadata_list))
+
+        TRANSFORM_ROUNDS.inc(len(collected_round_list), result="collected")
+        TRANSFORM_ROUNDS.inc(failed_rowcount, result="failed")
+
+        self._log.info(f"Roundlist collected successfuly with length {len(collected_round_list)}")
+
+        return collected_round_list
+
+    def collect_raw_payload_batch(
+        self, round_id_list: list[int], playercount_list: list, raw_blackbox_list: list, failures: dict | None = None
+    ) -> list:
+        """Packs the untouched responses of a batch into raw payload rows, leaving out rounds in `failures` (failed fetches)"""
+        return [
+            {
+                "round_id": round_id,
+                "playercounts": self.pack_payload(playercounts),
+                "blackbox": self.pack_payload(raw_blackbox),
+                "transform_version": TRANSFORM_VERSION,
+            }
+            for round_id, playercounts, raw_blackbox in zip(round_id_list, playercount_list, raw_blackbox_list)
+            if failures is None or round_id not in failures
+        ]
+
+    @staticmethod
+    def pack_payload(response) -> bytes | None:
+        """Serializes an API response to zlib-compressed JSON. The raw_data strings of a blackbox response compress about tenfold."""
+        if response is None:
+            return None
+
+        return zlib.compress(json.dumps(response, separators=(",", ":")).encode(), 6)
+
+    @staticmethod
+    def unpack_payload(packed: bytes | None):
+        """Inverse of `pack_payload`"""
+        if packed is None:
+            return None
+
+        return json_loads(zlib.decompress(packed))
+
+    def attach_playercounts(self, metadata: dict, playercounts: dict | None) -> dict:
+        """Sets the playercount columns of a round row, in place, according to the playercount format"""
+        compact = self.compact_playercounts(playercounts) if self.PLAYERCOUNT_FORMAT != "json" else None
+
+        metadata["playercounts"] = playercounts if compact is None or self.PLAYERCOUNT_FORMAT == "both" else None
+        metadata["playercount_start"], metadata["playercount_interval"], metadata["playercount_deltas"] = compact or (None, None, None)
+
+        return metadata
+
+    @staticmethod
+    def _hash_default(value) -> str:
+        if isinstance(value, datetime):
+            # rows read back from the database come in the session's timezone, parsed ones in the API's
+            return value.astimezone(timezone.utc).isoformat() if value.tzinfo is not None else value.isoformat()
+        if isinstance(value, (bytes, bytearray, memoryview)):
+            return bytes(value).hex()
+        raise TypeError(f"Can't hash a value of type {type(value).__name__}")
+
+    @staticmethod
+    def content_hash(row: dict) -> str:
+        """
+        Stable hash of everything a row writes, every key but `content_hash` itself, so the loader can tell an unchanged row
+        from a changed one without comparing the JSONB. The same row always hashes the same, whatever its key or JSON key order.
+        """
+        # stdlib json on purpose, orjson would serialize differently and turn the hash of every row over with the extra
+        content = json.dumps(
+            {key: value for key, value in row.items() if key != "content_hash"},
+            sort_keys=True,
+            separators=(",", ":"),
+            default=TransformData._hash_default,
+        )
+
+        return hashlib.blake2b(content.encode(), digest_size=16).hexdigest()
+
+    @staticmethod
+    def compact_playercounts(playercounts: dict | None) -> tuple[datetime, int, bytes] | None:
+        """
+        Packs a `/playercounts` response, `{"<ISO timestamp>": count, ...}`, into its first sample time, the seconds between samples
+        and the counts delta-encoded as little-endian int16 bytes. About 2 bytes a sample instead of the ~30 of the JSON.
+
+        Returns None for series that don't fit: empty, unparseable, not evenly sampled or not integer counts.
+        """
+        # only needed with compact playercounts, so plain runs don't pay for the import
+        import numpy as np
+
+        if not playercounts or not isinstance(playercounts, dict):
+            return None
+
+        timestamps = []
+
+        try:
+            for timestamp in playercounts:
+                parsed = datetime.fromisoformat(timestamp)
+                timestamps.append(parsed if parsed.tzinfo is not None else parsed.replace(tzinfo=timezone.utc))
+
+            counts = np.fromiter(playercounts.values(), dtype=np.float64, count=len(playercounts))
+        except (TypeError, ValueError):
+            return None
+
+        steps = np.diff([timestamp.timestamp() for timestamp in timestamps])
+        interval = int(steps[0]) if steps.size else 0
+
+        if np.any(steps != interval) or (steps.size and interval <= 0) or np.any(counts != np.round(counts)):
+            return None
+
+        deltas = np.diff(counts, prepend=0)
+
+        if np.any(np.abs(deltas) > np.iinfo(np.dtype(PLAYERCOUNT_DELTA_DTYPE)).max):
+            return None
+
+        return timestamps[0], interval, deltas.astype(PLAYERCOUNT_DELTA_DTYPE).tobytes()
+
+    @staticmethod
+    def expand_playercounts(start: datetime, interval: int, deltas: bytes) -> tuple:
+        """Decodes a compact playercount series into its sample times (datetime64[s], UTC) and counts (int32), without a Python loop"""
+        import numpy as np
+
+        counts = np.cumsum(np.frombuffer(deltas, dtype=PLAYERCOUNT_DELTA_DTYPE), dtype=np.int32)
+        timestamps = np.datetime64(int(start.timestamp()), "s") + np.arange(counts.size) * np.timedelta64(interval, "s")
+
+        return timestamps, counts
+
+    @staticmethod
+    def blackbox_key_types(blackbox_response: list | None) -> dict:
+        """Maps each key_name of a raw blackbox response to its key_type, without decoding any raw_data"""
+        if blackbox_response is None:
+            return {}
+
+        return {
+            entry["key_name"]: entry.get("key_type")
+            for entry in blackbox_response
+            if isinstance(entry, dict) and "key_name" in entry
+        }
+
+    @staticmethod
+    def infer_key_type(data) -> str:
+        """Guesses the key_type of cleaned data from its shape, for rounds whose raw response is no longer at hand"""
+        if isinstance(data, dict):
+            if any(isinstance(value, dict) for value in data.values()):
+                return "nested tally"
+            if all(isinstance(value, (int, float)) for value in data.values()):
+                return "tally"
+            # a single associative row, unwrapped from its list by clean_blackbox_response
+            return "associative"
+        elif isinstance(data, list):
+            if any(isinstance(value, dict) for value in data):
+                return "associative"
+            return "text"
+        elif isinstance(data, (int, float)):
+            return "amount"
+        return "text"
+
+    @staticmethod
+    def _to_number(value) -> float | None:
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return None
+
+    def flatten_round_stats(self, round_id: int, stats: dict, key_types: dict | None = None) -> dict:
+        """
+        Flattens one round's cleaned blackbox (the output of `clean_blackbox_response`) into fact rows per key_type.
+
+        Args:
+            round_id (int): round the stats belong to.
+            stats (dict): cleaned blackbox response.
+            key_types (dict | None, optional): key_type of each key_name, from `blackbox_key_types`. Keys missing from it are inferred from the shape of their data. Defaults to None.
+
+        Returns:
+            dict: lists of rows for the `tally`, `nested tally`, `associative` and `text` fact tables
+        """
+        facts = {"tally": [], "nested tally": [], "associative": [], "text": []}
+
+        if not stats:
+            return facts
+
+        key_types = key_types or {}
+
+        for key_name, data in stats.items():
+            if data is None:
+                continue
+
+            key_type = key_types.get(key_name) or self.infer_key_type(data)
+
+            if key_type == "amount":
+                facts["tally"].append(
+                    {"round_id": round_id, "key_name": key_name, "sub_key": "", "value": self._to_number(data)}
+                )
+
+            elif key_type == "tally" and isinstance(data, dict):
+                facts["tally"] += [
+                    {"round_id": round_id, "key_name": key_name, "sub_key": str(sub_key), "value": self._to_number(value)}
+                    for sub_key, value in data.items()
+                ]
+
+            elif key_type == "nested tally" and isinstance(data, dict):
+                for sub_key, sub_data in data.items():
+                    # walk the remaining levels, joining their keys into the leaf path
+                    stack = [("", sub_data)]
+
+                    while stack:
+                        path, value = stack.pop()
+
+                        if isinstance(value, dict):
+                            stack += [(f"{path}/{key}" if path else str(key), child) for key, child in value.items()]
+                        else:
+                            facts["nested tally"].append(
+                                {
+                                    "round_id": round_id,
+                                    "key_name": key_name,
+                                    "sub_key": str(sub_key),
+                                    "leaf_key": path,
+                                    "value": self._to_number(value),
+                                }
+                            )
+
+            elif key_type == "associative":
+                # a single associative entry was unwrapped from its list by clean_blackbox_response
+                rows = data if isinstance(data, list) else [data]
+
+                for row_index, row in enumerate(rows):
+                    fields = row if isinstance(row, dict) else {"": row}
+
+                    facts["associative"] += [
+                        {
+                            "round_id": round_id,
+                            "key_name": key_name,
+                            "row_index": row_index,
+                            "field": str(field),
+                            "value": value if isinstance(value, str) or value is None else json.dumps(value),
+                        }
+                        for field, value in fields.items()
+                    ]
+
+            else:
+                items = data if isinstance(data, list) else [data]
+
+                facts["text"] += [
+                    {
+                        "round_id": round_id,
+                        "key_name": key_name,
+                        "item_index": item_index,
+                        "value": item if isinstance(item, str) else json.dumps(item),
+                    }
+                    for item_index, item in enumerate(items)
+                ]
+
+        return facts
+
+    def collect_fact_batch(self, collected_round_list: list, key_types_by_round: dict | None = None) -> dict:
+        """Flattens a batch of collected rounds into fact rows per key_type. `key_types_by_round` maps round_id to that round's `blackbox_key_types`."""
+        facts = {"tally": [], "nested tally": [], "associative": [], "text": []}
+        key_types_by_round = key_types_by_round or {}
+
+        for collected_round in collected_round_list:
+            round_facts = self.flatten_round_stats(
+                collected_round["round_id"],
+                collected_round["stats"],
+                key_types_by_round.get(collected_round["round_id"]),
+            )
+
+            for key_type, rows in round_facts.items():
+                facts[key_type] += rows
 
-        self._log.info(f"Roundlist collected successfuly with length {len(round_metadata_list)}")
+        self._log.info(
+            f"Flattened {len(collected_round_list)} rounds into fact rows: "
+            + ", ".join(f"{len(rows)} {key_type}" for key_type, rows in facts.items())
+        )
 
-        return round_metadata_list
+        return facts
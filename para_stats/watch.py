@@ -0,0 +1,114 @@
+import logging
+import random
+import signal
+import threading
+import time
+from . import metrics
+from .metrics import WATCH_LAST_POLL, WATCH_POLLS
+
+
+class RoundWatcher:
+    def __init__(
+        self,
+        interface,
+        interval: float = 30.0,
+        jitter: float = 0.2,
+        gap_interval: float = 600.0,
+        batch_size: int = 100,
+        metrics_file: str | None = None,
+    ) -> None:
+        """Long-running sync that ingests rounds shortly after they finish.
+
+        Keeps one ETLInterface, so the HTTP session, DB connection pool and transform pool stay warm between polls.
+        Each poll is a conditional request for the roundlist head, which costs one 304 while nothing has changed.
+        When the head moved, the new metadata is loaded and the rounds are streamed in right away. The stream also
+        picks up dead-lettered rounds as soon as their retry is due, so rounds still in progress are ingested once the
+        API serves their data. Known round_id gaps are rechecked on their own, slower schedule.
+
+        SIGTERM and SIGINT stop the watcher after the batches in flight have been loaded.
+
+        Args:
+            interface (ETLInterface): interface to sync through.
+            interval (float, optional): Seconds between polls. Defaults to 30.0.
+            jitter (float, optional): Fraction of `interval` each wait is randomly stretched or shortened by, so several watchers don't poll in lockstep. Defaults to 0.2.
+            gap_interval (float, optional): Seconds between rechecks of known round_id gaps. Defaults to 600.0.
+            batch_size (int, optional): Rounds per pipeline batch. Defaults to 100.
+            metrics_file (str | None, optional): OpenMetrics file rewritten after every poll. Defaults to None.
+        """
+        self._log = logging.getLogger(__name__)
+        self._interface = interface
+
+        self.INTERVAL = interval
+        self.JITTER = jitter
+        self.GAP_INTERVAL = gap_interval
+        self.BATCH_SIZE = batch_size
+        self.METRICS_FILE = metrics_file
+
+        self.stop_event = threading.Event()
+        self._last_gap_check = None
+
+    def stop(self, signum=None, frame=None) -> None:
+        """Asks the watcher to stop once the batches in flight are loaded. Usable as a signal handler."""
+        if signum is not None:
+            self._log.info(f"Received signal {signum}, stopping after the current batch")
+
+        self.stop_event.set()
+
+    def _wait(self) -> None:
+        delay = self.INTERVAL * random.uniform(1 - self.JITTER, 1 + self.JITTER)
+        self.stop_event.wait(max(delay, 0.0))
+
+    def poll(self) -> int:
+        """Runs one sync step. Returns the number of rounds loaded."""
+        head_page = self._interface._fetcher.fetch_roundlist_head(conditional=True)
+
+        if head_page is None:
+            WATCH_POLLS.inc(result="not_modified")
+        else:
+            WATCH_POLLS.inc(result="modified")
+            metadata_list = self._interface.update_metadata(head_page=head_page)
+
+            if metadata_list:
+                self._interface.load_metadata(metadata_list)
+
+        now = time.monotonic()
+
+        if self._last_gap_check is None or now - self._last_gap_check >= self.GAP_INTERVAL:
+            self._interface.recheck_gaps()
+            self._last_gap_check = now
+
+        loaded_rowcount = self._interface.stream_missing_round_data(
+            batch_size=self.BATCH_SIZE, stop_event=self.stop_event
+        )
+
+        if loaded_rowcount:
+            self._log.info(f"Loaded {loaded_rowcount} rounds")
+
+        WATCH_LAST_POLL.set(time.time())
+
+        return loaded_rowcount
+
+    def run(self) -> None:
+        """Polls until stopped. A failed poll is logged and retried on the next interval instead of ending the watcher."""
+        previous_handlers = {sig: signal.signal(sig, self.stop) for sig in (signal.SIGTERM, signal.SIGINT)}
+
+        self._log.info(f"Watching for new rounds every {self.INTERVAL} sec")
+
+        try:
+            while not self.stop_event.is_set():
+                try:
+                    self.poll()
+                except Exception:
+                    WATCH_POLLS.inc(result="failed")
+                    self._log.exception("Poll failed, retrying on the next interval")
+
+                if self.METRICS_FILE:
+                    metrics.registry.write_textfile(self.METRICS_FILE)
+
+                self._wait()
+
+        finally:
+            for sig, handler in previous_handlers.items():
+                signal.signal(sig, handler)
+
+        self._log.info("Watcher stopped")
@@ -0,0 +1,100 @@
+import os
+
+import pytest
+
+# Config is read at import time, so the tables of the tests are pointed at a scratch schema before para_stats is imported
+TEST_SCHEMA = "para_stats_test"
+
+os.environ["SQLALCHEMY_ODS_SCHEMA"] = TEST_SCHEMA
+os.environ["SQLALCHEMY_ODS_ROUNDS_TABLE"] = "rounds"
+os.environ["SQLALCHEMY_ODS_METADATA_TABLE"] = "metadata"
+os.environ["PARA_STATS_ROUNDS_PARTITION_SIZE"] = "0"
+# the scratch schema is recreated for every test, a cached schema check would point at tables that are gone
+os.environ["PARA_STATS_SCHEMA_CACHE"] = ""
+
+
+@pytest.fixture(scope="session")
+def engine():
+    """Engine of the database at SQLALCHEMY_DB_URI. Tests using it are skipped when it isn't set or can't be reached."""
+    from sqlalchemy import create_engine, text
+    from sqlalchemy.exc import OperationalError
+    from config import Config
+
+    if not Config.db_uri:
+        pytest.skip("SQLALCHEMY_DB_URI isn't set")
+
+    engine = create_engine(Config.db_uri)
+
+    try:
+        with engine.connect():
+            pass
+    except OperationalError as e:
+        pytest.skip(f"Database at SQLALCHEMY_DB_URI can't be reached: {e}")
+
+    yield engine
+
+    with engine.begin() as connection:
+        connection.execute(text(f"DROP SCHEMA IF EXISTS {TEST_SCHEMA} CASCADE"))
+
+    engine.dispose()
+
+
+@pytest.fixture
+def loader(engine):
+    """DatabaseLoader over a freshly created scratch schema"""
+    from sqlalchemy import text
+    from config import Config
+    from para_stats.db import DatabaseLoader
+
+    with engine.begin() as connection:
+        connection.execute(text(f"DROP SCHEMA IF EXISTS {TEST_SCHEMA} CASCADE"))
+        connection.execute(text(f"CREATE SCHEMA {TEST_SCHEMA}"))
+
+    db = DatabaseLoader(Config, pool_size=2)
+
+    yield db
+
+    db.db_close_pool()
+
+
+@pytest.fixture
+def make_rounds():
+    """Builds round rows from the mock API's synthetic responses, the way the pipeline collects them"""
+    from benchmarks.mock_api import synthetic_blackbox, synthetic_metadata, synthetic_playercounts
+    from para_stats.transform import TransformData
+
+    def make(round_id_list, playercount_format: str = "json") -> list:
+        transformer = TransformData(playercount_format=playercount_format)
+
+        return transformer.collect_round_batch(
+            transformer.prep_metadata([synthetic_metadata(round_id) for round_id in round_id_list]),
+            [synthetic_playercounts(round_id) for round_id in round_id_list],
+            [synthetic_blackbox(round_id, num_keys=10) for round_id in round_id_list],
+        )
+
+    return make
+
+
+@pytest.fixture(params=["sync", "async"])
+def make_fetcher(request):
+    """Builds APIFetch or AsyncAPIFetch instances and closes them after the test"""
+    from para_stats.api_fetch import APIFetch
+
+    fetchers = []
+
+    def make(base_url, **kwargs):
+        if request.param == "async":
+            pytest.importorskip("aiohttp")
+            from para_stats.async_api_fetch import AsyncAPIFetch
+
+            fetcher = AsyncAPIFetch(base_url, **kwargs)
+        else:
+            fetcher = APIFetch(base_url, **kwargs)
+
+        fetchers.append(fetcher)
+        return fetcher
+
+    yield make
+
+    for fetcher in fetchers:
+        fetcher.close()
@@ -0,0 +1,62 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from benchmarks.mock_api import EPOCH, synthetic_metadata, synthetic_playercounts
+from para_stats.analytics import RoundAnalytics
+
+
+def _expected_series(round_id_list: list[int], since: datetime, until: datetime) -> dict:
+    """(bucket, server_id) -> (samples, peak_players) straight from the mock API's playercounts, in naive UTC"""
+    expected = {}
+
+    for round_id in round_id_list:
+        server_id = synthetic_metadata(round_id)["server_id"]
+
+        for timestamp, count in synthetic_playercounts(round_id).items():
+            sampled_at = datetime.fromisoformat(timestamp)
+
+            if since <= sampled_at < until:
+                key = (sampled_at.replace(minute=0), server_id)
+                samples, peak = expected.get(key, (0, 0))
+                expected[key] = (samples + 1, max(peak, count))
+
+    return expected
+
+
+@pytest.fixture
+def analytics(loader, make_rounds):
+    # half the rounds with JSONB playercounts, half compact
+    loader.db_upload_rounds(make_rounds(range(1, 7)) + make_rounds(range(7, 13), playercount_format="compact"))
+
+    return RoundAnalytics(loader.engine)
+
+
+@pytest.mark.parametrize("tzinfo", [None, timezone.utc, timezone(timedelta(hours=2))])
+def test_playercount_series_bounds(analytics, tzinfo):
+    # both bounds fall inside rounds, of each playercount format
+    since = EPOCH + timedelta(minutes=90 * 3 + 40)
+    until = EPOCH + timedelta(minutes=90 * 9 + 40)
+
+    def bound(value: datetime) -> datetime:
+        return value if tzinfo is None else value.replace(tzinfo=timezone.utc).astimezone(tzinfo)
+
+    series = analytics.playercount_series(unit="hour", since=bound(since), until=bound(until))
+
+    actual = {
+        (row.bucket.tz_convert(None).to_pydatetime(), row.server_id): (row.samples, row.peak_players)
+        for row in series.itertuples()
+    }
+
+    assert actual == _expected_series(range(1, 13), since, until)
+
+
+def test_counts_take_naive_bounds_as_utc(analytics):
+    since = EPOCH + timedelta(minutes=90 * 6)
+    expected = sum(datetime.fromisoformat(synthetic_metadata(round_id)["end_datetime"]) >= since for round_id in range(1, 13))
+
+    naive = analytics.map_popularity(since=since)
+    aware = analytics.outcome_rates(since=since.replace(tzinfo=timezone.utc))
+
+    assert naive["rounds"].sum() == aware["rounds"].sum() == expected
+    assert analytics.duration_summary(since=since).loc["all", "rounds"] == expected
@@ -0,0 +1,95 @@
+import pytest
+import requests
+
+from benchmarks.mock_api import MockAPIServer, synthetic_playercounts
+from para_stats.api_fetch import APIFetch
+from para_stats.exceptions import RateLimitError, RoundNotFoundError
+from para_stats.metrics import API_RATE_LIMITED
+from para_stats.rate_limit import RateLimiter
+
+HEAD_ROUND_ID = 30
+PAGE_SIZE = 10
+
+
+@pytest.fixture(scope="module")
+def mock_api():
+    with MockAPIServer(head_round_id=HEAD_ROUND_ID, page_size=PAGE_SIZE, num_keys=10) as server:
+        yield server
+
+
+@pytest.mark.parametrize(
+    "offset_start, offset_end, page_size, expected",
+    [
+        (100, 0, 26, [100, 75, 50, 25]),
+        (100, 50, 26, [100, 75]),
+        (10, 9, 5, [10]),
+        (10, 5, 1, [10]),
+        (10, 10, 5, []),
+        (10, 12, 5, []),
+    ],
+)
+def test_window_offsets(offset_start, offset_end, page_size, expected):
+    assert APIFetch._window_offsets(offset_start, offset_end, page_size) == expected
+
+
+def test_roundlist_pages_are_deduplicated(mock_api, make_fetcher):
+    fetcher = make_fetcher(mock_api.url)
+
+    # the windows overlap by one round, and the last page runs past offset_end
+    roundlist = fetcher.fetch_roundlist_to_offset(0)
+    assert [entry["round_id"] for entry in roundlist] == list(range(HEAD_ROUND_ID, 0, -1))
+
+    window = fetcher.fetch_roundlist_window(25, 10)
+    assert [entry["round_id"] for entry in window] == list(range(25, 10, -1))
+
+
+def test_missing_rounds_are_isolated(mock_api, make_fetcher):
+    fetcher = make_fetcher(mock_api.url)
+    round_id_list = [HEAD_ROUND_ID - 1, HEAD_ROUND_ID + 1, HEAD_ROUND_ID, HEAD_ROUND_ID + 2]
+    failures = {}
+
+    playercount_list, raw_blackbox_list = fetcher.fetch_round_data_bulk(round_id_list, failures=failures)
+
+    assert set(failures) == {HEAD_ROUND_ID + 1, HEAD_ROUND_ID + 2}
+    assert all(isinstance(error, RoundNotFoundError) for error in failures.values())
+    assert playercount_list[0] == synthetic_playercounts(HEAD_ROUND_ID - 1)
+    assert playercount_list[2] == synthetic_playercounts(HEAD_ROUND_ID)
+    assert playercount_list[1] is None and playercount_list[3] is None
+    assert raw_blackbox_list[1] is None and raw_blackbox_list[3] is None
+    assert raw_blackbox_list[0] and raw_blackbox_list[2]
+
+    with pytest.raises(RoundNotFoundError):
+        fetcher.fetch_round_data_bulk(round_id_list)
+
+
+def _rate_limited_count(endpoint: str) -> float:
+    return API_RATE_LIMITED._values.get((endpoint,), 0)
+
+
+def test_rate_limited_rounds_are_retried_then_given_up(make_fetcher, monkeypatch):
+    max_retries = 2
+
+    with MockAPIServer(head_round_id=HEAD_ROUND_ID, num_keys=10, rate_limit=1, rate_window=3600) as mock_api:
+        # spend the only request of the window, so the fetcher's first response is already a 429
+        requests.get(mock_api.url + "/metadata/1")
+
+        limiter = RateLimiter(max_concurrency=1)
+        monkeypatch.setattr(limiter, "backoff", lambda attempt, headers=None: 0.01)
+        fetcher = make_fetcher(mock_api.url, max_connections=1, rate_limiter=limiter, max_retries=max_retries)
+
+        rate_limited_before = _rate_limited_count("/playercounts") + _rate_limited_count("/blackbox")
+        round_id_list = [1, 2, 3]
+        failures = {}
+
+        playercount_list, raw_blackbox_list = fetcher.fetch_round_data_bulk(round_id_list, failures=failures)
+
+        rate_limited = _rate_limited_count("/playercounts") + _rate_limited_count("/blackbox") - rate_limited_before
+
+        # the first request is retried until it gives up, the rounds after it aren't sent into the same limit
+        assert rate_limited >= max_retries + 1
+        assert set(failures) == set(round_id_list)
+        assert all(isinstance(error, RateLimitError) for error in failures.values())
+        assert playercount_list == [None] * 3 and raw_blackbox_list == [None] * 3
+
+        with pytest.raises(RateLimitError):
+            fetcher.fetch_round_data_bulk(round_id_list)
@@ -0,0 +1,73 @@
+import pytest
+from sqlalchemy import func, select
+
+from para_stats.models import fact_tables, round_table
+from para_stats.transform import TransformData
+
+LOAD_METHODS = ["insert", "copy", "pool"]
+
+
+def _stored_rounds(loader) -> dict:
+    with loader.engine.connect() as connection:
+        result = connection.execute(select(round_table.c["round_id"], round_table.c["stats"], round_table.c["content_hash"]))
+
+        return {round_id: (stats, content_hash) for round_id, stats, content_hash in result}
+
+
+@pytest.mark.parametrize("method", LOAD_METHODS)
+def test_upload_rounds_writes_only_new_and_changed_rows(loader, make_rounds, method):
+    round_list = make_rounds(range(1, 21))
+
+    assert loader.db_upload_rounds(round_list, method=method) == 20
+
+    stored = _stored_rounds(loader)
+    assert sorted(stored) == list(range(1, 21))
+    assert all(stored[entry["round_id"]] == (entry["stats"], entry["content_hash"]) for entry in round_list)
+
+    # the same rows again are skipped by their content hash
+    assert loader.db_upload_rounds(make_rounds(range(1, 21)), method=method) == 0
+
+    changed_list = make_rounds([3, 7, 25])
+
+    for entry in changed_list:
+        entry["stats"]["amount_4"] = -1
+        # filled in again by the loader
+        entry["content_hash"] = None
+
+    assert loader.db_upload_rounds(changed_list, method=method) == 3
+
+    stored = _stored_rounds(loader)
+    assert len(stored) == 21
+    assert all(stored[round_id][0]["amount_4"] == -1 for round_id in (3, 7, 25))
+    assert stored[4][0]["amount_4"] != -1
+
+
+@pytest.mark.parametrize("method", LOAD_METHODS)
+def test_upload_rounds_of_an_empty_batch(loader, method):
+    assert loader.db_upload_rounds([], method=method) == 0
+
+
+@pytest.mark.parametrize("method", ["copy", "pool"])
+def test_upload_keeps_the_last_duplicate(loader, make_rounds, method):
+    first, last = make_rounds([5]), make_rounds([5])
+    last[0]["stats"]["amount_4"] = -1
+    last[0]["content_hash"] = None
+
+    assert loader.db_upload_rounds(first + last, method=method) == 1
+    assert _stored_rounds(loader)[5][0]["amount_4"] == -1
+
+
+def test_upload_facts_replaces_the_facts_of_a_batch(loader, make_rounds):
+    round_list = make_rounds(range(1, 6))
+    facts = TransformData().collect_fact_batch(round_list)
+    fact_rowcount = sum(len(rows) for rows in facts.values())
+
+    def stored_rowcount() -> int:
+        with loader.engine.connect() as connection:
+            return sum(connection.execute(select(func.count()).select_from(table)).scalar() for table in fact_tables.values())
+
+    assert fact_rowcount > 0
+    assert loader.db_upload_facts(facts, [entry["round_id"] for entry in round_list]) == fact_rowcount
+    # the batch's rows are replaced, not added to
+    assert loader.db_upload_facts(facts, [entry["round_id"] for entry in round_list]) == fact_rowcount
+    assert stored_rowcount() == fact_rowcount
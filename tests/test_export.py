@@ -0,0 +1,57 @@
+import json
+import os
+
+import pytest
+
+pq = pytest.importorskip("pyarrow.parquet")
+
+from para_stats.export import ParquetExporter
+
+
+def _exported_rounds(output_dir: str) -> dict:
+    """Newest exported copy of every round, by loaded_at"""
+    table = pq.read_table(output_dir, columns=["round_id", "loaded_at", "stat_amount_4"]).to_pylist()
+
+    return {row["round_id"]: row["stat_amount_4"] for row in sorted(table, key=lambda row: row["loaded_at"])}
+
+
+def test_export_picks_up_rounds_loaded_late(loader, make_rounds, tmp_path):
+    output_dir = str(tmp_path)
+    exporter = ParquetExporter(loader.engine, output_dir, stats_keys=["amount_4"], batch_size=4)
+
+    # round 5 is still missing, ex: dead-lettered by the pipeline
+    loader.db_upload_rounds(make_rounds([1, 2, 3, 4, 6, 7, 8, 9, 10]))
+
+    assert exporter.export() == 9
+
+    with open(os.path.join(output_dir, ParquetExporter.STATE_FILE)) as f:
+        state = json.load(f)
+
+    assert state["loaded_before"] and state["stats_key_types"] == {"amount_4": "amount"}
+
+    loader.db_upload_rounds(make_rounds([5]))
+
+    assert exporter.export() == 1
+    assert sorted(_exported_rounds(output_dir)) == list(range(1, 11))
+    assert exporter.export() == 0
+
+    # a reloaded round that changed is exported again, the unchanged ones aren't
+    changed_list = make_rounds([3, 4])
+    changed_list[0]["stats"]["amount_4"] = -1
+    changed_list[0]["content_hash"] = None
+
+    loader.db_upload_rounds(changed_list)
+
+    assert exporter.export() == 1
+    assert _exported_rounds(output_dir)[3] == -1
+
+
+def test_export_continues_from_a_round_id_state(loader, make_rounds, tmp_path):
+    output_dir = str(tmp_path)
+    loader.db_upload_rounds(make_rounds(range(1, 11)))
+
+    with open(os.path.join(output_dir, ParquetExporter.STATE_FILE), "w") as f:
+        json.dump({"last_round_id": 6, "stats_key_types": {}}, f)
+
+    assert ParquetExporter(loader.engine, output_dir).export() == 4
+    assert ParquetExporter(loader.engine, output_dir).export() == 0
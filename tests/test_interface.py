@@ -0,0 +1,56 @@
+import pytest
+from sqlalchemy import select
+
+from config import Config
+from para_stats.interface import ETLInterface
+from para_stats.models import round_table
+
+
+@pytest.mark.parametrize(
+    "round_id_list, expected",
+    [
+        ([], []),
+        ([5], []),
+        ([1, 2, 3], []),
+        ([3, 1, 7], [(2, 2), (4, 6)]),
+        ([1, 1, 3, 3], [(2, 2)]),
+        ([10, 20], [(11, 19)]),
+    ],
+)
+def test_find_gaps(round_id_list, expected):
+    assert ETLInterface._find_gaps(round_id_list) == expected
+
+
+def test_backfill_compact_playercounts(loader, make_rounds, monkeypatch):
+    round_list = make_rounds(range(1, 6))
+    # a sample missing in the middle, the series can't be stored compact
+    uneven = round_list[4]["playercounts"]
+    del uneven[list(uneven)[3]]
+    round_list[4]["content_hash"] = None
+    loader.db_upload_rounds(round_list)
+
+    monkeypatch.setattr(Config, "playercount_format", "compact")
+
+    with ETLInterface() as interface:
+        assert interface.backfill_compact_playercounts(batch_size=2) == 4
+        # nothing left without compact playercounts but the uneven round
+        assert interface.backfill_compact_playercounts(batch_size=2) == 0
+
+    with loader.engine.connect() as connection:
+        stored = {
+            row["round_id"]: row
+            for row in connection.execute(select(round_table).order_by(round_table.c["round_id"])).mappings()
+        }
+
+    for entry in round_list[:4]:
+        row = stored[entry["round_id"]]
+        assert row["playercounts"] is None and row["playercount_deltas"] is not None
+        # the stored row no longer matches its hash, the next sync writes it in full
+        assert row["content_hash"] is None
+
+    assert stored[5]["playercounts"] == uneven and stored[5]["playercount_deltas"] is None
+
+    timestamps, counts = loader.db_fetch_playercounts([1])[1]
+    assert counts.tolist() == list(round_list[0]["playercounts"].values())
+
+    assert loader.db_upload_rounds(make_rounds([1], playercount_format="compact")) == 1
@@ -0,0 +1,54 @@
+import pytest
+
+from para_stats.metrics import Counter, Histogram, endpoint_label
+
+
+@pytest.mark.parametrize(
+    "endpoint, expected",
+    [
+        ("/blackbox/12345", "/blackbox"),
+        ("/playercounts/12/", "/playercounts"),
+        ("/metadata/", "/metadata"),
+        ("/roundlist?offset=0", "/roundlist"),
+        ("/roundlist", "/roundlist"),
+    ],
+)
+def test_endpoint_label(endpoint, expected):
+    assert endpoint_label(endpoint) == expected
+
+
+def test_histogram_exposition_is_cumulative():
+    histogram = Histogram("test_request_seconds", "Request latency", ("endpoint",), buckets=(1.0, 0.1))
+
+    for value in (0.05, 0.5, 1.0, 5.0):
+        histogram.observe(value, endpoint="/blackbox")
+
+    assert histogram.expose().splitlines() == [
+        "# HELP test_request_seconds Request latency",
+        "# TYPE test_request_seconds histogram",
+        'test_request_seconds_bucket{endpoint="/blackbox",le="0.1"} 1',
+        # a value equal to a bound falls in that bucket
+        'test_request_seconds_bucket{endpoint="/blackbox",le="1.0"} 3',
+        'test_request_seconds_bucket{endpoint="/blackbox",le="+Inf"} 4',
+        'test_request_seconds_sum{endpoint="/blackbox"} 6.55',
+        'test_request_seconds_count{endpoint="/blackbox"} 4',
+    ]
+
+
+def test_histogram_rejects_wrong_labels():
+    histogram = Histogram("test_labelled_seconds", "Request latency", ("endpoint",))
+
+    with pytest.raises(ValueError):
+        histogram.observe(1.0)
+
+
+def test_counter_exposition_has_total_suffix():
+    counter = Counter("test_rate_limited", 'Responses with "429"', ("endpoint",))
+    counter.inc(endpoint="/blackbox")
+    counter.inc(2, endpoint="/blackbox")
+
+    assert counter.expose().splitlines() == [
+        '# HELP test_rate_limited Responses with \\"429\\"',
+        "# TYPE test_rate_limited counter",
+        'test_rate_limited_total{endpoint="/blackbox"} 3',
+    ]
@@ -0,0 +1,80 @@
+import pytest
+from sqlalchemy import select, text
+from sqlalchemy.exc import OperationalError
+
+from para_stats.migrate import SchemaMigrator
+from para_stats.models import round_table
+
+ROUNDS = round_table.fullname
+
+
+def _datetimes(loader) -> dict:
+    with loader.engine.connect() as connection:
+        result = connection.execute(select(round_table.c["round_id"], round_table.c["end_datetime"]))
+
+        return dict(result.fetchall())
+
+
+def _column_types(loader) -> dict:
+    with loader.engine.connect() as connection:
+        return SchemaMigrator(loader.engine)._column_types(connection, round_table)
+
+
+@pytest.fixture
+def legacy_rounds(loader, make_rounds):
+    """Rounds table of an older schema: text end_datetime and no loaded_at"""
+    loader.db_upload_rounds(make_rounds(range(1, 11)))
+    expected = _datetimes(loader)
+
+    with loader.engine.begin() as connection:
+        connection.execute(text(f"ALTER TABLE {ROUNDS} DROP COLUMN loaded_at"))
+        connection.execute(text(f"ALTER TABLE {ROUNDS} ALTER COLUMN end_datetime TYPE text"))
+
+    return expected
+
+
+def test_migrate_upgrades_a_legacy_rounds_table(loader, legacy_rounds):
+    SchemaMigrator(loader.engine, batch_size=3).migrate()
+
+    column_types = _column_types(loader)
+    assert column_types["end_datetime"] == "timestamp with time zone"
+    assert column_types["loaded_at"] == "timestamp with time zone"
+    assert _datetimes(loader) == legacy_rounds
+
+    with loader.engine.connect() as connection:
+        # existing rows get the default of the new column
+        assert connection.execute(text(f"SELECT count(*) FROM {ROUNDS} WHERE loaded_at IS NULL")).scalar() == 0
+
+    # nothing left to do
+    SchemaMigrator(loader.engine, batch_size=3).migrate()
+
+
+def test_migrate_partitions_the_rounds_table(loader, make_rounds):
+    loader.db_upload_rounds(make_rounds(range(1, 11)))
+    expected = _datetimes(loader)
+
+    SchemaMigrator(loader.engine, batch_size=3, rounds_partition_size=4).migrate()
+
+    with loader.engine.connect() as connection:
+        assert connection.execute(text(f"SELECT relkind FROM pg_class WHERE oid = '{ROUNDS}'::regclass")).scalar() == "p"
+        assert connection.execute(text(f"SELECT count(*) FROM pg_inherits WHERE inhparent = '{ROUNDS}'::regclass")).scalar() == 3
+
+    assert _datetimes(loader) == expected
+
+
+@pytest.mark.parametrize("step", ["convert_datetime_columns", "partition_rounds"])
+def test_migrate_steps_give_up_on_a_locked_table(loader, legacy_rounds, step):
+    migrator = SchemaMigrator(loader.engine, lock_timeout="100ms", rounds_partition_size=4)
+
+    with loader.engine.connect() as blocker:
+        # any open query on the table, ALTER TABLE and CREATE TRIGGER queue behind it
+        blocker.execute(text(f"LOCK TABLE {ROUNDS} IN ACCESS SHARE MODE"))
+
+        with pytest.raises(OperationalError, match="lock timeout"):
+            if step == "convert_datetime_columns":
+                migrator.convert_datetime_columns(round_table)
+            else:
+                migrator.partition_rounds()
+
+    # the failed step left nothing behind
+    assert set(_column_types(loader)) == {column.name for column in round_table.columns} - {"loaded_at"}
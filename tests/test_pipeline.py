@@ -0,0 +1,64 @@
+import pytest
+from sqlalchemy import select
+
+from benchmarks.mock_api import MockAPIServer, synthetic_metadata
+from para_stats.api_fetch import APIFetch
+from para_stats.models import dead_letter_table, round_table
+from para_stats.pipeline import RoundPipeline
+from para_stats.transform import TransformData
+
+HEAD_ROUND_ID = 30
+
+
+@pytest.fixture(scope="module")
+def mock_api():
+    with MockAPIServer(head_round_id=HEAD_ROUND_ID, num_keys=10) as server:
+        yield server
+
+
+@pytest.fixture
+def fetcher(mock_api):
+    fetcher = APIFetch(mock_api.url, max_connections=4)
+    yield fetcher
+    fetcher.close()
+
+
+def _round_ids(loader, table) -> list[int]:
+    with loader.engine.connect() as connection:
+        return connection.execute(select(table.c["round_id"]).order_by(table.c["round_id"])).scalars().all()
+
+
+def test_pipeline_loads_missing_rounds_and_dead_letters_the_rest(loader, fetcher):
+    transformer = TransformData()
+    # rounds above the mock API's head 404, like rounds still in progress
+    loader.db_upload_metadata(transformer.prep_metadata([synthetic_metadata(round_id) for round_id in range(1, 36)]))
+
+    loaded_rowcount = RoundPipeline(fetcher, transformer, loader, batch_size=8, queue_size=1).run()
+
+    assert loaded_rowcount == HEAD_ROUND_ID
+    assert _round_ids(loader, round_table) == list(range(1, HEAD_ROUND_ID + 1))
+    assert _round_ids(loader, dead_letter_table) == list(range(HEAD_ROUND_ID + 1, 36))
+
+    with loader.engine.connect() as connection:
+        stages = connection.execute(select(dead_letter_table.c["stage"]).distinct()).scalars().all()
+
+    assert stages == ["pending"]
+
+    # loaded rounds aren't fetched again and dead letters wait for their retry
+    assert RoundPipeline(fetcher, transformer, loader, batch_size=8).run() == 0
+    # a reload goes over every round, but none of them changed
+    assert RoundPipeline(fetcher, transformer, loader, batch_size=8, reload=True).run() == 0
+
+
+def test_pipeline_reraises_a_failed_stage(loader):
+    class FailingFetch:
+        def fetch_round_data_bulk(self, round_id_list, failures=None):
+            raise RuntimeError("fetch failed")
+
+    transformer = TransformData()
+    loader.db_upload_metadata(transformer.prep_metadata([synthetic_metadata(round_id) for round_id in range(1, 11)]))
+
+    with pytest.raises(RuntimeError, match="fetch failed"):
+        RoundPipeline(FailingFetch(), transformer, loader, batch_size=4, queue_size=1).run()
+
+    assert _round_ids(loader, round_table) == []
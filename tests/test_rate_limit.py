@@ -0,0 +1,79 @@
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from para_stats.rate_limit import RateLimiter
+
+
+def test_update_spreads_remaining_quota_over_reset_window():
+    limiter = RateLimiter(initial_rate=10.0, reserve=2)
+    limiter.update({"X-Rate-Limit-Remaining": "62", "X-Rate-Limit-Reset": "30"})
+
+    assert limiter.remaining == 62
+    assert limiter.rate == pytest.approx(2.0)
+
+
+def test_update_falls_back_to_limit_period():
+    limiter = RateLimiter(reserve=0)
+    limiter.update({"X-Rate-Limit-Remaining": "120", "X-Rate-Limit-Limit": "1m"})
+
+    assert limiter.rate == pytest.approx(2.0)
+
+
+def test_update_pauses_when_headroom_is_exhausted():
+    limiter = RateLimiter(reserve=2)
+    limiter.update({"X-Rate-Limit-Remaining": "2", "X-Rate-Limit-Reset": "30"})
+
+    assert 29 < limiter.try_acquire() <= 30
+
+
+def test_update_without_rate_limit_headers_keeps_rate():
+    limiter = RateLimiter(initial_rate=5.0, max_concurrency=4)
+    limiter.update({}, elapsed=0.5)
+
+    assert limiter.rate == 5.0
+    assert limiter.remaining is None
+    # 5 req/s at 0.5 sec each needs 4 workers, which is also the cap
+    assert limiter.concurrency() == 4
+
+
+def test_backoff_prefers_retry_after():
+    limiter = RateLimiter()
+
+    assert 12 <= limiter.backoff(3, {"Retry-After": "12", "X-Rate-Limit-Reset": "40"}) < 13
+
+
+def test_backoff_falls_back_to_reset_then_exponential():
+    limiter = RateLimiter(default_window=60.0)
+
+    assert 40 <= limiter.backoff(0, {"X-Rate-Limit-Reset": "40"}) < 41
+    assert 8 <= limiter.backoff(3, {}) < 9
+    # capped at the default window
+    assert 60 <= limiter.backoff(10) < 61
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [("15", 15.0), ("2.5", 2.5), ("-3", 0.0), ("", None), (None, None), ("soon", None)],
+)
+def test_parse_reset_delta_seconds(value, expected):
+    assert RateLimiter.parse_reset(value) == expected
+
+
+def test_parse_reset_epoch_and_iso():
+    in_20 = datetime.now(timezone.utc) + timedelta(seconds=20)
+
+    assert RateLimiter.parse_reset(str(time.time() + 20)) == pytest.approx(20, abs=1)
+    assert RateLimiter.parse_reset(in_20.isoformat().replace("+00:00", "Z")) == pytest.approx(20, abs=1)
+    # naive timestamps are taken as UTC
+    assert RateLimiter.parse_reset(in_20.replace(tzinfo=None).isoformat()) == pytest.approx(20, abs=1)
+    assert RateLimiter.parse_reset("2000-01-01T00:00:00Z") == 0.0
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [("30s", 30.0), ("1m", 60.0), ("2h", 7200.0), ("1d", 86400.0), ("1w", None), ("m", None), (None, None)],
+)
+def test_parse_period(value, expected):
+    assert RateLimiter.parse_period(value) == expected
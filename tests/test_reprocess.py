@@ -0,0 +1,63 @@
+from sqlalchemy import select
+
+from benchmarks.mock_api import synthetic_blackbox, synthetic_metadata, synthetic_playercounts
+from para_stats.models import round_table
+from para_stats.reprocess import RoundReprocessor
+from para_stats.transform import TRANSFORM_VERSION, TransformData
+
+
+def _land(loader, round_id_list: list[int]) -> None:
+    transformer = TransformData()
+    loader.db_land_raw_payloads(
+        transformer.collect_raw_payload_batch(
+            round_id_list,
+            [synthetic_playercounts(round_id) for round_id in round_id_list],
+            [synthetic_blackbox(round_id, num_keys=10) for round_id in round_id_list],
+        )
+    )
+
+
+def _stored_rounds(loader) -> dict:
+    with loader.engine.connect() as connection:
+        result = connection.execute(select(round_table.c["round_id"], round_table.c["stats"], round_table.c["transform_version"]))
+
+        return {round_id: (stats, transform_version) for round_id, stats, transform_version in result}
+
+
+def test_reprocess_rebuilds_missing_and_stale_rounds(loader, make_rounds):
+    transformer = TransformData()
+    loader.db_upload_metadata(transformer.prep_metadata([synthetic_metadata(round_id) for round_id in range(1, 13)]))
+    # rounds 11 and 12 never landed raw payloads, so there's nothing to rebuild them from
+    _land(loader, list(range(1, 11)))
+
+    stale_list = make_rounds([2])
+    stale_list[0]["transform_version"] = TRANSFORM_VERSION - 1
+    stale_list[0]["content_hash"] = None
+    loader.db_upload_rounds(stale_list)
+
+    assert RoundReprocessor(transformer, loader, batch_size=4).run() == 10
+
+    stored = _stored_rounds(loader)
+    assert sorted(stored) == list(range(1, 11))
+    assert {transform_version for _, transform_version in stored.values()} == {TRANSFORM_VERSION}
+    assert stored[2][0] == make_rounds([2])[0]["stats"]
+
+    # every round is current now
+    assert RoundReprocessor(transformer, loader, batch_size=4).run() == 0
+
+
+def test_forced_reprocess_applies_a_new_projection_to_a_range(loader):
+    loader.db_upload_metadata(TransformData().prep_metadata([synthetic_metadata(round_id) for round_id in range(1, 11)]))
+    _land(loader, list(range(1, 11)))
+
+    assert RoundReprocessor(TransformData(), loader, batch_size=4).run() == 10
+    # unchanged output is skipped by the content hash even when forced
+    assert RoundReprocessor(TransformData(), loader, batch_size=4, force=True).run() == 0
+
+    projected = TransformData(keys=["tally_*"])
+
+    assert RoundReprocessor(projected, loader, start_round_id=3, end_round_id=5, force=True).run() == 3
+
+    stored = _stored_rounds(loader)
+    assert all(set(stored[round_id][0]) == {"tally_0", "tally_5"} for round_id in (3, 4, 5))
+    assert "amount_4" in stored[2][0] and "amount_4" in stored[6][0]
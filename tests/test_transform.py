@@ -0,0 +1,124 @@
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pytest
+
+from benchmarks.mock_api import synthetic_blackbox, synthetic_playercounts
+from para_stats.exceptions import BlackboxDecodeError
+from para_stats.transform import TransformData
+
+
+def test_compact_playercounts_round_trip():
+    playercounts = synthetic_playercounts(42)
+
+    start, interval, deltas = TransformData.compact_playercounts(playercounts)
+    timestamps, counts = TransformData.expand_playercounts(start, interval, deltas)
+
+    assert interval == 60
+    assert len(deltas) == 2 * len(playercounts)
+    # naive API timestamps are UTC, as are the expanded datetime64 ones
+    assert timestamps.tolist() == [datetime.fromisoformat(timestamp) for timestamp in playercounts]
+    assert counts.dtype == np.int32
+    assert counts.tolist() == list(playercounts.values())
+
+
+def test_compact_playercounts_keeps_timezone():
+    start = datetime(2024, 1, 1, 12, tzinfo=timezone(timedelta(hours=2)))
+    playercounts = {(start + timedelta(seconds=30 * i)).isoformat(): 10 + i for i in range(3)}
+
+    compacted = TransformData.compact_playercounts(playercounts)
+    timestamps, counts = TransformData.expand_playercounts(*compacted)
+
+    assert compacted[0] == start
+    assert timestamps[0] == np.datetime64("2024-01-01T10:00:00")
+    assert counts.tolist() == [10, 11, 12]
+
+
+@pytest.mark.parametrize(
+    "playercounts",
+    [
+        None,
+        {},
+        {"2024-01-01T00:00:00": 1, "2024-01-01T00:01:00": 2, "2024-01-01T00:03:00": 3},
+        {"2024-01-01T00:00:00": 1, "2024-01-01T00:01:00": 2.5},
+        {"2024-01-01T00:00:00": 0, "2024-01-01T00:01:00": 40000},
+        {"not a timestamp": 1},
+    ],
+    ids=["none", "empty", "uneven", "fractional", "overflow", "unparseable"],
+)
+def test_compact_playercounts_rejects_series_that_dont_fit(playercounts):
+    assert TransformData.compact_playercounts(playercounts) is None
+
+
+def test_content_hash_is_stable():
+    row = {
+        "round_id": 1,
+        "start_datetime": datetime(2024, 1, 1, 12, tzinfo=timezone.utc),
+        "stats": {"a": 1, "b": [1, 2]},
+        "playercount_deltas": b"\x01\x00",
+    }
+    reordered = {
+        "playercount_deltas": memoryview(b"\x01\x00"),
+        "stats": {"b": [1, 2], "a": 1},
+        "start_datetime": datetime(2024, 1, 1, 14, tzinfo=timezone(timedelta(hours=2))),
+        "round_id": 1,
+        "content_hash": "ignored",
+    }
+
+    digest = TransformData.content_hash(row)
+
+    assert len(digest) == 32
+    assert TransformData.content_hash(reordered) == digest
+    assert TransformData.content_hash({**row, "stats": {"a": 2, "b": [1, 2]}}) != digest
+
+
+def test_content_hash_rejects_unknown_types():
+    with pytest.raises(TypeError):
+        TransformData.content_hash({"round_id": 1, "stats": object()})
+
+
+def test_key_projection_keeps_matching_keys():
+    blackbox = synthetic_blackbox(7, num_keys=10)
+    blackbox.append({"key_name": "broken", "key_type": "tally", "version": 1, "raw_data": "{not json"})
+
+    cleaned = TransformData(keys=["tally_*"]).clean_blackbox_response(blackbox)
+
+    # the malformed key is dropped without being decoded
+    assert set(cleaned) == {"tally_0", "tally_5"}
+
+    with pytest.raises(BlackboxDecodeError):
+        TransformData().clean_blackbox_response(blackbox)
+
+
+def test_key_projection_excludes_keys():
+    blackbox = synthetic_blackbox(7, num_keys=10)
+    full = TransformData().clean_blackbox_response(blackbox)
+
+    cleaned = TransformData(exclude_keys=["text_*", "RND *"]).clean_blackbox_response(blackbox)
+
+    assert set(cleaned) == {key for key in full if not key.startswith(("text_", "RND "))}
+    assert cleaned == {key: full[key] for key in cleaned}
+
+
+def test_key_rules_keep_their_key_and_project_fields():
+    blackbox = synthetic_blackbox(7, num_keys=10)
+    full = TransformData().clean_blackbox_response(blackbox)
+
+    transformer = TransformData(
+        keys=["amount_*"],
+        exclude_keys=["amount_9"],
+        key_rules={"tally_0": ["item_0", "missing"], "associative_2": ["name"]},
+    )
+    cleaned = transformer.clean_blackbox_response(blackbox)
+
+    assert set(cleaned) == {"amount_4", "tally_0", "associative_2"}
+    assert cleaned["amount_4"] == full["amount_4"]
+    assert cleaned["tally_0"] == {"item_0": full["tally_0"]["item_0"]}
+
+    associative = full["associative_2"]
+    rows = associative if isinstance(associative, list) else [associative]
+    assert cleaned["associative_2"] == (
+        [{"name": row["name"]} for row in rows] if isinstance(associative, list) else {"name": rows[0]["name"]}
+    )
+    assert transformer._key_projection("amount_9") == (False, None)
+    assert transformer._key_projection("tally_0") == (True, ["item_0", "missing"])